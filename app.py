@@ -5,6 +5,8 @@ import logging
 import logging.config
 import json
 import os
+import queue
+import time
 from PIL import Image, ImageTk
 
 # --- Setup Logging ---
@@ -35,7 +37,10 @@ try:
     from ui.my_companies import MyCompaniesPanel  # Placeholder Stage 4
     from ui.license_info import LicenseInfoPanel  # Placeholder Stage 4
     # Utilities
-    from utils.database import init_db # Keep DB init
+    from utils.database import init_db, close_all_db_connections, set_db_pragma_profile, start_db_writer, stop_db_writer, flush_audit_log # Keep DB init
+    from utils.helpers import load_settings
+    from utils.sync_scheduler import SyncScheduler
+    from utils.retry import circuit_breakers, CircuitBreaker
     # from utils.helpers import BASE_DIR # Not strictly needed here anymore
 except ImportError as e: logger.critical(f"Import fail: {e}", exc_info=True); messagebox.showerror("Import Error", f"Critical component failed:\n{e}\nApp cannot start."); import sys; sys.exit(1)
 
@@ -46,7 +51,7 @@ class TallyPrimeConnectApp:
         """Initialize the application UI and components."""
         logger.info("Initializing TallyPrimeConnectApp (Stage 4 Update)")
         self.root = root; self.root.title("Biz Analyst"); self.root.geometry(f"{APP_WIDTH}x{APP_HEIGHT}"); self.root.configure(bg=WINDOW_BG)
-        try: init_db() # Initialize DB early
+        try: set_db_pragma_profile(load_settings().get("db_pragma_profile", "tuned")); init_db(); start_db_writer() # Initialize DB early
         except Exception as e: logger.exception("DB Init Error."); messagebox.showerror("DB Error", f"Failed DB init: {e}"); self.root.destroy(); return
         self.logo_image = self._load_logo(); self.panels = {} # Panel dictionary
         # Create UI structure
@@ -57,6 +62,8 @@ class TallyPrimeConnectApp:
         self._instantiate_panels()
         # Show the default panel
         self.show_panel("Settings")
+        self._start_sync_scheduler()
+        self._open_circuits = []; self._schedule_circuit_check()
         logger.info("Application initialized successfully.")
 
     def _load_logo(self, size=(24, 24)) -> ImageTk.PhotoImage | None:
@@ -230,12 +237,64 @@ class TallyPrimeConnectApp:
              logger.debug(f"No refresh method defined or needed for panel {panel_identifier}")
 
 
+    # --- Background Auto Sync ---
+    def _start_sync_scheduler(self):
+        """Starts the background sync scheduler when auto sync is on (auto_sync_minutes in settings)."""
+        self.scheduler = None; self.scheduler_events = queue.Queue()
+        companies_panel = self.panels.get("MyCompanies")
+        try: self.scheduler = SyncScheduler.from_settings(on_event=self.scheduler_events.put, is_blocked=lambda: bool(getattr(companies_panel, 'is_syncing', False)))
+        except Exception as e: logger.exception(f"Failed to create sync scheduler: {e}"); return
+        if not self.scheduler: logger.info("Auto sync is off (auto_sync_minutes = 0)."); return
+        if companies_panel: companies_panel.scheduler = self.scheduler # Manual syncs wait for scheduled ones, and vice versa
+        self.scheduler.start(); self._schedule_scheduler_check()
+
+    def _schedule_scheduler_check(self):
+        try:
+            if self.root.winfo_exists(): self.root.after(500, self._process_scheduler_events)
+        except tk.TclError: logger.info("Root destroyed, stopping auto sync checks.")
+
+    def _process_scheduler_events(self):
+        """Shows scheduled sync results in the status bar (and refreshes the company list if shown)."""
+        try:
+            while True:
+                event = self.scheduler_events.get_nowait(); name = event.get('company_name')
+                if event.get("type") == "scheduled_sync_started": message = f"Auto sync: {name}..."
+                elif event.get("type") == "scheduled_sync":
+                    message = f"Auto sync: {name} {event.get('status', '').lower()} at {time.strftime('%H:%M')}"
+                    panel = self.panels.get("MyCompanies")
+                    if panel and panel.winfo_ismapped() and not panel.is_syncing: panel.refresh_list()
+                else: continue
+                if self.status_bar and hasattr(self.status_bar, 'update_auto_sync_status'): self.status_bar.update_auto_sync_status(message)
+        except queue.Empty: pass
+        except Exception as e: logger.exception(f"Error processing auto sync events: {e}")
+        finally: self._schedule_scheduler_check()
+
+    # --- Tally Circuit Breakers ---
+    def _schedule_circuit_check(self):
+        try:
+            if self.root.winfo_exists(): self.root.after(1000, self._check_circuits)
+        except tk.TclError: logger.info("Root destroyed, stopping circuit checks.")
+
+    def _check_circuits(self):
+        """Mirrors the Tally circuit breakers (utils.retry) in the status bar when their state changes."""
+        try:
+            open_circuits = sorted(b.name for b in circuit_breakers() if b.state != CircuitBreaker.CLOSED)
+            if open_circuits != self._open_circuits:
+                self._open_circuits = open_circuits
+                if self.status_bar and hasattr(self.status_bar, 'update_circuit_status'): self.status_bar.update_circuit_status(open_circuits)
+        except Exception as e: logger.exception(f"Error checking circuit breakers: {e}")
+        finally: self._schedule_circuit_check()
+
     def run(self):
         """Starts the Tkinter main event loop."""
         logger.info("Starting application main loop")
         try: self.root.mainloop()
         except Exception as e: logger.critical(f"Unhandled exception in mainloop: {e}", exc_info=True)
-        finally: logger.info("Application closed")
+        finally:
+            if getattr(self, 'scheduler', None) and not self.scheduler.stop(timeout=5.0):
+                # A running sync still needs the DB writer and its connections; let it finish first
+                logger.info("Waiting for running syncs to finish before closing the database..."); self.scheduler.stop(timeout=None)
+            flush_audit_log(); stop_db_writer(); close_all_db_connections(); logger.info("Application closed")
 
 # --- Main Execution ---
 if __name__ == "__main__":
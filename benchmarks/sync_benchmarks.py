@@ -0,0 +1,259 @@
+"""
+Sync benchmarks for TallyPrimeConnect.
+Measures ODBC row conversion, bulk saves, query overhead, company listing, a full master
+sync and an unchanged re-sync through the CLI (which must be skipped by the change probe) against the fake Tally ODBC driver (utils/fake_tally_odbc.py) and a throwaway database.
+Each case runs in its own process so its wall time and peak RSS are not skewed by the others.
+
+Usage (from the project root):
+    python benchmarks/sync_benchmarks.py                          # Run every case, print a report
+    python benchmarks/sync_benchmarks.py --quick                  # Skip the largest sizes
+    python benchmarks/sync_benchmarks.py --case save              # Only cases whose name contains "save"
+    python benchmarks/sync_benchmarks.py --save-baseline benchmarks/baseline.json
+    python benchmarks/sync_benchmarks.py --baseline benchmarks/baseline.json   # Exit 1 on regression
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import platform
+import subprocess
+import tempfile
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+try:
+    import resource  # Not available on Windows: peak RSS is then reported as None
+except ImportError:
+    resource = None
+
+BENCH_COMPANY_NAME = "Benchmark Company"
+BENCH_COMPANY_NUMBER = "BENCH-1"
+DEFAULT_TOLERANCE = 0.20  # Allowed drop in rows/sec against the baseline before it counts as a regression
+
+# --- Environment ---
+def _setup_environment(db_dir, fake_rows):
+    """Points the app at the fake ODBC driver and a throwaway database. Call before importing app modules."""
+    os.environ["TALLY_ODBC_DRIVER"] = "fake"
+    os.environ["TALLY_FAKE_ROWS"] = str(fake_rows)
+    os.environ["TALLY_FAKE_COMPANY"] = BENCH_COMPANY_NAME
+    logging.basicConfig(level=logging.WARNING)
+    from utils.database import core
+    core.DATABASE_DIR = db_dir
+    core.DATABASE_PATH = os.path.join(db_dir, "benchmark.db")
+    import utils.database as db
+    db.init_db()
+    db.add_company_to_db(BENCH_COMPANY_NAME, BENCH_COMPANY_NUMBER)
+    return db
+
+def _peak_rss_kb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak  # macOS reports bytes, Linux KiB
+
+# --- Cases ---
+# Each returns (rows, seconds): the work done and the wall time of the measured part only.
+def bench_fetch_conversion(db, rows, as_tuples):
+    """_fetch_odbc_data over `rows` ledgers: fake cursor reads plus row conversion."""
+    from utils import odbc_helper
+    columns = db.MASTER_COLUMNS["tally_ledgers"] if as_tuples else None
+    start = time.perf_counter()
+    fetched = 0
+    for chunk in odbc_helper.fetch_ledgers_odbc(chunk_size=odbc_helper.ODBC_FETCH_CHUNK_SIZE, columns=columns):
+        fetched += len(chunk)
+    return fetched, time.perf_counter() - start
+
+def bench_save_masters_bulk(db, rows, resave):
+    """save_masters_bulk of `rows` ledgers in sync-sized chunks within one unit of work.
+
+    With resave, the rows are saved once untimed and the timed pass hits the unchanged-row path.
+    """
+    from utils import odbc_helper
+    columns = db.MASTER_COLUMNS["tally_ledgers"]
+
+    def chunks():
+        return odbc_helper.fetch_ledgers_odbc(chunk_size=odbc_helper.ODBC_FETCH_CHUNK_SIZE, columns=columns)
+
+    if resave:
+        with db.transaction():
+            for chunk in chunks():
+                db.save_ledgers(chunk, BENCH_COMPANY_NUMBER)
+    elapsed = 0.0
+    saved = 0
+    with db.transaction():
+        for chunk in chunks():
+            start = time.perf_counter()
+            saved += db.save_ledgers(chunk, BENCH_COMPANY_NUMBER).processed
+            elapsed += time.perf_counter() - start
+    return saved, elapsed
+
+def bench_execute_query(db, rows, commit):
+    """`rows` single-statement execute_query calls: SELECTs, or committed INSERTs."""
+    if commit:
+        sql, params = "INSERT INTO company_log (tally_company_number, action, details) VALUES (?, ?, ?)", (BENCH_COMPANY_NUMBER, "BENCH", "")
+    else:
+        sql, params = "SELECT id FROM companies WHERE tally_company_number = ?", (BENCH_COMPANY_NUMBER,)
+    start = time.perf_counter()
+    for _ in range(rows):
+        db.execute_query(sql, params, fetch_one=not commit, commit=commit)
+    return rows, time.perf_counter() - start
+
+def bench_get_added_companies(db, rows, companies):
+    """`rows` get_added_companies() calls with `companies` companies in the database."""
+    with db.transaction():
+        for i in range(companies):
+            db.add_company_to_db(f"Company {i:05d}", f"CMP-{i:05d}")
+    start = time.perf_counter()
+    for _ in range(rows):
+        db.get_added_companies()
+    return rows, time.perf_counter() - start
+
+def bench_full_sync(db, rows):
+    """Full (non-incremental) fetch_and_save_master_data of every master, `rows` per collection."""
+    from utils.sync_engine import fetch_and_save_master_data
+    start = time.perf_counter()
+    with db.transaction():
+        fetch_and_save_master_data(BENCH_COMPANY_NUMBER, BENCH_COMPANY_NAME, incremental=False)
+    elapsed = time.perf_counter() - start
+    saved = sum(db.execute_query(f"SELECT COUNT(*) FROM {table}", fetch_one=True)[0] for table in db.MASTER_COLUMNS)
+    return saved, elapsed
+
+def bench_cli_resync_unchanged(db, rows):
+    """Second `sync_cli --all` run of an unchanged company, with the change probe on.
+
+    Also a check: raises unless that run reports its masters unchanged and fetches nothing.
+    """
+    import io
+    from contextlib import redirect_stdout
+    from utils.sync_cli import main as sync_cli_main
+    argv = ["--all", "--incremental", "--no-vouchers"]
+    with redirect_stdout(io.StringIO()):
+        sync_cli_main(argv)  # First sync: fetches every master and records the probe baseline
+    output = io.StringIO()
+    start = time.perf_counter()
+    with redirect_stdout(output):
+        sync_cli_main(argv)
+    elapsed = time.perf_counter() - start
+    company = json.loads(output.getvalue())["companies"][0]
+    probe = company.get("probe") or {}
+    fetched = sum(m["fetched"] for m in company["masters"].values())
+    if not str(probe.get("reason")).startswith("masters unchanged") or fetched:
+        raise RuntimeError(f"Change probe did not skip the unchanged company: {probe.get('reason')!r}, {fetched} rows fetched")
+    saved = sum(db.execute_query(f"SELECT COUNT(*) FROM {table}", fetch_one=True)[0] for table in db.MASTER_COLUMNS)
+    return saved, elapsed
+
+# name -> (function, kwargs, rows, fake rows per collection, included in --quick)
+CASES = {}
+
+def _case(name, func, rows, fake_rows=None, quick=True, **kwargs):
+    CASES[name] = (func, kwargs, rows, fake_rows if fake_rows is not None else rows, quick)
+
+_case("fetch_dicts[100000]", bench_fetch_conversion, 100_000, as_tuples=False)
+_case("fetch_tuples[100000]", bench_fetch_conversion, 100_000, as_tuples=True)
+for _rows in (1_000, 10_000, 100_000, 1_000_000):
+    _case(f"save_masters_bulk[{_rows}]", bench_save_masters_bulk, _rows, quick=_rows < 1_000_000, resave=False)
+_case("save_masters_bulk_unchanged[100000]", bench_save_masters_bulk, 100_000, resave=True)
+_case("execute_query_select[20000]", bench_execute_query, 20_000, commit=False)
+_case("execute_query_commit[2000]", bench_execute_query, 2_000, commit=True)
+_case("get_added_companies[500 companies]", bench_get_added_companies, 200, companies=500)
+_case("full_sync[10000 per master]", bench_full_sync, 10_000, quick=False)
+_case("full_sync[1000 per master]", bench_full_sync, 1_000)
+_case("cli_resync_unchanged[1000 per master]", bench_cli_resync_unchanged, 1_000)
+
+def run_case(name):
+    """Runs one case in this process and returns its result dict."""
+    func, kwargs, rows, fake_rows, _ = CASES[name]
+    with tempfile.TemporaryDirectory(prefix="tpc_bench_") as db_dir:
+        db = _setup_environment(db_dir, fake_rows)
+        try:
+            done, seconds = func(db, rows, **kwargs)
+        finally:
+            db.close_all_db_connections()
+    return {
+        "name": name,
+        "rows": done,
+        "seconds": round(seconds, 4),
+        "rows_per_sec": round(done / seconds, 1) if seconds > 0 else None,
+        "peak_rss_kb": _peak_rss_kb(),
+    }
+
+def run_case_isolated(name):
+    """Runs one case in a fresh interpreter; returns its result dict (or an error entry)."""
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-case", name],
+                          capture_output=True, text=True, cwd=BASE_DIR)
+    if proc.returncode != 0:
+        return {"name": name, "error": (proc.stderr.strip().splitlines() or ["unknown error"])[-1]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+# --- Reporting ---
+def print_report(results, baseline=None, tolerance=DEFAULT_TOLERANCE):
+    """Prints the results table and returns the names of cases slower than the baseline allows."""
+    base = {r["name"]: r for r in (baseline or {}).get("results", []) if "rows_per_sec" in r}
+    regressions = []
+    print(f"{'case':<40} {'rows':>10} {'seconds':>9} {'rows/sec':>12} {'peak RSS MB':>12} {'vs base':>8}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['name']:<40} ERROR: {r['error']}")
+            continue
+        rss = f"{r['peak_rss_kb'] / 1024:.1f}" if r.get("peak_rss_kb") else "n/a"
+        ratio = ""
+        prev = base.get(r["name"])
+        if prev and prev.get("rows_per_sec") and r.get("rows_per_sec"):
+            change = r["rows_per_sec"] / prev["rows_per_sec"]
+            ratio = f"{change:.2f}x"
+            if change < 1 - tolerance:
+                regressions.append(r["name"])
+                ratio += " !"
+        print(f"{r['name']:<40} {r['rows']:>10} {r['seconds']:>9.3f} {r['rows_per_sec'] or 0:>12,.0f} {rss:>12} {ratio:>8}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="TallyPrimeConnect sync benchmarks")
+    parser.add_argument("--quick", action="store_true", help="skip the largest cases")
+    parser.add_argument("--case", help="only run cases whose name contains this text")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write the results as the new JSON baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against this JSON baseline; exit 1 on regression")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"allowed rows/sec drop vs the baseline (default {DEFAULT_TOLERANCE})")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)  # Internal: child process entry point
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case)))
+        return 0
+
+    names = [name for name, (_, _, _, _, quick) in CASES.items()
+             if (quick or not args.quick) and (not args.case or args.case in name)]
+    results = []
+    for name in names:
+        print(f"Running {name}...", file=sys.stderr)
+        results.append(run_case_isolated(name))
+
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    regressions = print_report(results, baseline, args.tolerance)
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {path}", file=sys.stderr)
+    if regressions:
+        print(f"Regressions (> {args.tolerance:.0%} slower than baseline): {', '.join(regressions)}", file=sys.stderr)
+        return 1
+    return 1 if any("error" in r for r in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -7,7 +7,7 @@ import queue # Keep for potential future use
 
 # --- Import necessary helpers AND DEFAULTS ---
 from utils.helpers import load_settings, get_tally_companies, DEFAULT_SETTINGS
-from utils.database import add_company_to_db, get_added_companies
+from utils.database import add_company_to_db, get_added_companies, close_db_connection
 
 logger = logging.getLogger(__name__)
 
@@ -104,6 +104,7 @@ class AddCompanyPanel(tk.Frame):
             logger.exception("Error during company fetch/filter process.")
             error_message = f"An unexpected error occurred:\n{e}"
         finally:
+            close_db_connection() # Short-lived worker: don't leave its persistent connection open
             self.is_loading = False # Reset loading flag regardless of outcome
 
         # Schedule UI update back in the main thread safely
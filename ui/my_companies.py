@@ -9,11 +9,9 @@ import time # Optional for delay
 # --- Local Imports ---
 from utils.database import (
     get_added_companies, get_company_details, edit_company_in_db,
-    soft_delete_company, update_company_details, update_company_sync_status,
-    log_change
+    soft_delete_company, close_db_connection
 )
-from utils.odbc_helper import fetch_company_details_odbc
-# from utils.helpers import load_settings
+from utils.sync_engine import sync_companies
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +24,7 @@ class MyCompaniesPanel(tk.Frame):
     def __init__(self, parent, status_bar_ref=None, *args, **kwargs):
         super().__init__(parent, bg=PANEL_BG, *args, **kwargs)
         self.status_bar = status_bar_ref; self.sync_queue = queue.Queue(); self.is_syncing = False
+        self.scheduler = None # Background SyncScheduler (set by the app when auto sync is on)
         self._create_widgets(); self._schedule_queue_check(); logger.debug("MyCompaniesPanel initialized (ODBC).")
 
     def _schedule_queue_check(self):
@@ -148,9 +147,13 @@ class MyCompaniesPanel(tk.Frame):
 
 
     # --- Asynchronous Syncing Logic (ODBC Per-Company) ---
+    def _sync_busy(self) -> bool:
+        """True while a manual or scheduled sync is running."""
+        return self.is_syncing or bool(self.scheduler and self.scheduler.active_syncs())
+
     def _start_single_company_sync(self, company_number: str, company_name: str):
         """Initiates sync for a single company via ODBC after user confirmation."""
-        if self.is_syncing: logger.warning("Sync busy."); messagebox.showwarning("Sync Busy", "Sync running."); return
+        if self._sync_busy(): logger.warning("Sync busy."); messagebox.showwarning("Sync Busy", "Sync running."); return
         if not company_number or not company_name: logger.error("Cannot sync: Missing info."); return
         logger.info(f"Requesting confirm sync: {company_name} ({company_number})")
         msg = f"Ensure company:\n'{company_name}'\nis loaded in Tally Prime.\n\nClick OK to sync details."
@@ -169,87 +172,18 @@ class MyCompaniesPanel(tk.Frame):
         # Consider disabling buttons here
 
     def _sync_worker_odbc(self, companies: list):
-        """Background worker using ODBC fetch (processes list, usually 1 item)."""
-        total_companies = len(companies)
-        logger.info(f"ODBC Sync worker started for {total_companies} companies.")
-    
-        for i, company in enumerate(companies):
-            num = company.get('tally_company_number')
-            name = company.get('tally_company_name')
-            if not num or not name:
-                logger.warning(f"Skipping in ODBC sync: {company}")
-                continue
-
-            logger.info(f"Processing {i+1}/{total_companies}: {name} ({num})")
-            self.sync_queue.put({"type": "progress", "current": i + 1, "total": total_companies, "message": f"Syncing: {name}..."})
-
-            try:
-            # Fetch company details
-                logger.debug(f"Calling ODBC fetch for company details. Ensure '{name}' is loaded.")
-                details = fetch_company_details_odbc(num)
-                success = False
-
-                if details:
-                    fetched_name = details.get('tally_company_name')
-                    if fetched_name and fetched_name.lower() != name.lower():
-                        logger.error(f"ODBC Mismatch! Expected '{name}', got '{fetched_name}'.")
-                        update_company_sync_status(num, 'Sync Failed')
-                        log_change(num, "SYNC_FAIL", f"Mismatch: Got '{fetched_name}'")
-                        self.sync_queue.put({"type": "error", "message": f"Sync Failed: Wrong company ('{fetched_name}') active in Tally."})
-                    else:
-                        success = update_company_details(num, details)
-                        if not success:
-                            log_change(num, "SYNC_FAIL", "DB update failed after ODBC fetch")
-            
-            # Fetch additional data (e.g., ledgers, stock items, etc.)
-                if success:
-                    logger.info(f"Fetching additional data for {name} ({num})...")
-                
-                # Fetch ledgers
-                    ledgers = fetch_ledgers_odbc()
-                    if ledgers:
-                        logger.info(f"Fetched {len(ledgers)} ledgers for {name}.")
-                        save_ledgers(ledgers)
-                    else:
-                        logger.warning(f"No ledgers fetched for {name}.")
-
-                # Fetch stock items
-                    stock_items = fetch_stock_items_odbc()
-                    if stock_items:
-                        logger.info(f"Fetched {len(stock_items)} stock items for {name}.")
-                        save_stock_items(stock_items)
-                    else:
-                        logger.warning(f"No stock items fetched for {name}.")
-
-                # Fetch stock groups
-                    stock_groups = fetch_stock_groups_odbc()
-                    if stock_groups:
-                        logger.info(f"Fetched {len(stock_groups)} stock groups for {name}.")
-                        save_stock_groups(stock_groups)
-                    else:
-                        logger.warning(f"No stock groups fetched for {name}.")
-
-                # Add more fetch/save calls as needed (e.g., cost centers, vouchers, etc.)
-            
-                else:
-                    logger.warning(f"ODBC fetch failed/no data for {num}.")
-                    update_company_sync_status(num, 'Sync Failed')
-                    self.sync_queue.put({"type": "error", "message": f"Sync Failed: Could not fetch ODBC details.\n(Tally running? Company open?)"})
-
-                logger.info(f"Sync result {num} (ODBC): {'Success' if success else 'Failed'}")
-        
-            except Exception as e:
-                logger.exception(f"Error syncing {name} via ODBC: {e}")
-                try:
-                    update_company_sync_status(num, 'Sync Failed')
-                    log_change(num, "SYNC_FAIL", f"Error: {e}")
-                except Exception as ie:
-                    logger.error(f"Failed to mark {num} as failed: {ie}")
-                self.sync_queue.put({"type": "error", "message": f"Error syncing {name}:\n{e}"})
-
-        self.sync_queue.put({"type": "finished"})
+        """Background worker: runs the sync engine, relaying its progress/errors to the UI queue."""
+        logger.info(f"ODBC Sync worker started for {len(companies)} companies.")
+        try:
+            sync_companies(companies, on_event=self.sync_queue.put)
+        except Exception as e:
+            logger.exception(f"ODBC Sync worker failed: {e}")
+            self.sync_queue.put({"type": "error", "message": f"Sync failed:\n{e}"})
+        finally:
+            close_db_connection() # Release this worker thread's persistent DB connection
+            self.sync_queue.put({"type": "finished"})
         logger.info("ODBC Sync worker finished.")
-     
+
         # --- Queue Processing and UI Reset ---
     def _process_sync_queue(self):
         """Checks the queue for messages from the worker thread and updates the UI."""
@@ -277,7 +211,7 @@ class MyCompaniesPanel(tk.Frame):
     
     def _start_all_companies_sync(self):
         """Initiates sync for all companies."""
-        if self.is_syncing:
+        if self._sync_busy():
             logger.warning("Sync busy.")
             messagebox.showwarning("Sync Busy", "Sync running.")
             return
@@ -296,132 +230,3 @@ class MyCompaniesPanel(tk.Frame):
         except Exception as e:
             logger.exception("Error starting sync for all companies.")
             messagebox.showerror("Error", f"Failed to start sync: {e}")
-
-from utils.odbc_helper import (
-    fetch_ledgers_odbc, fetch_stock_items_odbc, fetch_stock_groups_odbc,
-    fetch_units_odbc, fetch_accounting_groups_odbc, fetch_ledgerbillwise_odbc,
-    fetch_costcategory_odbc, fetch_costcenter_odbc, fetch_currency_odbc,
-    fetch_vouchertype_odbc, fetch_stockgroupwithgst_odbc, fetch_stockcategory_odbc,
-    fetch_godown_odbc, fetch_stockitem_gst_odbc, fetch_stockitem_mrp_odbc,
-    fetch_stockitem_bom_odbc, fetch_stockitem_standardcost_odbc,
-    fetch_stockitem_standardprice_odbc, fetch_stockitem_batchdetails_odbc
-)
-from utils.database import (
-    save_ledgers, save_stock_items, save_stock_groups, save_units,
-    save_accounting_groups, save_ledgerbillwise, save_costcategory,
-    save_costcenter, save_currency, save_vouchertype,
-    save_stockgroupwithgst, save_stockcategory, save_godown,
-    save_stockitem_gst, save_stockitem_mrp, save_stockitem_bom,
-    save_stockitem_standardcost, save_stockitem_standardprice,
-    save_stockitem_batchdetails
-)
-
-# Inside the MyCompaniesPanel class
-
-def _start_single_company_sync(self, company_number: str, company_name: str):
-    """Initiates sync for a single company via ODBC after user confirmation."""
-    if self.is_syncing:
-        logger.warning("Sync busy.")
-        messagebox.showwarning("Sync Busy", "Sync running.")
-        return
-
-    if not company_number or not company_name:
-        logger.error("Cannot sync: Missing info.")
-        return
-
-    logger.info(f"Requesting confirm sync: {company_name} ({company_number})")
-    msg = f"Ensure company:\n'{company_name}'\nis loaded in Tally Prime.\n\nClick OK to sync details."
-    if messagebox.askokcancel("Confirm Tally Company", msg, icon='info'):
-        logger.info(f"User confirmed. Starting ODBC sync for {company_number}")
-        self.is_syncing = True
-        self._update_sync_ui_start(company_name)
-
-        # Define the sync logic in a background thread
-        sync_thread = threading.Thread(
-            target=self._sync_company_data,
-            args=(company_number, company_name),
-            daemon=True
-        )
-        sync_thread.start()
-    else:
-        logger.info(f"User cancelled sync for {company_number}.")
-
-def _sync_company_data(self, company_number: str, company_name: str):
-    """Handles the synchronization of company data."""
-    try:
-        # Fetch company details
-        logger.info(f"Fetching details for company: {company_name} ({company_number})")
-        details = fetch_company_details_odbc(company_number)
-        if not details:
-            logger.error(f"Failed to fetch details for company: {company_name}")
-            update_company_sync_status(company_number, 'Sync Failed')
-            return
-
-        # Update company details in the database
-        success = update_company_details(company_number, details)
-        if not success:
-            logger.error(f"Failed to update company details for {company_name}")
-            update_company_sync_status(company_number, 'Sync Failed')
-            return
-
-        # Fetch and save additional master data
-        self._fetch_and_save_master_data(company_name)
-
-        # Mark sync as successful
-        update_company_sync_status(company_number, 'Synced')
-        logger.info(f"Sync completed successfully for {company_name}")
-        messagebox.showinfo("Sync Complete", f"Sync completed successfully for {company_name}")
-
-    except Exception as e:
-        logger.exception(f"Error syncing company {company_name}: {e}")
-        update_company_sync_status(company_number, 'Sync Failed')
-        messagebox.showerror("Sync Error", f"An error occurred while syncing {company_name}:\n{e}")
-
-    finally:
-        self.is_syncing = False
-        self.refresh_list()
-
-def _fetch_and_save_master_data(self, company_name: str):
-    """Fetches and saves master data for the company."""
-    logger.info(f"Fetching additional data for {company_name}...")
-
-    # Define the master data to sync
-    masters_to_sync = [
-        {'name': 'Ledgers', 'fetch': fetch_ledgers_odbc, 'save': save_ledgers},
-        {'name': 'Stock Items', 'fetch': fetch_stock_items_odbc, 'save': save_stock_items},
-        {'name': 'Stock Groups', 'fetch': fetch_stock_groups_odbc, 'save': save_stock_groups},
-        {'name': 'Units', 'fetch': fetch_units_odbc, 'save': save_units},
-        {'name': 'Accounting Groups', 'fetch': fetch_accounting_groups_odbc, 'save': save_accounting_groups},
-        {'name': 'Ledger Billwise', 'fetch': fetch_ledgerbillwise_odbc, 'save': save_ledgerbillwise},
-        {'name': 'Cost Categories', 'fetch': fetch_costcategory_odbc, 'save': save_costcategory},
-        {'name': 'Cost Centers', 'fetch': fetch_costcenter_odbc, 'save': save_costcenter},
-        {'name': 'Currencies', 'fetch': fetch_currency_odbc, 'save': save_currency},
-        {'name': 'Voucher Types', 'fetch': fetch_vouchertype_odbc, 'save': save_vouchertype},
-        {'name': 'Stock Groups GST', 'fetch': fetch_stockgroupwithgst_odbc, 'save': save_stockgroupwithgst},
-        {'name': 'Stock Categories', 'fetch': fetch_stockcategory_odbc, 'save': save_stockcategory},
-        {'name': 'Godowns', 'fetch': fetch_godown_odbc, 'save': save_godown},
-        {'name': 'Stock Item GST', 'fetch': fetch_stockitem_gst_odbc, 'save': save_stockitem_gst},
-        {'name': 'Stock Item MRP', 'fetch': fetch_stockitem_mrp_odbc, 'save': save_stockitem_mrp},
-        {'name': 'Stock Item BOM', 'fetch': fetch_stockitem_bom_odbc, 'save': save_stockitem_bom},
-        {'name': 'Stock Item Cost', 'fetch': fetch_stockitem_standardcost_odbc, 'save': save_stockitem_standardcost},
-        {'name': 'Stock Item Price', 'fetch': fetch_stockitem_standardprice_odbc, 'save': save_stockitem_standardprice},
-        {'name': 'Stock Item Batch', 'fetch': fetch_stockitem_batchdetails_odbc, 'save': save_stockitem_batchdetails},
-    ]
-
-    # Process each master type
-    for master in masters_to_sync:
-        name = master['name']
-        fetch_func = master['fetch']
-        save_func = master['save']
-
-        try:
-            logger.info(f"Fetching {name}...")
-            data = fetch_func()
-            if data:
-                logger.info(f"Fetched {len(data)} records for {name}. Saving to database...")
-                save_func(data)
-            else:
-                logger.warning(f"No data found for {name}.")
-        except Exception as e:
-            logger.exception(f"Error syncing {name}: {e}")
-
@@ -97,6 +97,14 @@ class StatusBar(tk.Frame):
             if self.winfo_exists(): self.update_idletasks()
         except tk.TclError as e: logger.warning(f"Error updating tally status: {e}")
 
+    def update_circuit_status(self, open_circuits: list[str]):
+        """Shows whether calls to Tally are paused by open circuit breakers (names in open_circuits)."""
+        if not open_circuits: self.update_tally_status(connected=True); return # A circuit only closes when Tally answers
+        self.update_tally_status(connected=False)
+        try:
+            if hasattr(self, 'tally_status_label') and self.tally_status_label.winfo_exists(): self.tally_status_label.config(text="Tally: NOT RESPONDING (paused)")
+        except tk.TclError as e: logger.warning(f"Error updating circuit status: {e}")
+
     def update_sync_progress(self, current: int, total: int, message: str = ""):
         """Updates the sync progress bar and label. Shows the progress bar."""
         logger.debug(f"Status bar update: Sync {current}/{total} - {message}")
@@ -113,6 +121,14 @@ class StatusBar(tk.Frame):
             if self.winfo_exists(): self.update_idletasks()
         except tk.TclError as e: logger.warning(f"Error updating sync progress: {e}")
 
+    def update_auto_sync_status(self, message: str):
+        """Shows the latest background auto sync result next to the sync progress area."""
+        try:
+            if not hasattr(self, 'sync_frame') or not self.sync_frame.winfo_exists(): return
+            if not hasattr(self, 'auto_sync_label'): self.auto_sync_label = tk.Label(self.sync_frame, font=STATUS_FONT, bg=self["bg"], fg=MUTED_COLOR); self.auto_sync_label.pack(side=tk.RIGHT)
+            self.auto_sync_label.config(text=message)
+        except tk.TclError as e: logger.warning(f"Error updating auto sync status: {e}")
+
     def clear_sync_progress(self):
         """Hides the sync progress bar and clears the label."""
         logger.debug("Clearing sync progress from status bar")
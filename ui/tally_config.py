@@ -124,7 +124,8 @@ class TallyConfigPanel(tk.Frame):
         if host is None or port is None:
             return
 
-        settings = {"tally_host": host, "tally_port": port}
+        settings = load_settings() # Keep non-connection settings (e.g. db_pragma_profile)
+        settings.update({"tally_host": host, "tally_port": port})
         try:
             save_settings(settings)
             logger.info(f"Settings saved: {host}:{port}")
@@ -5,10 +5,40 @@ Handles company CRUD operations and sync status management.
 
 import logging
 import datetime
-from .core import execute_query
+from .core import (
+    execute_query, get_db_connection, close_db_connection, close_all_db_connections, transaction,
+    set_db_pragma_profile, DB_PRAGMA_PROFILES,
+    save_masters_bulk, SaveResult, make_record_type, get_company_id, init_db, DATABASE_PATH,
+    get_last_alter_id, set_last_alter_id, clear_sync_state,
+    get_table_columns, table_has_column, invalidate_schema_cache
+)
+from .schema import COMPANY_DETAIL_COLUMNS, clean_orphaned_rows
+from .writer import DBWriter, start_db_writer, stop_db_writer, submit_write
+from .audit import log_change, flush_audit_log
+from .sync_history import save_sync_run, get_sync_runs, get_stage_timings
+from .checkpoints import (
+    get_sync_checkpoint, begin_sync_checkpoint, mark_master_done, mark_voucher_page_done, clear_sync_checkpoint
+)
+from .accounting import (
+    ACCOUNTING_COLUMNS, save_ledgers, save_accounting_groups, save_ledgerbillwise, save_costcategory,
+    save_costcenter, save_currency, save_vouchertype
+)
+from .inventory import (
+    INVENTORY_COLUMNS, save_stock_groups, save_stock_items, save_units, save_stockgroupwithgst,
+    save_stockcategory, save_godown, save_stockitem_gst, save_stockitem_mrp,
+    save_stockitem_bom, save_stockitem_standardcost, save_stockitem_standardprice,
+    save_stockitem_batchdetails
+)
+from .vouchers import (
+    VOUCHER_COLUMNS, VOUCHER_LINE_TABLES, save_vouchers, save_voucher_ledger_entries,
+    save_voucher_inventory_entries, save_voucher_bill_allocations, prune_voucher_lines
+)
 
 logger = logging.getLogger(__name__)
 
+# Column order of every master table (table name -> tuple of columns), see accounting/inventory
+MASTER_COLUMNS = {**ACCOUNTING_COLUMNS, **INVENTORY_COLUMNS}
+
 def add_company_to_db(name, number, description=""):
     """Adds a company or reactivates it if soft-deleted. Returns True if added/reactivated."""
     if not name or not number:
@@ -24,22 +54,8 @@ def add_company_to_db(name, number, description=""):
             # Company exists but is inactive or deleted
             logger.info(f"Reactivating company {number_str} ('{name}').")
             
-            # Check if updated_timestamp column exists
-            from .core import get_db_connection
-            conn = get_db_connection()
-            if conn:
-                try:
-                    cursor = conn.cursor()
-                    cursor.execute("PRAGMA table_info(companies)")
-                    columns = [info[1].lower() for info in cursor.fetchall()]
-                    has_updated_timestamp = 'updated_timestamp' in columns
-                except Exception as e:
-                    logger.error(f"Error checking columns: {e}")
-                    has_updated_timestamp = False
-                finally:
-                    conn.close()
-            else:
-                has_updated_timestamp = False
+            # Check if updated_timestamp column exists (cached schema metadata)
+            has_updated_timestamp = table_has_column("companies", "updated_timestamp")
             
             # Reset sync status on reactivation
             if has_updated_timestamp:
@@ -160,22 +176,8 @@ def edit_company_in_db(company_id, new_name, new_description=None):
         logger.info(f"No changes for company {company_id}.")
         return False
     
-    # Check if updated_timestamp column exists
-    from .core import get_db_connection
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA table_info(companies)")
-            columns = [info[1].lower() for info in cursor.fetchall()]
-            has_updated_timestamp = 'updated_timestamp' in columns
-        except Exception as e:
-            logger.error(f"Error checking columns: {e}")
-            has_updated_timestamp = False
-        finally:
-            conn.close()
-    else:
-        has_updated_timestamp = False
+    # Check if updated_timestamp column exists (cached schema metadata)
+    has_updated_timestamp = table_has_column("companies", "updated_timestamp")
     
     # Update the company
     if has_updated_timestamp:
@@ -227,22 +229,8 @@ def soft_delete_company(company_id):
         id_field = "tally_company_number"
         id_value = str(company_id)
     
-    # Check if updated_timestamp column exists
-    from .core import get_db_connection
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA table_info(companies)")
-            columns = [info[1].lower() for info in cursor.fetchall()]
-            has_updated_timestamp = 'updated_timestamp' in columns
-        except Exception as e:
-            logger.error(f"Error checking columns: {e}")
-            has_updated_timestamp = False
-        finally:
-            conn.close()
-    else:
-        has_updated_timestamp = False
+    # Check if updated_timestamp column exists (cached schema metadata)
+    has_updated_timestamp = table_has_column("companies", "updated_timestamp")
     
     # Soft delete the company
     if has_updated_timestamp:
@@ -270,7 +258,7 @@ def soft_delete_company(company_id):
         return False
 
 def update_company_details(company_id, details):
-    """Update company details from fetched data."""
+    """Update company details from fetched data. The sync status is set by the sync once it ends."""
     if not company_id or not details:
         logger.error("Update company details failed: Missing data.")
         return False
@@ -281,47 +269,13 @@ def update_company_details(company_id, details):
         logger.error(f"Update details failed: Missing company name in details for {company_id}.")
         return False
     
-    # Check if company exists
-    company = get_company_details(company_id)
-    
-    # If company doesn't exist, add it first
-    if not company:
-        logger.info(f"Company {company_id} not found. Adding it to database first.")
-        # Instead of checking the return value, we'll just try to add it
-        add_company_to_db(company_name, str(company_id), details.get('description', ''))
-        
-        # Check again if the company exists now
-        company = get_company_details(company_id)
-        if not company:
-            logger.error(f"Failed to add company {company_id} during sync.")
-            return False
+    # Always the Tally company number: those are numeric too (e.g. "10000"), so an isdigit()
+    # check can't tell them from a row id, and the sync passes the company number
+    id_field = "tally_company_number"
+    id_value = str(company_id)
     
-    # Determine if we're using ID or company number
-    if isinstance(company_id, int) or (isinstance(company_id, str) and company_id.isdigit()):
-        # Using ID
-        id_field = "id"
-        id_value = int(company_id)
-    else:
-        # Using company number
-        id_field = "tally_company_number"
-        id_value = str(company_id)
-    
-    # Check if updated_timestamp column exists
-    from .core import get_db_connection
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA table_info(companies)")
-            columns = [info[1].lower() for info in cursor.fetchall()]
-            has_updated_timestamp = 'updated_timestamp' in columns
-        except Exception as e:
-            logger.error(f"Error checking columns: {e}")
-            has_updated_timestamp = False
-        finally:
-            conn.close()
-    else:
-        has_updated_timestamp = False
+    # Check if updated_timestamp column exists (cached schema metadata)
+    has_updated_timestamp = table_has_column("companies", "updated_timestamp")
     
     # Extract fields to update
     update_fields = []
@@ -380,8 +334,6 @@ def update_company_details(company_id, details):
     # Add timestamp fields
     if has_updated_timestamp:
         update_fields.append("updated_timestamp = CURRENT_TIMESTAMP")
-    update_fields.append("sync_status = 'Synced'")
-    update_fields.append("last_sync_timestamp = CURRENT_TIMESTAMP")
     
     # If no fields to update, return early
     if not update_fields:
@@ -400,10 +352,17 @@ def update_company_details(company_id, details):
     
     rowcount = execute_query(update_sql, tuple(update_values), commit=True)
     
+    # No matching row: the company isn't in the database yet, so add it first
+    if not rowcount:
+        logger.info(f"Company {company_id} not found. Adding it to database first.")
+        # Instead of checking the return value, we'll just try to add it and update again
+        add_company_to_db(company_name, str(company_id), details.get('description', ''))
+        rowcount = execute_query(update_sql, tuple(update_values), commit=True)
+    
     if rowcount:
         logger.info(f"Updated details for company {company_id}.")
-        log_change(str(company_id) if isinstance(company_id, int) else company_id, 
-                  "UPDATE_DETAILS", f"Updated {len(update_fields) - (3 if has_updated_timestamp else 2)} fields")
+        log_change(id_value, 
+                  "UPDATE_DETAILS", f"Updated {len(update_fields) - (1 if has_updated_timestamp else 0)} fields")
         return True
     else:
         logger.error(f"Failed to update details for company {company_id}.")
@@ -415,32 +374,12 @@ def update_company_sync_status(company_id, status):
         logger.error("Update sync status failed: Status is empty.")
         return False
     
-    # Determine if we're using ID or company number
-    if isinstance(company_id, int) or (isinstance(company_id, str) and company_id.isdigit()):
-        # Using ID
-        id_field = "id"
-        id_value = int(company_id)
-    else:
-        # Using company number
-        id_field = "tally_company_number"
-        id_value = str(company_id)
+    # Always the Tally company number (see update_company_details)
+    id_field = "tally_company_number"
+    id_value = str(company_id)
     
-    # Check if updated_timestamp column exists
-    from .core import get_db_connection
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA table_info(companies)")
-            columns = [info[1].lower() for info in cursor.fetchall()]
-            has_updated_timestamp = 'updated_timestamp' in columns
-        except Exception as e:
-            logger.error(f"Error checking columns: {e}")
-            has_updated_timestamp = False
-        finally:
-            conn.close()
-    else:
-        has_updated_timestamp = False
+    # Check if updated_timestamp column exists (cached schema metadata)
+    has_updated_timestamp = table_has_column("companies", "updated_timestamp")
     
     # Update the sync status
     if has_updated_timestamp:
@@ -464,16 +403,3 @@ def update_company_sync_status(company_id, status):
     else:
         logger.error(f"Failed to update sync status for company {company_id}.")
         return False
-
-def log_change(tally_company_number, action, details=""):
-    """Log a company change to the company_log table."""
-    details_str = (details[:1000] + '...') if len(details) > 1003 else details
-    sql = "INSERT INTO company_log (tally_company_number, action, details) VALUES (?, ?, ?)"
-    rowcount = execute_query(sql, (str(tally_company_number), action.upper(), details_str), commit=True)
-    
-    if rowcount:
-        logger.debug(f"Logged action '{action}' for company {tally_company_number}")
-        return True
-    else:
-        logger.error(f"Failed to log action '{action}' for company {tally_company_number}")
-        return False
@@ -0,0 +1,100 @@
+"""
+Buffered audit logging for TallyPrimeConnect.
+Collects company_log rows in memory and writes them in batches with executemany.
+"""
+
+import atexit
+import datetime
+import logging
+import threading
+
+from .core import execute_query, close_db_connection
+
+logger = logging.getLogger(__name__)
+
+AUDIT_FLUSH_INTERVAL = 2.0      # Seconds a buffered row may wait before a timed flush
+AUDIT_FLUSH_MAX_ROWS = 200      # Flush immediately once this many rows are buffered
+AUDIT_DETAILS_MAX_LEN = 1000
+
+_INSERT_SQL = "INSERT INTO company_log (tally_company_number, action, details, timestamp) VALUES (?, ?, ?, ?)"
+
+class AuditLogger:
+    """In-memory buffer of company_log rows, flushed on a short timer, when full, or on demand."""
+    def __init__(self, flush_interval=AUDIT_FLUSH_INTERVAL, max_rows=AUDIT_FLUSH_MAX_ROWS):
+        self.flush_interval = flush_interval
+        self.max_rows = max_rows
+        self._rows = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # Keeps batches in call order
+        self._timer = None
+
+    def log(self, tally_company_number, action, details=""):
+        """Buffers one audit row. The timestamp is taken now, not at flush time."""
+        details_str = (details[:AUDIT_DETAILS_MAX_LEN] + '...') if len(details) > AUDIT_DETAILS_MAX_LEN + 3 else details
+        # UTC, same format as the column's CURRENT_TIMESTAMP default
+        timestamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        with self._lock:
+            self._rows.append((str(tally_company_number), action.upper(), details_str, timestamp))
+            full = len(self._rows) >= self.max_rows
+            if not full and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Writes all buffered rows in one executemany. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            if not rows:
+                return 0
+            if not execute_query(_INSERT_SQL, rows, commit=True, executemany=True):
+                self._requeue(rows)
+                return 0
+            logger.debug(f"Flushed {len(rows)} audit log row(s).")
+            return len(rows)
+
+    def _requeue(self, rows):
+        """Puts rows whose write failed back at the front of the buffer (at most max_rows of them,
+        the newest), to be retried by the next timed or shutdown flush."""
+        kept = rows[-self.max_rows:]
+        if len(kept) < len(rows):
+            logger.error(f"Failed to write {len(rows)} audit log row(s); dropping the {len(rows) - len(kept)} oldest.")
+        logger.warning(f"Failed to write {len(kept)} audit log row(s); retrying on the next flush.")
+        with self._lock:
+            self._rows[:0] = kept
+            if self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_on_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_on_timer(self):
+        """Timed flush. Each timer is a new short-lived thread, so without a DB writer to route the
+        write to, the connection it opened is closed here rather than left behind."""
+        try:
+            self.flush()
+        finally:
+            close_db_connection()
+
+    def pending(self):
+        with self._lock:
+            return len(self._rows)
+
+_audit_logger = AuditLogger()
+
+def log_change(tally_company_number, action, details=""):
+    """Log a company change to the company_log table (buffered; see flush_audit_log)."""
+    _audit_logger.log(tally_company_number, action, details)
+    logger.debug(f"Logged action '{action}' for company {tally_company_number}")
+    return True
+
+def flush_audit_log():
+    """Writes buffered audit rows now. Call at the end of a unit of work and before shutdown."""
+    return _audit_logger.flush()
+
+atexit.register(flush_audit_log)  # Backstop; the app flushes explicitly before closing the DB
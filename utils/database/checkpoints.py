@@ -0,0 +1,78 @@
+"""
+Sync checkpoints for TallyPrimeConnect.
+A company sync records each master and voucher page it finishes, in the same unit of work as the
+data itself, so a sync interrupted by a crash or a dropped ODBC connection resumes where it stopped.
+The checkpoint is discarded when a sync finishes cleanly.
+"""
+
+import logging
+import sqlite3
+import datetime
+from .core import execute_query, transaction
+
+logger = logging.getLogger(__name__)
+
+def _now():
+    return datetime.datetime.now().isoformat(sep=' ', timespec='seconds')
+
+def get_sync_checkpoint(company_number):
+    """The company's open checkpoint, or None.
+
+    Returns a dict with mode, company_alter_id, voucher_max_alter_id, started_timestamp,
+    updated_timestamp, masters_done (set of table names) and voucher_pages_done (set of ISO page start dates).
+    """
+    row = execute_query("SELECT * FROM sync_checkpoints WHERE tally_company_number = ?", (str(company_number),), fetch_one=True)
+    if not row:
+        return None
+    checkpoint = dict(row)
+    items = execute_query("SELECT kind, item FROM sync_checkpoint_items WHERE tally_company_number = ?",
+                          (str(company_number),), fetch_all=True) or []
+    checkpoint["masters_done"] = {item["item"] for item in items if item["kind"] == "master"}
+    checkpoint["voucher_pages_done"] = {item["item"] for item in items if item["kind"] == "voucher_page"}
+    return checkpoint
+
+def begin_sync_checkpoint(company_number, mode, company_alter_id=None):
+    """Opens a fresh checkpoint for a company sync (replacing any previous one and its items) and
+    returns it, or None if it couldn't be saved."""
+    now = _now()
+    try:
+        with transaction() as conn:
+            conn.execute("DELETE FROM sync_checkpoint_items WHERE tally_company_number = ?", (str(company_number),))
+            conn.execute("DELETE FROM sync_checkpoints WHERE tally_company_number = ?", (str(company_number),))
+            conn.execute(
+                """INSERT INTO sync_checkpoints (tally_company_number, mode, company_alter_id, started_timestamp, updated_timestamp)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (str(company_number), mode, company_alter_id, now, now)
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Failed to open sync checkpoint for company {company_number}: {e}")
+        return None
+    return {"tally_company_number": str(company_number), "mode": mode, "company_alter_id": company_alter_id,
+            "voucher_max_alter_id": None, "started_timestamp": now, "updated_timestamp": now,
+            "masters_done": set(), "voucher_pages_done": set()}
+
+def _mark_done(company_number, kind, item):
+    execute_query(
+        "INSERT INTO sync_checkpoint_items (tally_company_number, kind, item) VALUES (?, ?, ?) ON CONFLICT DO NOTHING",
+        (str(company_number), kind, str(item)), commit=True
+    )
+    return execute_query("UPDATE sync_checkpoints SET updated_timestamp = ? WHERE tally_company_number = ?",
+                         (_now(), str(company_number)), commit=True)
+
+def mark_master_done(company_number, table_name):
+    """Records a master as saved. Call in the same unit of work as its watermark update."""
+    return _mark_done(company_number, "master", table_name)
+
+def mark_voucher_page_done(company_number, page_start, max_alter_id=None):
+    """Records a voucher page (by its start date) as saved, with the highest voucher AlterID it held.
+    Call in the same unit of work as the page's line pruning."""
+    if max_alter_id is not None:
+        execute_query(
+            "UPDATE sync_checkpoints SET voucher_max_alter_id = MAX(IFNULL(voucher_max_alter_id, 0), ?) WHERE tally_company_number = ?",
+            (int(max_alter_id), str(company_number)), commit=True
+        )
+    return _mark_done(company_number, "voucher_page", page_start.isoformat() if hasattr(page_start, 'isoformat') else page_start)
+
+def clear_sync_checkpoint(company_number):
+    """Discards a company's checkpoint (after a clean sync). Returns True if one existed."""
+    return bool(execute_query("DELETE FROM sync_checkpoints WHERE tally_company_number = ?", (str(company_number),), commit=True))
@@ -5,7 +5,8 @@ Handles company CRUD operations and sync status management.
 
 import logging
 import datetime
-from .core import execute_query
+from .core import execute_query, table_has_column
+from .audit import log_change
 
 logger = logging.getLogger(__name__)
 
@@ -196,7 +197,8 @@ def soft_delete_company(company_id):
         return False
 
 def update_company_details(company_id, details):
-    """Update company details from fetched data. Creates company if it doesn't exist."""
+    """Update company details from fetched data. Creates company if it doesn't exist.
+    The sync status is set by the sync once it ends."""
     if not company_id or not details:
         logger.error("Update company details failed: Missing data.")
         return False
@@ -207,48 +209,13 @@ def update_company_details(company_id, details):
         logger.error(f"Update details failed: Missing company name in details for {company_id}.")
         return False
     
-    # Check if company exists
-    company = get_company_details(company_id)
-    
-    # If company doesn't exist, add it first
-    if not company:
-        logger.info(f"Company {company_id} not found. Adding it to database first.")
-        success = add_company_to_db(company_name, str(company_id), details.get('description', ''))
-        if not success:
-            logger.error(f"Failed to add company {company_id} during sync.")
-            return False
-        # Get the newly added company
-        company = get_company_details(company_id)
-        if not company:
-            logger.error(f"Failed to retrieve newly added company {company_id}.")
-            return False
-    
-    # Determine if we're using ID or company number
-    if isinstance(company_id, int) or (isinstance(company_id, str) and company_id.isdigit()):
-        # Using ID
-        id_field = "id"
-        id_value = int(company_id)
-    else:
-        # Using company number
-        id_field = "tally_company_number"
-        id_value = str(company_id)
+    # Always the Tally company number: those are numeric too (e.g. "10000"), so an isdigit()
+    # check can't tell them from a row id, and the sync passes the company number
+    id_field = "tally_company_number"
+    id_value = str(company_id)
     
-    # Check if updated_timestamp column exists
-    from .core import get_db_connection
-    conn = get_db_connection()
-    if conn:
-        try:
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA table_info(companies)")
-            columns = [info[1].lower() for info in cursor.fetchall()]
-            has_updated_timestamp = 'updated_timestamp' in columns
-        except Exception as e:
-            logger.error(f"Error checking columns: {e}")
-            has_updated_timestamp = False
-        finally:
-            conn.close()
-    else:
-        has_updated_timestamp = False
+    # Check if updated_timestamp column exists (cached schema metadata)
+    has_updated_timestamp = table_has_column("companies", "updated_timestamp")
     
     # Extract fields to update
     update_fields = []
@@ -307,8 +274,6 @@ def update_company_details(company_id, details):
     # Add timestamp fields
     if has_updated_timestamp:
         update_fields.append("updated_timestamp = CURRENT_TIMESTAMP")
-    update_fields.append("sync_status = 'Synced'")
-    update_fields.append("last_sync_timestamp = CURRENT_TIMESTAMP")
     
     # If no fields to update, return early
     if not update_fields:
@@ -327,10 +292,18 @@ def update_company_details(company_id, details):
     
     rowcount = execute_query(update_sql, tuple(update_values), commit=True)
     
+    # No matching row: the company isn't in the database yet, so add it first
+    if not rowcount:
+        logger.info(f"Company {company_id} not found. Adding it to database first.")
+        if not add_company_to_db(company_name, str(company_id), details.get('description', '')):
+            logger.error(f"Failed to add company {company_id} during sync.")
+            return False
+        rowcount = execute_query(update_sql, tuple(update_values), commit=True)
+    
     if rowcount:
         logger.info(f"Updated details for company {company_id}.")
-        log_change(str(company_id) if isinstance(company_id, int) else company_id, 
-                  "UPDATE_DETAILS", f"Updated {len(update_fields) - (3 if has_updated_timestamp else 2)} fields")
+        log_change(id_value, 
+                  "UPDATE_DETAILS", f"Updated {len(update_fields) - (1 if has_updated_timestamp else 0)} fields")
         return True
     else:
         logger.error(f"Failed to update details for company {company_id}.")
@@ -342,15 +315,9 @@ def update_company_sync_status(company_id, status):
         logger.error("Update sync status failed: Status is empty.")
         return False
     
-    # Determine if we're using ID or company number
-    if isinstance(company_id, int) or (isinstance(company_id, str) and company_id.isdigit()):
-        # Using ID
-        id_field = "id"
-        id_value = int(company_id)
-    else:
-        # Using company number
-        id_field = "tally_company_number"
-        id_value = str(company_id)
+    # Always the Tally company number (see update_company_details)
+    id_field = "tally_company_number"
+    id_value = str(company_id)
     
     # Update the sync status
     sql = f"""
@@ -367,16 +334,3 @@ def update_company_sync_status(company_id, status):
     else:
         logger.error(f"Failed to update sync status for company {company_id}.")
         return False
-
-def log_change(tally_company_number, action, details=""):
-    """Log a company change to the company_log table."""
-    details_str = (details[:1000] + '...') if len(details) > 1003 else details
-    sql = "INSERT INTO company_log (tally_company_number, action, details) VALUES (?, ?, ?)"
-    rowcount = execute_query(sql, (str(tally_company_number), action.upper(), details_str), commit=True)
-    
-    if rowcount:
-        logger.debug(f"Logged action '{action}' for company {tally_company_number}")
-        return True
-    else:
-        logger.error(f"Failed to log action '{action}' for company {tally_company_number}")
-        return False
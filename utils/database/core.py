@@ -8,6 +8,14 @@ import os
 import datetime
 import logging
 import time
+import threading
+import functools
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from collections import namedtuple
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from ..sync_timing import record_stage
 
 logger = logging.getLogger(__name__)
 
@@ -21,24 +29,261 @@ DATABASE_DIR = os.path.join(BASE_DIR, 'config')
 DATABASE_PATH = os.path.join(DATABASE_DIR, 'biz_analyst_data.db')
 SQLITE_TIMEOUT = 5.0
 
+# --- Connection Pragma Profiles ---
+# Applied once to every connection when it is opened. "tuned" uses WAL so UI reads
+# don't block behind sync writes; "safe" keeps SQLite's rollback-journal defaults.
+DB_PRAGMA_PROFILES = {
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -32000,       # Negative = KiB, i.e. ~32 MB page cache
+        "mmap_size": 268435456,     # 256 MB
+        "temp_store": "MEMORY",
+    },
+    "safe": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+    },
+}
+_ALLOWED_PRAGMAS = {"journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store", "busy_timeout", "wal_autocheckpoint"}
+_db_pragmas = dict(DB_PRAGMA_PROFILES["tuned"])
+
 # --- DB Connection ---
-def get_db_connection():
-    """Establishes and returns a database connection."""
+# One long-lived connection per thread (Tk thread, each sync worker).
+# Connections are registered so they can all be closed on app exit.
+_thread_local = threading.local()
+_connections = {}  # thread ident -> sqlite3.Connection
+_connections_lock = threading.Lock()
+
+def set_db_pragma_profile(profile):
+    """Selects the pragma profile (name from DB_PRAGMA_PROFILES or a dict) for connections opened from now on.
+    An unknown or invalid profile (e.g. a typo in settings.json) logs a warning and selects "tuned"."""
+    global _db_pragmas
+    pragmas = None
+    if isinstance(profile, str):
+        pragmas = DB_PRAGMA_PROFILES.get(profile)
+        if pragmas is None:
+            logger.warning(f"Unknown DB pragma profile: {profile!r}. Using 'tuned'.")
+    elif isinstance(profile, dict):
+        unknown = set(profile) - _ALLOWED_PRAGMAS
+        if unknown:
+            logger.warning(f"Unsupported pragmas: {', '.join(sorted(map(str, unknown)))}. Using 'tuned'.")
+        else:
+            pragmas = profile
+    else:
+        logger.warning(f"Invalid DB pragma profile: {profile!r}. Using 'tuned'.")
+    _db_pragmas = dict(pragmas if pragmas is not None else DB_PRAGMA_PROFILES["tuned"])
+    logger.info(f"DB pragma profile set: {_db_pragmas}")
+
+def _apply_pragmas(conn):
+    """Applies the active pragma profile to a freshly opened connection."""
+    for name, value in _db_pragmas.items():
+        if not isinstance(value, (int, str)) or (isinstance(value, str) and not value.isalnum()):
+            logger.error(f"Ignoring invalid value for PRAGMA {name}: {value!r}")
+            continue
+        row = conn.execute(f"PRAGMA {name} = {value};").fetchone()
+        if name == "journal_mode" and row and str(row[0]).lower() != str(value).lower():
+            # e.g. WAL is unavailable on some network shares; SQLite keeps the old mode.
+            logger.warning(f"Requested journal_mode={value}, SQLite kept '{row[0]}'.")
+
+def _open_connection():
+    """Opens a new configured SQLite connection."""
     os.makedirs(DATABASE_DIR, exist_ok=True)
+    # check_same_thread=False only so close_all_db_connections() can close it from the main thread;
+    # each connection is still used by its owning thread only.
+    conn = sqlite3.connect(DATABASE_PATH, timeout=SQLITE_TIMEOUT, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON;")
+    _apply_pragmas(conn)
+    return conn
+
+def _close_quietly(conn):
     try:
-        conn = sqlite3.connect(DATABASE_PATH, timeout=SQLITE_TIMEOUT)
-        conn.row_factory = sqlite3.Row
-        conn.execute("PRAGMA foreign_keys = ON;")
-        logger.debug(f"DB connection established: {DATABASE_PATH}")
+        conn.close()
+    except sqlite3.Error as e:
+        logger.error(f"Error closing DB: {e}")
+
+def get_db_connection():
+    """Returns the calling thread's persistent database connection, opening it on first use."""
+    leased = getattr(_thread_local, 'leased_conn', None)
+    if leased is not None:
+        return leased  # Inside a DBWriter lease: use the writer's connection
+    ident = threading.get_ident()
+    conn = getattr(_thread_local, 'conn', None)
+    if conn is not None and _connections.get(ident) is conn:
         return conn
+    try:
+        conn = _open_connection()
     except sqlite3.Error as e:
         logger.exception(f"DB connection error: {e}")
         return None
+    _thread_local.conn = conn
+    with _connections_lock:
+        stale = _connections.get(ident)  # Left behind by a finished thread with the same ident
+        _connections[ident] = conn
+    if stale is not None and stale is not conn:
+        _close_quietly(stale)
+    logger.debug(f"DB connection established for thread {ident}: {DATABASE_PATH}")
+    return conn
+
+def close_db_connection():
+    """Closes the calling thread's connection. Call at the end of worker threads."""
+    conn = getattr(_thread_local, 'conn', None)
+    _thread_local.conn = None
+    _thread_local.tx_depth = 0
+    if conn is None:
+        return
+    with _connections_lock:
+        if _connections.get(threading.get_ident()) is conn:
+            del _connections[threading.get_ident()]
+    _close_quietly(conn)
+    logger.debug("DB connection closed for current thread.")
+
+def close_all_db_connections():
+    """Closes every thread's connection. Call once on application exit."""
+    with _connections_lock:
+        conns = list(_connections.values())
+        _connections.clear()
+    _thread_local.conn = None
+    for conn in conns:
+        _close_quietly(conn)
+    logger.info(f"Closed {len(conns)} DB connection(s).")
+
+# --- Schema Metadata Cache ---
+# Lower-case column names per table, read once with PRAGMA table_info. Filled by init_db after
+# migrations; anything that alters a table's columns must call invalidate_schema_cache().
+_table_columns = {}
+
+def get_table_columns(table_name):
+    """Returns the cached set of lower-case column names of a table (empty if it can't be read)."""
+    columns = _table_columns.get(table_name)
+    if columns is None:
+        rows = execute_query(f"PRAGMA table_info({table_name})", fetch_all=True)
+        if not rows:
+            return frozenset()  # Missing table or error: don't cache
+        columns = frozenset(row[1].lower() for row in rows)
+        _table_columns[table_name] = columns
+    return columns
+
+def table_has_column(table_name, column_name):
+    """True if table_name has column_name, using the schema metadata cache."""
+    return column_name.lower() in get_table_columns(table_name)
+
+def invalidate_schema_cache(table_name=None):
+    """Drops cached column metadata for one table, or for all tables."""
+    if table_name is None:
+        _table_columns.clear()
+    else:
+        _table_columns.pop(table_name, None)
+
+# --- Background Writer Routing ---
+# Set by writer.start_db_writer(). While it runs, writes from any other thread go through it:
+# execute_query(commit=True) becomes a queued job and transaction() leases its connection, so
+# a transaction() block must only do database work (never Tally I/O) to keep the writer free.
+_db_writer = None
+
+def _set_db_writer(writer):
+    global _db_writer
+    _db_writer = writer
+
+def _routes_to_writer():
+    writer = _db_writer
+    return (writer is not None and writer.is_running and not writer.is_writer_thread()
+            and getattr(_thread_local, 'leased_conn', None) is None)
+
+def _write_via_writer(sql, params, fetch_one, fetch_all, commit, executemany):
+    """execute_query(commit=True) as a writer job; waits for it and returns its result.
+
+    A sync never holds the writer across Tally I/O, so the wait is for the writes queued ahead.
+    A write that was accepted is never dropped: past SQLITE_TIMEOUT a warning is logged and the
+    wait goes on (use submit_write() for a future instead of waiting).
+    """
+    future = _db_writer.submit(execute_query, sql, params, fetch_one, fetch_all, commit, executemany)
+    try:
+        return future.result(timeout=SQLITE_TIMEOUT)
+    except FutureTimeoutError:
+        logger.warning(f"DB write queued for over {SQLITE_TIMEOUT}s behind other writes; still waiting. SQL: {sql[:100]}...")
+    return future.result()
+
+# --- Unit of Work ---
+def _tx_depth():
+    return getattr(_thread_local, 'tx_depth', 0)
+
+def _tx_raises_errors():
+    return getattr(_thread_local, 'tx_raise_errors', False)
+
+def _rollback_quietly(conn, savepoint=None):
+    try:
+        if savepoint:
+            conn.execute(f"ROLLBACK TO {savepoint}")
+            conn.execute(f"RELEASE {savepoint}")
+        else:
+            conn.rollback()
+    except sqlite3.Error as e:
+        logger.error(f"Error during rollback{f' to {savepoint}' if savepoint else ''}: {e}")
+
+@contextmanager
+def transaction(raise_errors=False):
+    """Unit of work on the calling thread's connection.
+
+    The outermost block runs as one BEGIN IMMEDIATE ... COMMIT and is rolled back if it raises.
+    Nested blocks become savepoints, so a failing inner block only undoes its own writes.
+    Inside a unit of work execute_query(commit=True) doesn't commit, and a failing statement
+    only rolls back itself, so callers' return-value checks keep working unchanged.
+    With raise_errors=True (inherited by nested blocks), execute_query re-raises SQLite errors
+    instead, so any failing statement aborts the whole block - used for schema migrations.
+    While the background writer runs, an outermost block on another thread leases the writer's
+    connection and runs as a savepoint of its batch, committed when the block ends.
+    """
+    depth = _tx_depth()
+    if depth == 0 and _routes_to_writer():
+        with _db_writer.lease():
+            with transaction(raise_errors) as conn:
+                yield conn
+        return
+    conn = get_db_connection()
+    if conn is None:
+        raise sqlite3.Error("Failed DB connection.")
+    savepoint = f"uow_{depth}" if depth else None
+    if savepoint:
+        conn.execute(f"SAVEPOINT {savepoint}")
+    else:
+        if conn.in_transaction:
+            logger.warning("Discarding uncommitted statement before starting a unit of work.")
+            conn.rollback()
+        conn.execute("BEGIN IMMEDIATE")
+    outer_raise_errors = _tx_raises_errors()
+    _thread_local.tx_depth = depth + 1
+    _thread_local.tx_raise_errors = outer_raise_errors or raise_errors
+    try:
+        yield conn
+    except BaseException:
+        _thread_local.tx_depth = depth
+        _thread_local.tx_raise_errors = outer_raise_errors
+        _rollback_quietly(conn, savepoint)
+        logger.debug(f"Unit of work rolled back (depth {depth}).")
+        raise
+    _thread_local.tx_depth = depth
+    _thread_local.tx_raise_errors = outer_raise_errors
+    try:
+        if savepoint:
+            conn.execute(f"RELEASE {savepoint}")
+        else:
+            conn.commit()
+            logger.debug("Unit of work committed.")
+    except sqlite3.Error:
+        _rollback_quietly(conn, savepoint)
+        raise
 
 # --- DB Execution Helper ---
 def execute_query(sql, params=(), fetch_one=False, fetch_all=False, commit=False, executemany=False):
-    """Helper for executing SQLite commands with managed connections and error logging."""
+    """Helper for executing SQLite commands on the thread's persistent connection with error logging."""
+    if commit and _tx_depth() == 0 and _routes_to_writer():
+        # Runs on the writer thread (possibly sharing a commit with other writes); same return value
+        return _write_via_writer(sql, params, fetch_one, fetch_all, commit, executemany)
     conn = None
+    in_uow = _tx_depth() > 0
+    stmt_savepoint = None
     
     # Validate params type based on execution mode
     if executemany and not isinstance(params, list):
@@ -57,6 +302,11 @@ def execute_query(sql, params=(), fetch_one=False, fetch_all=False, commit=False
         op = "executemany" if executemany else "execute"
         logger.debug(f"Executing SQL ({op}): {sql[:100]}... Params: {'Multiple' if executemany else ('Yes' if params else 'No')}")
         
+        if in_uow and commit:
+            # Lets a failing write undo just itself without aborting the enclosing unit of work
+            conn.execute("SAVEPOINT execute_query_stmt")
+            stmt_savepoint = "execute_query_stmt"
+        
         if executemany:
             cursor.executemany(sql, params)
         else:
@@ -64,7 +314,11 @@ def execute_query(sql, params=(), fetch_one=False, fetch_all=False, commit=False
         
         result = None
         if commit:
-            conn.commit()
+            if stmt_savepoint:
+                conn.execute(f"RELEASE {stmt_savepoint}")
+                stmt_savepoint = None
+            else:
+                conn.commit()
             result = cursor.rowcount
             logger.debug(f"Commit OK. Rows: {result}")
         elif fetch_one:
@@ -78,83 +332,194 @@ def execute_query(sql, params=(), fetch_one=False, fetch_all=False, commit=False
         
     except sqlite3.IntegrityError as e:
         logger.warning(f"SQLite IntegrityError: {e}. SQL: {sql[:100]}...")
-        if conn and commit:
+        if stmt_savepoint:
+            _rollback_quietly(conn, stmt_savepoint)
+        elif conn and commit and not in_uow:
             try:
                 conn.rollback()
                 logger.debug("Rolled back transaction due to IntegrityError.")
             except sqlite3.Error as rb_err:
                 logger.error(f"Error during rollback after IntegrityError: {rb_err}")
+        if in_uow and _tx_raises_errors():
+            raise
         return 0 if commit else None
         
     except sqlite3.Error as e:
         logger.exception(f"General SQLite Error: {e}. SQL: {sql[:100]}...")
-        if conn and commit:
+        if stmt_savepoint:
+            _rollback_quietly(conn, stmt_savepoint)
+        elif conn and commit and not in_uow:
             try:
                 conn.rollback()
                 logger.debug("Rolled back transaction due to general SQLiteError during commit.")
             except sqlite3.Error as rb_err:
                 logger.error(f"Error during rollback after general error: {rb_err}")
+        if in_uow and _tx_raises_errors():
+            raise
         return None if (fetch_one or fetch_all) else (0 if commit else False)
         
     finally:
-        if conn:
+        # The connection is reused, so never carry an uncommitted implicit transaction into the next call.
+        if conn is not None and not commit and not in_uow and conn.in_transaction:
             try:
-                conn.close()
-                logger.debug("DB connection closed.")
+                conn.rollback()
             except sqlite3.Error as e:
-                logger.error(f"Error closing DB: {e}")
+                logger.error(f"Error during rollback of uncommitted statement: {e}")
+
+# --- Incremental Sync State ---
+def get_last_alter_id(company_number, table_name):
+    """Returns the highest AlterID synced into table_name for a company, or None if never synced."""
+    row = execute_query(
+        "SELECT last_alter_id FROM sync_state WHERE tally_company_number = ? AND table_name = ?",
+        (str(company_number), table_name), fetch_one=True
+    )
+    return row['last_alter_id'] if row else None
+
+def set_last_alter_id(company_number, table_name, alter_id):
+    """Records alter_id as synced for a company/table, never moving the watermark backwards."""
+    sql = """
+    INSERT INTO sync_state (tally_company_number, table_name, last_alter_id, last_synced_timestamp)
+    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ON CONFLICT (tally_company_number, table_name) DO UPDATE SET
+        last_alter_id = MAX(last_alter_id, excluded.last_alter_id),
+        last_synced_timestamp = excluded.last_synced_timestamp
+    """
+    return execute_query(sql, (str(company_number), table_name, int(alter_id)), commit=True)
+
+def clear_sync_state(company_number, table_name=None):
+    """Forgets AlterID watermarks so the next sync of a company (or one table) is a full sync."""
+    if table_name:
+        return execute_query("DELETE FROM sync_state WHERE tally_company_number = ? AND table_name = ?",
+                             (str(company_number), table_name), commit=True)
+    return execute_query("DELETE FROM sync_state WHERE tally_company_number = ?", (str(company_number),), commit=True)
 
 # --- Generic Save Function ---
-def save_masters_bulk(table_name, unique_key_column, data_list, column_map):
-    """Generic function to save master data using INSERT OR REPLACE."""
+@dataclass
+class SaveResult:
+    """Counts from save_masters_bulk. Truthy when records were saved, like the old row count.
+
+    failed tells a save that went wrong (unknown company, SQLite error) from one with nothing to
+    save: skipped counts records dropped for lacking the unique key.
+    """
+    processed: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    skipped: int = 0
+    failed: bool = False
+
+    def __bool__(self):
+        return self.processed > 0
+
+@functools.lru_cache(maxsize=None)
+def make_record_type(name, columns):
+    """Named record type for column-ordered rows, e.g. make_record_type("Ledger", MASTER_COLUMNS["tally_ledgers"]).
+
+    A namedtuple: a tuple subclass with empty __slots__, so fields read by name without a per-row
+    dict and save_masters_bulk binds it like a plain tuple. Wrap fetched rows with Record._make(row).
+    """
+    return namedtuple(name, columns)
+
+def get_company_id(company_number):
+    """Returns companies.id for a Tally company number, or None if it isn't in the DB."""
+    row = execute_query("SELECT id FROM companies WHERE tally_company_number = ?", (str(company_number),), fetch_one=True)
+    return row['id'] if row else None
+
+def save_masters_bulk(table_name, unique_key_column, data_list, column_map, company_number=None):
+    """Generic function to save one company's master data with a change-detecting upsert.
+
+    Rows are scoped by company_id (looked up from company_number, which is required).
+    New keys are inserted; existing rows are updated in place (keeping their id) only when a
+    value differs, so unchanged rows - and their last_synced_timestamp - aren't rewritten.
+    The conflict key is UPSERT_KEYS[table_name] from schema, else (company_id, unique_key_column).
+    AlterID watermarks are left to the caller (set_last_alter_id), which knows when a whole
+    collection has been saved.
+    data_list holds dicts, or tuples (or records from make_record_type) in column_map order;
+    tuples go to executemany as they are.
+    Returns a SaveResult (processed/inserted/updated/unchanged counts).
+    """
+    from .schema import UPSERT_KEYS
+
     if not data_list:
         logger.info(f"No data provided for table '{table_name}'.")
-        return 0
+        return SaveResult()
     
-    logger.info(f"Bulk save: {len(data_list)} records into '{table_name}'...")
-    now_ts = datetime.datetime.now().isoformat(sep=' ', timespec='seconds')
-    records = []
-    skipped = 0
+    company_id = get_company_id(company_number) if company_number else None
+    if company_id is None:
+        logger.error(f"Bulk save '{table_name}' failed: unknown company '{company_number}'.")
+        return SaveResult(failed=True)
     
-    for item_dict in data_list:
-        if not item_dict or not item_dict.get(unique_key_column):
-            logger.warning(f"Skip {table_name}, missing key '{unique_key_column}': {item_dict}")
-            skipped += 1
-            continue
-        
-        record_tuple = [item_dict.get(key) for key in column_map] + [now_ts]
-        records.append(tuple(record_tuple))
+    logger.info(f"Bulk save: {len(data_list)} records into '{table_name}' (company {company_number})...")
+    column_map = list(column_map)
+    key_index = column_map.index(unique_key_column)
+    if isinstance(data_list[0], dict):
+        records = [tuple([item_dict.get(key) for key in column_map]) if item_dict else None for item_dict in data_list]
+    else:
+        records = data_list  # Already column-ordered tuples: bound as they are
     
-    if skipped:
-        logger.warning(f"Skipped {skipped} records for '{table_name}'.")
+    skipped = 0
+    if not all(record and record[key_index] for record in records):
+        valid = [record for record in records if record and record[key_index]]
+        skipped = len(records) - len(valid)
+        logger.warning(f"Skipped {skipped} records for '{table_name}' missing key '{unique_key_column}'.")
+        records = valid
     
     if not records:
         logger.warning(f"No valid records to save for '{table_name}'.")
-        return 0
+        return SaveResult(skipped=skipped)
     
-    sql_columns = column_map + ["last_synced_timestamp"]
+    # company_id and the sync timestamp are the same for every row, so they are SQL literals
+    # rather than per-row parameters (both are generated here, never user input).
+    now_ts = datetime.datetime.now().isoformat(sep=' ', timespec='seconds')
+    sql_columns = ["company_id"] + column_map + ["last_synced_timestamp"]
     cols_sql = ", ".join([f"`{c}`" for c in sql_columns])
-    placeholders = ", ".join(["?"] * len(sql_columns))
+    placeholders = ", ".join([str(int(company_id))] + ["?"] * len(column_map) + [f"'{now_ts}'"])
+    conflict_keys = UPSERT_KEYS.get(table_name, ("company_id", f"`{unique_key_column}`"))
+    update_columns = [c for c in column_map if f"`{c}`" not in conflict_keys and c not in conflict_keys]
     
-    sql = f"INSERT OR REPLACE INTO `{table_name}` ({cols_sql}) VALUES ({placeholders})"
-    rows_affected = execute_query(sql, records, commit=True, executemany=True)
-    processed_count = len(records)
-    
-    if rows_affected is not None:
-        logger.info(f"Bulk save '{table_name}' OK. Processed {processed_count}. DB Rows: {rows_affected}.")
+    sql = f"INSERT INTO `{table_name}` ({cols_sql}) VALUES ({placeholders}) ON CONFLICT ({', '.join(conflict_keys)}) "
+    if update_columns:
+        set_sql = ", ".join(f"`{c}` = excluded.`{c}`" for c in update_columns + ["last_synced_timestamp"])
+        changed_sql = " OR ".join(f"`{table_name}`.`{c}` IS NOT excluded.`{c}`" for c in update_columns)
+        sql += f"DO UPDATE SET {set_sql} WHERE {changed_sql}"
     else:
-        logger.error(f"Bulk save '{table_name}' failed.")
-        processed_count = 0
+        sql += "DO NOTHING"
+    
+    processed_count = len(records)
+    try:
+        started = time.perf_counter()
+        with transaction() as conn:
+            # Rows inserted by this statement are exactly those with an id above the previous maximum
+            max_id_before = conn.execute(f"SELECT IFNULL(MAX(id), 0) FROM `{table_name}`").fetchone()[0]
+            rows_affected = conn.executemany(sql, records).rowcount
+            inserted = conn.execute(f"SELECT COUNT(*) FROM `{table_name}` WHERE id > ?", (max_id_before,)).fetchone()[0]
+        record_stage("write", time.perf_counter() - started, processed_count)
+    except sqlite3.IntegrityError as e:
+        logger.warning(f"Bulk save '{table_name}' failed: SQLite IntegrityError: {e}")
+        return SaveResult(skipped=skipped, failed=True)
+    except sqlite3.Error as e:
+        logger.exception(f"Bulk save '{table_name}' failed: {e}")
+        return SaveResult(skipped=skipped, failed=True)
     
-    return processed_count
+    result = SaveResult(
+        processed=processed_count, inserted=inserted,
+        updated=rows_affected - inserted, unchanged=processed_count - rows_affected, skipped=skipped
+    )
+    logger.info(f"Bulk save '{table_name}' OK. Processed {processed_count}: {result.inserted} inserted, "
+                f"{result.updated} updated, {result.unchanged} unchanged.")
+    return result
 
 
 # --- Initialize Database ---
 def init_db():
-    """Initializes the database by importing and running schema creation."""
-    from .schema import create_all_tables, clean_orphaned_rows
+    """Initializes the database: applies pending schema migrations (a single read when current).
+
+    Orphan cleanup is no longer part of startup; the sync worker runs clean_orphaned_rows().
+    """
+    from .schema import migrate_schema
     
     logger.info(f"Initializing DB schema check: {DATABASE_PATH}")
-    create_all_tables()
-    clean_orphaned_rows()
-    logger.info("DB schema initialization and cleanup complete.")
+    if not migrate_schema():
+        return  # Schema current: the version read was the only statement
+    get_table_columns("companies")  # Warm the cache for the company update paths
+    logger.info("DB schema initialization complete.")
@@ -4,7 +4,9 @@ Contains table creation functions and schema management.
 """
 
 import logging
-from .core import execute_query
+import sqlite3
+import datetime
+from .core import execute_query, get_db_connection, transaction, invalidate_schema_cache
 
 logger = logging.getLogger(__name__)
 
@@ -54,6 +56,54 @@ COMPANY_DETAIL_COLUMNS = {
     "last_sync_timestamp": "DATETIME"
 }
 
+# --- Column Helpers ---
+def add_missing_columns(table_name, columns):
+    """Adds any columns from {name: type} that an existing table lacks."""
+    rows = execute_query(f"PRAGMA table_info({table_name})", fetch_all=True)
+    if rows is None:
+        logger.error(f"Cannot check columns for '{table_name}'.")
+        return
+    existing = {row[1].lower() for row in rows}
+    for col_name, col_type in columns.items():
+        if col_name.lower() not in existing:
+            if execute_query(f"ALTER TABLE `{table_name}` ADD COLUMN `{col_name}` {col_type}", commit=True) is not None:
+                invalidate_schema_cache(table_name)
+                logger.info(f"Added column '{col_name}' to '{table_name}'.")
+            else:
+                logger.error(f"Failed to add column {col_name} to '{table_name}'.")
+
+# --- Upsert Keys ---
+# Conflict targets for save_masters_bulk on tables without a (company_id, key) UNIQUE constraint.
+# Nullable columns are wrapped in IFNULL so rows with NULL parts still match on re-sync.
+UPSERT_KEYS = {
+    "tally_ledgerbillwise": ("company_id", "IFNULL(ledger_guid, '')", "IFNULL(name, '')"),
+    "tally_stockitem_mrp": ("company_id", "name", "IFNULL(from_date, '')", "IFNULL(state_name, '')"),
+    "tally_stockitem_bom": ("company_id", "name", "IFNULL(component_list_name, '')", "IFNULL(stockitem_name, '')", "IFNULL(godown_name, '')"),
+    "tally_stockitem_standardcost": ("company_id", "name", "IFNULL(date, '')"),
+    "tally_stockitem_standardprice": ("company_id", "name", "IFNULL(date, '')"),
+    "tally_stockitem_batchdetails": ("company_id", "name", "IFNULL(godown_name, '')", "IFNULL(batch_name, '')"),
+    "tally_voucher_ledger_entries": ("company_id", "voucher_guid", "line_no"),
+    "tally_voucher_inventory_entries": ("company_id", "voucher_guid", "line_no"),
+    "tally_voucher_bill_allocations": ("company_id", "voucher_guid", "line_no"),
+}
+
+def ensure_upsert_key(table_name):
+    """Creates the UNIQUE index behind UPSERT_KEYS[table_name], first dropping duplicate rows
+    (keeping the newest) that INSERT OR REPLACE left behind in older databases."""
+    index_name = f"uq_{table_name}_key"
+    exists = execute_query("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,), fetch_one=True)
+    if exists:
+        return
+    key_sql = ", ".join(UPSERT_KEYS[table_name])
+    removed = execute_query(
+        f"DELETE FROM `{table_name}` WHERE id NOT IN (SELECT MAX(id) FROM `{table_name}` GROUP BY {key_sql})",
+        commit=True
+    )
+    if removed:
+        logger.info(f"Removed {removed} duplicate rows from '{table_name}'.")
+    if execute_query(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON `{table_name}` ({key_sql});", commit=True) is None:
+        logger.error(f"Failed to create upsert key index for '{table_name}'.")
+
 # --- Table Creation Functions ---
 def create_companies_table():
     """Creates the companies table if it doesn't exist."""
@@ -92,8 +142,6 @@ def create_companies_table():
                 logger.info("Added 'updated_timestamp' column to companies table.")
         except Exception as e:
             logger.error(f"Could not get table info for companies: {e}")
-        finally:
-            conn_check.close()
     else:
         logger.error("Cannot check columns for companies table.")
     
@@ -115,7 +163,8 @@ def create_tally_accounting_groups_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_accounting_groups (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
+        company_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
         parent TEXT,
         is_subledger BOOLEAN,
         is_addable BOOLEAN,
@@ -123,14 +172,15 @@ def create_tally_accounting_groups_table():
         addl_alloctype TEXT,
         master_id INTEGER,
         alter_id INTEGER,
-        last_synced_timestamp DATETIME NOT NULL
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, name),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_accounting_groups'.")
     else:
         logger.debug("Successfully created/verified 'tally_accounting_groups' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_accgroup_name ON tally_accounting_groups (name);", commit=True)
 
 def create_tally_ledgers_table():
     """Creates the tally_ledgers table if it doesn't exist."""
@@ -138,7 +188,8 @@ def create_tally_ledgers_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_ledgers (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        tally_guid TEXT UNIQUE NOT NULL,
+        company_id INTEGER NOT NULL,
+        tally_guid TEXT NOT NULL,
         tally_name TEXT NOT NULL,
         parent_name TEXT,
         currency_name TEXT,
@@ -149,15 +200,19 @@ def create_tally_ledgers_table():
         is_cost_centres_on BOOLEAN,
         gst_registration_type TEXT,
         party_gstin TEXT,
-        last_synced_timestamp DATETIME NOT NULL
+        master_id INTEGER,
+        alter_id INTEGER,
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, tally_guid),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_ledgers'.")
     else:
         logger.debug("Successfully created/verified 'tally_ledgers' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_ledger_guid ON tally_ledgers (tally_guid);", commit=True)
-    execute_query("CREATE INDEX IF NOT EXISTS idx_ledger_name ON tally_ledgers (tally_name);", commit=True)
+    add_missing_columns("tally_ledgers", {"master_id": "INTEGER", "alter_id": "INTEGER"})
+    execute_query("CREATE INDEX IF NOT EXISTS idx_ledger_name ON tally_ledgers (company_id, tally_name);", commit=True)
 
 def create_tally_ledgerbillwise_table():
     """Creates the tally_ledgerbillwise table if it doesn't exist."""
@@ -165,6 +220,7 @@ def create_tally_ledgerbillwise_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_ledgerbillwise (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company_id INTEGER NOT NULL,
         ledger_guid TEXT,
         name TEXT,
         billdate TEXT,
@@ -172,14 +228,16 @@ def create_tally_ledgerbillwise_table():
         isadvance BOOLEAN,
         openingbalance REAL,
         last_synced_timestamp DATETIME NOT NULL,
-        FOREIGN KEY (ledger_guid) REFERENCES tally_ledgers(tally_guid)
+        FOREIGN KEY (company_id, ledger_guid) REFERENCES tally_ledgers(company_id, tally_guid),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_ledgerbillwise'.")
     else:
         logger.debug("Successfully created/verified 'tally_ledgerbillwise' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_ledgerbillwise_name ON tally_ledgerbillwise (name);", commit=True)
+    execute_query("CREATE INDEX IF NOT EXISTS idx_ledgerbillwise_name ON tally_ledgerbillwise (company_id, name);", commit=True)
+    ensure_upsert_key("tally_ledgerbillwise")
 
 def create_tally_costcategory_table():
     """Creates the tally_costcategory table if it doesn't exist."""
@@ -187,19 +245,21 @@ def create_tally_costcategory_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_costcategory (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
+        company_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
         allocate_revenue BOOLEAN,
         allocate_nonrevenue BOOLEAN,
         master_id INTEGER,
         alter_id INTEGER,
-        last_synced_timestamp DATETIME NOT NULL
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, name),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_costcategory'.")
     else:
         logger.debug("Successfully created/verified 'tally_costcategory' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_costcategory_name ON tally_costcategory (name);", commit=True)
 
 def create_tally_costcenter_table():
     """Creates the tally_costcenter table if it doesn't exist."""
@@ -207,21 +267,23 @@ def create_tally_costcenter_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_costcenter (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
+        company_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
         category TEXT,
         parent TEXT,
         revenue_ledger_for_opbal TEXT,
         email_id TEXT,
         master_id INTEGER,
         alter_id INTEGER,
-        last_synced_timestamp DATETIME NOT NULL
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, name),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_costcenter'.")
     else:
         logger.debug("Successfully created/verified 'tally_costcenter' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_costcenter_name ON tally_costcenter (name);", commit=True)
 
 def create_tally_currency_table():
     """Creates the tally_currency table if it doesn't exist."""
@@ -229,7 +291,8 @@ def create_tally_currency_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_currency (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
+        company_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
         mailing_name TEXT,
         iso_currency_code TEXT,
         decimal_places INTEGER,
@@ -241,14 +304,15 @@ def create_tally_currency_table():
         sort_position INTEGER,
         master_id INTEGER,
         alter_id INTEGER,
-        last_synced_timestamp DATETIME NOT NULL
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, name),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_currency'.")
     else:
         logger.debug("Successfully created/verified 'tally_currency' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_currency_name ON tally_currency (name);", commit=True)
 
 def create_tally_vouchertype_table():
     """Creates the tally_vouchertype table if it doesn't exist."""
@@ -256,7 +320,8 @@ def create_tally_vouchertype_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_vouchertype (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
+        company_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
         parent TEXT,
         additional_name TEXT,
         is_active BOOLEAN,
@@ -277,14 +342,15 @@ def create_tally_vouchertype_table():
         is_default_alloc_enabled BOOLEAN,
         master_id INTEGER,
         alter_id INTEGER,
-        last_synced_timestamp DATETIME NOT NULL
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, name),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_vouchertype'.")
     else:
         logger.debug("Successfully created/verified 'tally_vouchertype' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_vouchertype_name ON tally_vouchertype (name);", commit=True)
 
 def create_tally_stock_groups_table():
     """Creates the tally_stock_groups table if it doesn't exist."""
@@ -292,21 +358,23 @@ def create_tally_stock_groups_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_stock_groups (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        tally_guid TEXT UNIQUE NOT NULL,
+        company_id INTEGER NOT NULL,
+        tally_guid TEXT NOT NULL,
         tally_name TEXT NOT NULL,
         parent_name TEXT,
         is_addable BOOLEAN,
         master_id INTEGER,
         alter_id INTEGER,
-        last_synced_timestamp DATETIME NOT NULL
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, tally_guid),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_stock_groups'.")
     else:
         logger.debug("Successfully created/verified 'tally_stock_groups' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_stockgroup_guid ON tally_stock_groups (tally_guid);", commit=True)
-    execute_query("CREATE INDEX IF NOT EXISTS idx_stockgroup_name ON tally_stock_groups (tally_name);", commit=True)
+    execute_query("CREATE INDEX IF NOT EXISTS idx_stockgroup_name ON tally_stock_groups (company_id, tally_name);", commit=True)
 
 def create_tally_stock_items_table():
     """Creates the tally_stock_items table if it doesn't exist."""
@@ -314,7 +382,8 @@ def create_tally_stock_items_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_stock_items (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        tally_guid TEXT UNIQUE NOT NULL,
+        company_id INTEGER NOT NULL,
+        tally_guid TEXT NOT NULL,
         tally_name TEXT NOT NULL,
         parent_name TEXT,
         category_name TEXT,
@@ -328,15 +397,19 @@ def create_tally_stock_items_table():
         closing_balance REAL,
         closing_rate REAL,
         closing_value REAL,
-        last_synced_timestamp DATETIME NOT NULL
+        master_id INTEGER,
+        alter_id INTEGER,
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, tally_guid),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_stock_items'.")
     else:
         logger.debug("Successfully created/verified 'tally_stock_items' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_stockitem_guid ON tally_stock_items (tally_guid);", commit=True)
-    execute_query("CREATE INDEX IF NOT EXISTS idx_stockitem_name ON tally_stock_items (tally_name);", commit=True)
+    add_missing_columns("tally_stock_items", {"master_id": "INTEGER", "alter_id": "INTEGER"})
+    execute_query("CREATE INDEX IF NOT EXISTS idx_stockitem_name ON tally_stock_items (company_id, tally_name);", commit=True)
 
 def create_tally_units_table():
     """Creates the tally_units table if it doesn't exist."""
@@ -344,7 +417,8 @@ def create_tally_units_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_units (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        tally_guid TEXT UNIQUE NOT NULL,
+        company_id INTEGER NOT NULL,
+        tally_guid TEXT NOT NULL,
         tally_name TEXT NOT NULL,
         original_name TEXT,
         base_units TEXT,
@@ -354,14 +428,15 @@ def create_tally_units_table():
         is_simple_unit BOOLEAN,
         master_id INTEGER,
         alter_id INTEGER,
-        last_synced_timestamp DATETIME NOT NULL
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, tally_guid),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_units'.")
     else:
         logger.debug("Successfully created/verified 'tally_units' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_unit_guid ON tally_units (tally_guid);", commit=True)
 
 def create_tally_stockgroupwithgst_table():
     """Creates the tally_stockgroupwithgst table if it doesn't exist."""
@@ -369,7 +444,8 @@ def create_tally_stockgroupwithgst_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_stockgroupwithgst (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
+        company_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
         parent TEXT,
         is_addable BOOLEAN,
         master_id INTEGER,
@@ -385,14 +461,15 @@ def create_tally_stockgroupwithgst_table():
         is_non_gst_goods BOOLEAN,
         gst_ineligible_itc BOOLEAN,
         last_synced_timestamp DATETIME NOT NULL,
-        FOREIGN KEY (name) REFERENCES tally_stock_groups(tally_guid)
+        FOREIGN KEY (company_id, name) REFERENCES tally_stock_groups(company_id, tally_guid),
+        UNIQUE (company_id, name),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_stockgroupwithgst'.")
     else:
         logger.debug("Successfully created/verified 'tally_stockgroupwithgst' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_stockgroupwithgst_name ON tally_stockgroupwithgst (name);", commit=True)
 
 def create_tally_stockcategory_table():
     """Creates the tally_stockcategory table if it doesn't exist."""
@@ -400,18 +477,20 @@ def create_tally_stockcategory_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_stockcategory (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
+        company_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
         parent TEXT,
         master_id INTEGER,
         alter_id INTEGER,
-        last_synced_timestamp DATETIME NOT NULL
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, name),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_stockcategory'.")
     else:
         logger.debug("Successfully created/verified 'tally_stockcategory' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_stockcategory_name ON tally_stockcategory (name);", commit=True)
 
 def create_tally_godown_table():
     """Creates the tally_godown table if it doesn't exist."""
@@ -419,7 +498,8 @@ def create_tally_godown_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_godown (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
+        company_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
         parent TEXT,
         has_no_space BOOLEAN,
         is_internal BOOLEAN,
@@ -427,14 +507,15 @@ def create_tally_godown_table():
         address TEXT,
         master_id INTEGER,
         alter_id INTEGER,
-        last_synced_timestamp DATETIME NOT NULL
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, name),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_godown'.")
     else:
         logger.debug("Successfully created/verified 'tally_godown' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_godown_name ON tally_godown (name);", commit=True)
 
 def create_tally_stockitem_gst_table():
     """Creates the tally_stockitem_gst table if it doesn't exist."""
@@ -442,7 +523,8 @@ def create_tally_stockitem_gst_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_stockitem_gst (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT UNIQUE NOT NULL,
+        company_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
         master_id INTEGER,
         alter_id INTEGER,
         gst_rate_duty_head TEXT,
@@ -456,14 +538,15 @@ def create_tally_stockitem_gst_table():
         is_non_gst_goods BOOLEAN,
         gst_ineligible_itc BOOLEAN,
         last_synced_timestamp DATETIME NOT NULL,
-        FOREIGN KEY (name) REFERENCES tally_stock_items(tally_guid)
+        FOREIGN KEY (company_id, name) REFERENCES tally_stock_items(company_id, tally_guid),
+        UNIQUE (company_id, name),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_stockitem_gst'.")
     else:
         logger.debug("Successfully created/verified 'tally_stockitem_gst' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_stockitem_gst_name ON tally_stockitem_gst (name);", commit=True)
 
 def create_tally_stockitem_mrp_table():
     """Creates the tally_stockitem_mrp table if it doesn't exist."""
@@ -471,6 +554,7 @@ def create_tally_stockitem_mrp_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_stockitem_mrp (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company_id INTEGER NOT NULL,
         name TEXT NOT NULL,
         master_id INTEGER,
         alter_id INTEGER,
@@ -478,14 +562,15 @@ def create_tally_stockitem_mrp_table():
         state_name TEXT,
         mrp_rate REAL,
         last_synced_timestamp DATETIME NOT NULL,
-        FOREIGN KEY (name) REFERENCES tally_stock_items(tally_guid)
+        FOREIGN KEY (company_id, name) REFERENCES tally_stock_items(company_id, tally_guid),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_stockitem_mrp'.")
     else:
         logger.debug("Successfully created/verified 'tally_stockitem_mrp' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_stockitem_mrp_name ON tally_stockitem_mrp (name);", commit=True)
+    ensure_upsert_key("tally_stockitem_mrp")
 
 def create_tally_stockitem_bom_table():
     """Creates the tally_stockitem_bom table if it doesn't exist."""
@@ -493,6 +578,7 @@ def create_tally_stockitem_bom_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_stockitem_bom (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company_id INTEGER NOT NULL,
         name TEXT NOT NULL,
         master_id INTEGER,
         alter_id INTEGER,
@@ -503,15 +589,16 @@ def create_tally_stockitem_bom_table():
         component_list_name TEXT,
         component_basic_qty REAL,
         last_synced_timestamp DATETIME NOT NULL,
-        FOREIGN KEY (name) REFERENCES tally_stock_items(tally_guid),
-        FOREIGN KEY (godown_name) REFERENCES tally_godown(name)
+        FOREIGN KEY (company_id, name) REFERENCES tally_stock_items(company_id, tally_guid),
+        FOREIGN KEY (company_id, godown_name) REFERENCES tally_godown(company_id, name),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_stockitem_bom'.")
     else:
         logger.debug("Successfully created/verified 'tally_stockitem_bom' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_stockitem_bom_name ON tally_stockitem_bom (name);", commit=True)
+    ensure_upsert_key("tally_stockitem_bom")
 
 def create_tally_stockitem_standardcost_table():
     """Creates the tally_stockitem_standardcost table if it doesn't exist."""
@@ -519,20 +606,22 @@ def create_tally_stockitem_standardcost_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_stockitem_standardcost (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company_id INTEGER NOT NULL,
         name TEXT NOT NULL,
         master_id INTEGER,
         alter_id INTEGER,
         date TEXT,
         rate REAL,
         last_synced_timestamp DATETIME NOT NULL,
-        FOREIGN KEY (name) REFERENCES tally_stock_items(tally_guid)
+        FOREIGN KEY (company_id, name) REFERENCES tally_stock_items(company_id, tally_guid),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_stockitem_standardcost'.")
     else:
         logger.debug("Successfully created/verified 'tally_stockitem_standardcost' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_stockitem_standardcost_name ON tally_stockitem_standardcost (name);", commit=True)
+    ensure_upsert_key("tally_stockitem_standardcost")
 
 def create_tally_stockitem_standardprice_table():
     """Creates the tally_stockitem_standardprice table if it doesn't exist."""
@@ -540,20 +629,22 @@ def create_tally_stockitem_standardprice_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_stockitem_standardprice (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company_id INTEGER NOT NULL,
         name TEXT NOT NULL,
         master_id INTEGER,
         alter_id INTEGER,
         date TEXT,
         rate REAL,
         last_synced_timestamp DATETIME NOT NULL,
-        FOREIGN KEY (name) REFERENCES tally_stock_items(tally_guid)
+        FOREIGN KEY (company_id, name) REFERENCES tally_stock_items(company_id, tally_guid),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_stockitem_standardprice'.")
     else:
         logger.debug("Successfully created/verified 'tally_stockitem_standardprice' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_stockitem_standardprice_name ON tally_stockitem_standardprice (name);", commit=True)
+    ensure_upsert_key("tally_stockitem_standardprice")
 
 def create_tally_stockitem_batchdetails_table():
     """Creates the tally_stockitem_batchdetails table if it doesn't exist."""
@@ -561,6 +652,7 @@ def create_tally_stockitem_batchdetails_table():
     sql_create_table = """
     CREATE TABLE IF NOT EXISTS tally_stockitem_batchdetails (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company_id INTEGER NOT NULL,
         name TEXT NOT NULL,
         master_id INTEGER,
         alter_id INTEGER,
@@ -572,15 +664,16 @@ def create_tally_stockitem_batchdetails_table():
         opening_rate REAL,
         expiry_period TEXT,
         last_synced_timestamp DATETIME NOT NULL,
-        FOREIGN KEY (name) REFERENCES tally_stock_items(tally_guid),
-        FOREIGN KEY (godown_name) REFERENCES tally_godown(name)
+        FOREIGN KEY (company_id, name) REFERENCES tally_stock_items(company_id, tally_guid),
+        FOREIGN KEY (company_id, godown_name) REFERENCES tally_godown(company_id, name),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
     )
     """
     if execute_query(sql_create_table, commit=True) is None:
         logger.error("Failed to create/verify 'tally_stockitem_batchdetails'.")
     else:
         logger.debug("Successfully created/verified 'tally_stockitem_batchdetails' table.")
-    execute_query("CREATE INDEX IF NOT EXISTS idx_stockitem_batchdetails_name ON tally_stockitem_batchdetails (name);", commit=True)
+    ensure_upsert_key("tally_stockitem_batchdetails")
 
 
 
@@ -603,14 +696,27 @@ def create_company_log_table():
     else:
         logger.info("Successfully created/verified 'company_log' table.")
 
+def create_sync_state_table():
+    """Creates the sync_state table holding the highest synced AlterID per company and master table."""
+    logger.info("Checking/Creating 'sync_state' table...")
+    sql_create_table = """
+    CREATE TABLE IF NOT EXISTS sync_state (
+        tally_company_number TEXT NOT NULL,
+        table_name TEXT NOT NULL,
+        last_alter_id INTEGER NOT NULL DEFAULT 0,
+        last_synced_timestamp DATETIME,
+        PRIMARY KEY (tally_company_number, table_name)
+    )
+    """
+    if execute_query(sql_create_table, commit=True) is None:
+        logger.error("Failed to create/verify 'sync_state'.")
+    else:
+        logger.debug("Successfully created/verified 'sync_state' table.")
+
 # Include all other table creation functions from the original file...
 
-def create_all_tables():
-    """Creates all database tables."""
-    # Create company tables
-    create_companies_table()
-    create_company_log_table()
-    
+def create_tally_tables():
+    """Creates all company-scoped tally_* master tables."""
     # Create accounting tables
     create_tally_accounting_groups_table()
     create_tally_ledgers_table()
@@ -634,25 +740,372 @@ def create_all_tables():
     create_tally_stockitem_standardprice_table()
     create_tally_stockitem_batchdetails_table()
 
+def create_all_tables():
+    """Creates all database tables."""
+    # Create company tables
+    create_companies_table()
+    create_company_log_table()
+    create_sync_state_table()
+    
+    unscoped_tables = _find_unscoped_tally_tables()
+    if unscoped_tables:
+        migrate_to_company_scoping(unscoped_tables)
+    else:
+        create_tally_tables()
+
+# --- Company Scoping Migration ---
+def _find_unscoped_tally_tables():
+    """Returns existing tally_* tables created before master data was scoped per company."""
+    rows = execute_query(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'tally\\_%' ESCAPE '\\'", fetch_all=True
+    ) or []
+    unscoped = []
+    for row in rows:
+        columns = execute_query(f"PRAGMA table_info({row['name']})", fetch_all=True) or []
+        if not any(col[1].lower() == 'company_id' for col in columns):
+            unscoped.append(row['name'])
+    return unscoped
+
+def migrate_to_company_scoping(unscoped_tables):
+    """Rebuilds pre-company-scoping tally_* tables with company_id and composite keys.
+
+    Old rows can only be attributed when the database holds exactly one company; otherwise they
+    are dropped (with all AlterID watermarks) and the next sync of each company refills them.
+    Runs inside migrate_schema, whose foreign_keys=OFF / legacy_alter_table=ON settings keep
+    the parent renames from rewriting (or tripping) child table FKs.
+    """
+    logger.info(f"Migrating {len(unscoped_tables)} tally_* tables to per-company scoping...")
+    conn = get_db_connection()
+    if conn is None:
+        raise Exception("Cannot migrate tally_* tables: no DB connection.")
+    try:
+        with transaction(raise_errors=True):
+            for table in unscoped_tables:
+                for index in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)).fetchall():
+                    conn.execute(f"DROP INDEX `{index[0]}`")
+                conn.execute(f"ALTER TABLE `{table}` RENAME TO `{table}_unscoped`")
+            create_tally_tables()
+            
+            companies = conn.execute("SELECT id FROM companies").fetchall()
+            company_id = companies[0][0] if len(companies) == 1 else None
+            for table in unscoped_tables:
+                if company_id is not None:
+                    old_columns = {col[1] for col in conn.execute(f"PRAGMA table_info(`{table}_unscoped`)").fetchall()}
+                    columns = [col[1] for col in conn.execute(f"PRAGMA table_info(`{table}`)").fetchall()
+                               if col[1] in old_columns and col[1] != 'company_id']
+                    if columns:
+                        cols_sql = ", ".join(f"`{c}`" for c in columns)
+                        copied = conn.execute(
+                            f"INSERT OR IGNORE INTO `{table}` (company_id, {cols_sql}) SELECT ?, {cols_sql} FROM `{table}_unscoped`",
+                            (company_id,)
+                        ).rowcount
+                        logger.info(f"Migrated {copied} rows of '{table}' to company id {company_id}.")
+                conn.execute(f"DROP TABLE `{table}_unscoped`")
+            if company_id is None:
+                logger.warning(f"{len(companies)} companies in DB: unscoped master data dropped, next syncs are full.")
+                conn.execute("DELETE FROM sync_state")
+    except Exception:
+        logger.exception("Company scoping migration failed; tables left unchanged.")
+        raise
+    logger.info("Company scoping migration complete.")
+
+# --- Orphan Cleanup Support ---
+# (child table, child key column, parent table, parent key column) pairs checked by clean_orphaned_rows
+ORPHAN_CHECKS = [
+    ("tally_stockitem_batchdetails", "name", "tally_stock_items", "tally_guid"),
+    ("tally_stockgroupwithgst", "name", "tally_stock_groups", "tally_guid"),
+]
+
+def create_maintenance_state_table():
+    """Creates the maintenance_state table (last run time per background maintenance task)."""
+    sql = """
+    CREATE TABLE IF NOT EXISTS maintenance_state (
+        task TEXT PRIMARY KEY,
+        last_run_timestamp DATETIME NOT NULL
+    )
+    """
+    execute_query(sql, commit=True)
+
+def add_orphan_cleanup_support():
+    """Migration: maintenance_state plus last_synced_timestamp indexes for incremental orphan cleanup."""
+    create_maintenance_state_table()
+    for child, _, _, _ in ORPHAN_CHECKS:
+        execute_query(f"CREATE INDEX IF NOT EXISTS idx_{child[len('tally_'):]}_synced ON {child} (last_synced_timestamp);", commit=True)
+
+def add_company_log_history_index():
+    """Migration: index for per-company audit history queries ordered by time."""
+    execute_query("CREATE INDEX IF NOT EXISTS idx_company_log_company_time ON company_log (tally_company_number, timestamp);", commit=True)
+
+def create_sync_history_tables():
+    """Migration: sync_runs (one row per company sync) and sync_stage_timings (seconds per master and stage)."""
+    execute_query("""
+    CREATE TABLE IF NOT EXISTS sync_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tally_company_number TEXT NOT NULL,
+        started_timestamp DATETIME NOT NULL,
+        finished_timestamp DATETIME NOT NULL,
+        status TEXT NOT NULL,
+        mode TEXT,
+        parallelism INTEGER,
+        total_seconds REAL NOT NULL,
+        rows_fetched INTEGER NOT NULL DEFAULT 0
+    )
+    """, commit=True)
+    execute_query("""
+    CREATE TABLE IF NOT EXISTS sync_stage_timings (
+        run_id INTEGER NOT NULL,
+        master TEXT NOT NULL,           -- Master name, '' for company-level stages
+        stage TEXT NOT NULL,            -- connect/execute/fetch/convert/write/commit
+        seconds REAL NOT NULL,
+        calls INTEGER NOT NULL,
+        rows INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (run_id, master, stage),
+        FOREIGN KEY (run_id) REFERENCES sync_runs(id) ON DELETE CASCADE
+    )
+    """, commit=True)
+    execute_query("CREATE INDEX IF NOT EXISTS idx_sync_runs_company_time ON sync_runs (tally_company_number, started_timestamp);", commit=True)
+
+# --- Voucher Tables ---
+def create_tally_vouchers_table():
+    """Creates the tally_vouchers table (voucher headers) if it doesn't exist."""
+    logger.info("Checking/Creating 'tally_vouchers' table...")
+    sql_create_table = """
+    CREATE TABLE IF NOT EXISTS tally_vouchers (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company_id INTEGER NOT NULL,
+        tally_guid TEXT NOT NULL,
+        voucher_date TEXT,              -- ISO date (YYYY-MM-DD)
+        voucher_type TEXT,
+        voucher_number TEXT,
+        party_ledger_name TEXT,
+        narration TEXT,
+        reference TEXT,
+        amount REAL,
+        is_cancelled BOOLEAN,
+        is_optional BOOLEAN,
+        is_invoice BOOLEAN,
+        master_id INTEGER,
+        alter_id INTEGER,
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, tally_guid),
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
+    )
+    """
+    if execute_query(sql_create_table, commit=True) is None:
+        logger.error("Failed to create/verify 'tally_vouchers'.")
+    else:
+        logger.debug("Successfully created/verified 'tally_vouchers' table.")
+    execute_query("CREATE INDEX IF NOT EXISTS idx_vouchers_date ON tally_vouchers (company_id, voucher_date);", commit=True)
+    execute_query("CREATE INDEX IF NOT EXISTS idx_vouchers_party ON tally_vouchers (company_id, party_ledger_name);", commit=True)
+
+def create_tally_voucher_ledger_entries_table():
+    """Creates the tally_voucher_ledger_entries table if it doesn't exist."""
+    logger.info("Checking/Creating 'tally_voucher_ledger_entries' table...")
+    sql_create_table = """
+    CREATE TABLE IF NOT EXISTS tally_voucher_ledger_entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company_id INTEGER NOT NULL,
+        voucher_guid TEXT NOT NULL,
+        line_no INTEGER NOT NULL,
+        voucher_date TEXT,
+        ledger_name TEXT,
+        amount REAL,
+        is_deemed_positive BOOLEAN,
+        is_party_ledger BOOLEAN,
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, voucher_guid, line_no),
+        FOREIGN KEY (company_id, voucher_guid) REFERENCES tally_vouchers(company_id, tally_guid) ON DELETE CASCADE,
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
+    )
+    """
+    if execute_query(sql_create_table, commit=True) is None:
+        logger.error("Failed to create/verify 'tally_voucher_ledger_entries'.")
+    else:
+        logger.debug("Successfully created/verified 'tally_voucher_ledger_entries' table.")
+    execute_query("CREATE INDEX IF NOT EXISTS idx_voucher_ledger_entries_ledger ON tally_voucher_ledger_entries (company_id, ledger_name, voucher_date);", commit=True)
+
+def create_tally_voucher_inventory_entries_table():
+    """Creates the tally_voucher_inventory_entries table if it doesn't exist."""
+    logger.info("Checking/Creating 'tally_voucher_inventory_entries' table...")
+    sql_create_table = """
+    CREATE TABLE IF NOT EXISTS tally_voucher_inventory_entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company_id INTEGER NOT NULL,
+        voucher_guid TEXT NOT NULL,
+        line_no INTEGER NOT NULL,
+        voucher_date TEXT,
+        stockitem_name TEXT,
+        actual_qty REAL,
+        billed_qty REAL,
+        rate REAL,
+        amount REAL,
+        is_deemed_positive BOOLEAN,
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, voucher_guid, line_no),
+        FOREIGN KEY (company_id, voucher_guid) REFERENCES tally_vouchers(company_id, tally_guid) ON DELETE CASCADE,
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
+    )
+    """
+    if execute_query(sql_create_table, commit=True) is None:
+        logger.error("Failed to create/verify 'tally_voucher_inventory_entries'.")
+    else:
+        logger.debug("Successfully created/verified 'tally_voucher_inventory_entries' table.")
+    execute_query("CREATE INDEX IF NOT EXISTS idx_voucher_inventory_entries_item ON tally_voucher_inventory_entries (company_id, stockitem_name, voucher_date);", commit=True)
+
+def create_tally_voucher_bill_allocations_table():
+    """Creates the tally_voucher_bill_allocations table if it doesn't exist."""
+    logger.info("Checking/Creating 'tally_voucher_bill_allocations' table...")
+    sql_create_table = """
+    CREATE TABLE IF NOT EXISTS tally_voucher_bill_allocations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        company_id INTEGER NOT NULL,
+        voucher_guid TEXT NOT NULL,
+        line_no INTEGER NOT NULL,
+        voucher_date TEXT,
+        ledger_name TEXT,
+        bill_name TEXT,
+        bill_type TEXT,
+        amount REAL,
+        bill_credit_period TEXT,
+        last_synced_timestamp DATETIME NOT NULL,
+        UNIQUE (company_id, voucher_guid, line_no),
+        FOREIGN KEY (company_id, voucher_guid) REFERENCES tally_vouchers(company_id, tally_guid) ON DELETE CASCADE,
+        FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE
+    )
+    """
+    if execute_query(sql_create_table, commit=True) is None:
+        logger.error("Failed to create/verify 'tally_voucher_bill_allocations'.")
+    else:
+        logger.debug("Successfully created/verified 'tally_voucher_bill_allocations' table.")
+    execute_query("CREATE INDEX IF NOT EXISTS idx_voucher_bill_allocations_bill ON tally_voucher_bill_allocations (company_id, ledger_name, bill_name);", commit=True)
+
+def create_voucher_tables():
+    """Migration: voucher headers plus their ledger entries, inventory entries and bill allocations."""
+    create_tally_vouchers_table()
+    create_tally_voucher_ledger_entries_table()
+    create_tally_voucher_inventory_entries_table()
+    create_tally_voucher_bill_allocations_table()
+
+# --- Sync Checkpoints ---
+def create_sync_checkpoint_tables():
+    """Migration: sync_checkpoints (one per interrupted company sync) and the work items it finished."""
+    execute_query("""
+    CREATE TABLE IF NOT EXISTS sync_checkpoints (
+        tally_company_number TEXT PRIMARY KEY,
+        mode TEXT NOT NULL,                 -- 'incremental' or 'full'
+        company_alter_id INTEGER,           -- Company AlterID when the sync started
+        voucher_max_alter_id INTEGER,       -- Highest voucher AlterID saved by finished pages
+        started_timestamp DATETIME NOT NULL,
+        updated_timestamp DATETIME NOT NULL
+    )
+    """, commit=True)
+    execute_query("""
+    CREATE TABLE IF NOT EXISTS sync_checkpoint_items (
+        tally_company_number TEXT NOT NULL,
+        kind TEXT NOT NULL,                 -- 'master' (table name) or 'voucher_page' (page start date)
+        item TEXT NOT NULL,
+        PRIMARY KEY (tally_company_number, kind, item),
+        FOREIGN KEY (tally_company_number) REFERENCES sync_checkpoints(tally_company_number) ON DELETE CASCADE
+    )
+    """, commit=True)
+
+# --- Schema Versioning ---
+# Ordered (version, description, migration) steps. Never change an applied step; append a new one.
+# Step 1 brings any pre-versioning database (fresh or from an older release) to the current layout.
+MIGRATIONS = [
+    (1, "Company-scoped tally_* tables, sync state and upsert keys", create_all_tables),
+    (2, "Maintenance state and indexes for incremental orphan cleanup", add_orphan_cleanup_support),
+    (3, "Company log history index", add_company_log_history_index),
+    (4, "Sync run history and per-stage timings", create_sync_history_tables),
+    (5, "Voucher, ledger entry, inventory entry and bill allocation tables", create_voucher_tables),
+    (6, "Resumable sync checkpoints", create_sync_checkpoint_tables),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def create_schema_version_table():
+    """Creates the schema_version table if it doesn't exist."""
+    sql = """
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        applied_timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+    execute_query(sql, commit=True)
+
+def get_schema_version():
+    """Returns the highest applied migration version (0 for a new or pre-versioning database)."""
+    conn = get_db_connection()
+    if conn is None:
+        raise Exception("Cannot read schema version: no DB connection.")
+    try:
+        row = conn.execute("SELECT MAX(version) FROM schema_version").fetchone()
+    except sqlite3.OperationalError:
+        return 0  # No schema_version table yet
+    return row[0] or 0
+
+def migrate_schema():
+    """Applies pending MIGRATIONS in one transaction. Returns True if any were applied."""
+    current = get_schema_version()
+    if current >= SCHEMA_VERSION:
+        if current > SCHEMA_VERSION:
+            logger.warning(f"DB schema version {current} is newer than this app ({SCHEMA_VERSION}).")
+        logger.info(f"DB schema is current (version {current}).")
+        return False
+    
+    pending = [m for m in MIGRATIONS if m[0] > current]
+    logger.info(f"Migrating DB schema from version {current} to {SCHEMA_VERSION}...")
+    conn = get_db_connection()
+    # Table rebuilds need FK enforcement off; it can only be switched outside a transaction.
+    conn.execute("PRAGMA foreign_keys = OFF")
+    conn.execute("PRAGMA legacy_alter_table = ON")
+    try:
+        with transaction(raise_errors=True):
+            create_schema_version_table()
+            for version, description, migration in pending:
+                logger.info(f"Applying DB migration {version}: {description}")
+                migration()
+                execute_query("INSERT INTO schema_version (version, description) VALUES (?, ?)",
+                              (version, description), commit=True)
+            violations = conn.execute("PRAGMA foreign_key_check").fetchall()
+            if violations:
+                logger.warning(f"{len(violations)} foreign key violations in existing data after migration.")
+    finally:
+        invalidate_schema_cache()
+        conn.execute("PRAGMA legacy_alter_table = OFF")
+        conn.execute("PRAGMA foreign_keys = ON")
+    logger.info(f"DB schema migrated to version {SCHEMA_VERSION}.")
+    return True
+
 def clean_orphaned_rows():
-    """Removes orphaned rows from child tables."""
+    """Removes child rows whose parent master no longer exists. Returns the number removed.
+
+    Background maintenance, run by the sync worker after a sync rather than at startup. Only
+    rows synced since the previous cleanup are checked (syncs never delete parent masters, so
+    older rows can't have become orphans); each check is a NOT EXISTS probe of the parent's
+    (company_id, key) unique index. The first run checks every row.
+    """
     logger.info("Cleaning orphaned rows from child tables...")
+    started = datetime.datetime.now().isoformat(sep=' ', timespec='seconds')
+    row = execute_query("SELECT last_run_timestamp FROM maintenance_state WHERE task = 'orphan_cleanup'", fetch_one=True)
+    since = row['last_run_timestamp'] if row else ''
     
-    queries = [
-        # Remove orphaned rows from tally_stockitem_batchdetails
-        """
-        DELETE FROM tally_stockitem_batchdetails
-        WHERE name NOT IN (SELECT tally_guid FROM tally_stock_items)
-        """,
-        # Remove orphaned rows from tally_stockgroupwithgst
-        """
-        DELETE FROM tally_stockgroupwithgst
-        WHERE name NOT IN (SELECT tally_guid FROM tally_stock_groups)
-        """
-    ]
-    
-    for query in queries:
-        if execute_query(query, commit=True) is not None:
-            logger.info(f"Orphaned rows cleaned for query: {query[:50]}...")
-        else:
-            logger.error(f"Failed to clean orphaned rows for query: {query[:50]}...")
+    removed_total = 0
+    with transaction():
+        for child, child_key, parent, parent_key in ORPHAN_CHECKS:
+            sql = f"""
+            DELETE FROM {child} AS c
+            WHERE c.last_synced_timestamp >= ?
+              AND NOT EXISTS (SELECT 1 FROM {parent} AS p WHERE p.company_id = c.company_id AND p.{parent_key} = c.{child_key})
+            """
+            removed = execute_query(sql, (since,), commit=True)
+            if removed:
+                logger.info(f"Removed {removed} orphaned rows from '{child}'.")
+                removed_total += removed
+        execute_query(
+            "INSERT INTO maintenance_state (task, last_run_timestamp) VALUES ('orphan_cleanup', ?) "
+            "ON CONFLICT (task) DO UPDATE SET last_run_timestamp = excluded.last_run_timestamp",
+            (started,), commit=True
+        )
+    logger.info(f"Orphan cleanup done ({removed_total} rows removed, checked rows synced since '{since or 'ever'}').")
+    return removed_total
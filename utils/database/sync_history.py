@@ -0,0 +1,50 @@
+"""
+Sync run history for TallyPrimeConnect.
+Persists one sync_runs row per company sync plus its per-master, per-stage timings.
+"""
+
+import logging
+import sqlite3
+from .core import execute_query, transaction
+
+logger = logging.getLogger(__name__)
+
+def save_sync_run(company_number, started, finished, status, total_seconds, stage_rows,
+                  mode=None, parallelism=None, rows_fetched=0):
+    """Records a finished company sync. stage_rows is SyncTimings.rows(). Returns the run id or None."""
+    try:
+        with transaction() as conn:
+            run_id = conn.execute(
+                """INSERT INTO sync_runs (tally_company_number, started_timestamp, finished_timestamp, status,
+                                          mode, parallelism, total_seconds, rows_fetched)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (str(company_number), started, finished, status, mode, parallelism, round(total_seconds, 4), rows_fetched)
+            ).lastrowid
+            conn.executemany(
+                "INSERT INTO sync_stage_timings (run_id, master, stage, seconds, calls, rows) VALUES (?, ?, ?, ?, ?, ?)",
+                [(run_id, master, stage, round(seconds, 4), calls, rows) for master, stage, seconds, calls, rows in stage_rows]
+            )
+    except sqlite3.Error as e:
+        logger.error(f"Failed to record sync run for company {company_number}: {e}")
+        return None
+    logger.debug(f"Recorded sync run {run_id} for company {company_number}.")
+    return run_id
+
+def get_sync_runs(company_number=None, limit=50):
+    """Most recent sync runs (newest first), optionally for one company."""
+    if company_number is None:
+        rows = execute_query("SELECT * FROM sync_runs ORDER BY id DESC LIMIT ?", (int(limit),), fetch_all=True)
+    else:
+        rows = execute_query(
+            "SELECT * FROM sync_runs WHERE tally_company_number = ? ORDER BY started_timestamp DESC, id DESC LIMIT ?",
+            (str(company_number), int(limit)), fetch_all=True
+        )
+    return [dict(row) for row in rows] if rows else []
+
+def get_stage_timings(run_id):
+    """Per-master, per-stage timings of one sync run."""
+    rows = execute_query(
+        "SELECT master, stage, seconds, calls, rows FROM sync_stage_timings WHERE run_id = ? ORDER BY master, stage",
+        (int(run_id),), fetch_all=True
+    )
+    return [dict(row) for row in rows] if rows else []
@@ -0,0 +1,76 @@
+"""
+Voucher data functions for TallyPrimeConnect.
+Handles voucher headers and their ledger entries, inventory entries and bill allocations.
+"""
+
+import logging
+import sqlite3
+from .core import save_masters_bulk, get_company_id, transaction
+
+logger = logging.getLogger(__name__)
+
+# Column order of each table's rows, as saved by the functions below (see ACCOUNTING_COLUMNS).
+VOUCHER_COLUMNS = {
+    "tally_vouchers": (
+        "tally_guid", "voucher_date", "voucher_type", "voucher_number", "party_ledger_name",
+        "narration", "reference", "amount", "is_cancelled", "is_optional", "is_invoice",
+        "master_id", "alter_id"
+    ),
+    "tally_voucher_ledger_entries": (
+        "voucher_guid", "line_no", "voucher_date", "ledger_name", "amount",
+        "is_deemed_positive", "is_party_ledger"
+    ),
+    "tally_voucher_inventory_entries": (
+        "voucher_guid", "line_no", "voucher_date", "stockitem_name", "actual_qty",
+        "billed_qty", "rate", "amount", "is_deemed_positive"
+    ),
+    "tally_voucher_bill_allocations": (
+        "voucher_guid", "line_no", "voucher_date", "ledger_name", "bill_name",
+        "bill_type", "amount", "bill_credit_period"
+    ),
+}
+
+# Tables holding voucher lines: rows keyed by (voucher_guid, line_no)
+VOUCHER_LINE_TABLES = ("tally_voucher_ledger_entries", "tally_voucher_inventory_entries", "tally_voucher_bill_allocations")
+
+def save_vouchers(voucher_data, company_number=None):
+    """Saves a list of voucher headers to the tally_vouchers table."""
+    return save_masters_bulk("tally_vouchers", "tally_guid", voucher_data, VOUCHER_COLUMNS["tally_vouchers"], company_number)
+
+def save_voucher_ledger_entries(entry_data, company_number=None):
+    """Saves a list of voucher ledger entries to the tally_voucher_ledger_entries table."""
+    return save_masters_bulk("tally_voucher_ledger_entries", "voucher_guid", entry_data, VOUCHER_COLUMNS["tally_voucher_ledger_entries"], company_number)
+
+def save_voucher_inventory_entries(entry_data, company_number=None):
+    """Saves a list of voucher inventory entries to the tally_voucher_inventory_entries table."""
+    return save_masters_bulk("tally_voucher_inventory_entries", "voucher_guid", entry_data, VOUCHER_COLUMNS["tally_voucher_inventory_entries"], company_number)
+
+def save_voucher_bill_allocations(allocation_data, company_number=None):
+    """Saves a list of voucher bill allocations to the tally_voucher_bill_allocations table."""
+    return save_masters_bulk("tally_voucher_bill_allocations", "voucher_guid", allocation_data, VOUCHER_COLUMNS["tally_voucher_bill_allocations"], company_number)
+
+def prune_voucher_lines(table_name, company_number, last_line_numbers):
+    """Deletes lines of re-synced vouchers beyond the last line fetched for them.
+
+    last_line_numbers maps voucher GUID -> highest line_no just saved (0 when the voucher has no
+    lines in table_name), so lines removed from an altered voucher in Tally go away here too.
+    Returns the number of rows deleted, or None on error.
+    """
+    if table_name not in VOUCHER_LINE_TABLES:
+        raise ValueError(f"Not a voucher line table: {table_name}")
+    if not last_line_numbers:
+        return 0
+    company_id = get_company_id(company_number)
+    if company_id is None:
+        logger.error(f"Prune '{table_name}' failed: unknown company '{company_number}'.")
+        return None
+    sql = f"DELETE FROM `{table_name}` WHERE company_id = ? AND voucher_guid = ? AND line_no > ?"
+    try:
+        with transaction() as conn:
+            deleted = conn.executemany(sql, [(company_id, guid, last) for guid, last in last_line_numbers.items()]).rowcount
+    except sqlite3.Error as e:
+        logger.exception(f"Prune '{table_name}' failed: {e}")
+        return None
+    if deleted:
+        logger.info(f"Removed {deleted} stale lines from '{table_name}' (company {company_number}).")
+    return deleted
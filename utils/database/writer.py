@@ -0,0 +1,196 @@
+"""
+Background database writer for TallyPrimeConnect.
+A single thread owns the write connection and applies queued write jobs,
+grouping jobs that arrive together into one shared transaction.
+"""
+
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from . import core
+
+logger = logging.getLogger(__name__)
+
+WRITER_BATCH_MAX_JOBS = 200     # Most jobs committed together in one transaction
+WRITER_BATCH_WINDOW = 0.02      # Seconds to wait for more jobs before committing a batch
+
+_STOP = object()
+
+class DBWriter:
+    """Single writer thread draining a queue of write jobs.
+
+    A job is any callable; it runs on the writer thread, so execute_query() and the save_*
+    helpers inside it use the writer's connection. Each job runs in its own savepoint within
+    the batch transaction (a failing job only undoes itself), and its Future resolves once
+    the batch has committed.
+    """
+    def __init__(self, batch_max_jobs=WRITER_BATCH_MAX_JOBS, batch_window=WRITER_BATCH_WINDOW):
+        self.batch_max_jobs = batch_max_jobs
+        self.batch_window = batch_window
+        self._queue = queue.Queue()
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def is_writer_thread(self):
+        return threading.current_thread() is self._thread
+
+    def start(self):
+        if self.is_running:
+            return
+        self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+        self._thread.start()
+        logger.info("DB writer thread started.")
+
+    def stop(self, timeout=10.0):
+        """Applies the jobs already queued, then stops the thread."""
+        if not self.is_running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error("DB writer thread did not stop in time.")
+        else:
+            logger.info("DB writer thread stopped.")
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """Queues fn(*args, **kwargs) for the writer thread and returns its Future."""
+        if not self.is_running:
+            raise RuntimeError("DB writer is not running.")
+        future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+
+    @contextmanager
+    def lease(self):
+        """Lends the writer's connection to the calling thread for a multi-statement unit of work.
+
+        The writer thread waits inside a job while the caller uses its connection, so writes
+        queued meanwhile wait for the lease instead of failing with 'database is locked'.
+        The caller's work becomes a savepoint of the writer's batch, committed on release.
+        """
+        granted = threading.Event()
+        released = threading.Event()
+        lent = {}
+
+        def hold():
+            lent['conn'] = core.get_db_connection()
+            lent['depth'] = core._tx_depth()
+            granted.set()
+            released.wait()
+
+        future = self.submit(hold)
+        while not granted.wait(0.1):
+            if future.done():
+                future.result()  # Re-raises why the lease couldn't start
+                raise RuntimeError("DB writer lease ended before it was granted.")
+        core._thread_local.leased_conn = lent['conn']
+        core._thread_local.tx_depth = lent['depth']
+        try:
+            yield lent['conn']
+        finally:
+            core._thread_local.leased_conn = None
+            core._thread_local.tx_depth = 0
+            released.set()
+        future.result()  # Wait for the commit; raises if it failed
+
+    # --- Writer thread ---
+    def _run(self):
+        try:
+            stopping = False
+            while not stopping:
+                job = self._queue.get()
+                if job is _STOP:
+                    break
+                batch = [job]
+                stopping = self._collect(batch)
+                self._apply(batch)
+        except Exception as e:
+            logger.exception(f"DB writer thread crashed: {e}")
+        finally:
+            self._fail_pending()
+            core.close_db_connection()
+
+    def _collect(self, batch):
+        """Adds jobs arriving within the batch window. Returns True if a stop was requested."""
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.batch_max_jobs:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if job is _STOP:
+                return True
+            batch.append(job)
+        return False
+
+    def _apply(self, batch):
+        outcomes = []
+        try:
+            with core.transaction():
+                for future, fn, args, kwargs in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    try:
+                        with core.transaction():
+                            outcomes.append((future, fn(*args, **kwargs), None))
+                    except Exception as e:
+                        logger.debug(f"DB writer job {getattr(fn, '__name__', fn)} failed: {e}")
+                        outcomes.append((future, None, e))
+        except Exception as e:
+            logger.exception(f"DB writer batch of {len(batch)} jobs failed to commit: {e}")
+            for future, _, _ in outcomes:
+                future.set_exception(e)
+            return
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _fail_pending(self):
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if job is not _STOP and job[0].set_running_or_notify_cancel():
+                job[0].set_exception(RuntimeError("DB writer stopped."))
+
+# --- Module-level service ---
+_writer = DBWriter()
+
+def start_db_writer():
+    """Starts the writer thread; from then on writes from other threads are routed through it."""
+    _writer.start()
+    core._set_db_writer(_writer)
+
+def stop_db_writer():
+    """Flushes queued writes and stops the writer thread (call before closing connections)."""
+    core._set_db_writer(None)
+    _writer.stop()
+
+def submit_write(fn, *args, **kwargs) -> Future:
+    """Runs a write job on the writer thread and returns its Future.
+
+    Without a running writer (or when called from the writer thread itself), the job runs
+    inline in its own unit of work and an already-completed Future is returned.
+    """
+    if _writer.is_running and not _writer.is_writer_thread():
+        return _writer.submit(fn, *args, **kwargs)
+    future = Future()
+    try:
+        with core.transaction():
+            future.set_result(fn(*args, **kwargs))
+    except Exception as e:
+        future.set_exception(e)
+    return future
@@ -0,0 +1,274 @@
+"""
+Fake Tally ODBC driver for offline benchmarking and CI.
+A pyodbc-compatible stand-in (connect/cursor/execute/fetchone/fetchmany/fetchall/description)
+serving deterministic synthetic rows for every collection the odbc_helper fetchers query.
+
+Select it with TALLY_ODBC_DRIVER=fake (odbc_helper then never imports pyodbc). Configuration is
+read from the environment on every connect():
+    TALLY_FAKE_ROWS              Rows per collection: "1000", or with overrides "1000,Ledger=50000,StockItem=20000"
+    TALLY_FAKE_QUERY_LATENCY_MS  Delay per execute() (default 0)
+    TALLY_FAKE_ROW_LATENCY_US    Delay per row fetched (default 0)
+    TALLY_FAKE_COMPANY           Company name returned for the loaded company (default "Fake Company")
+
+Vouchers are spread over one year of books from FAKE_BOOKS_FROM (voucher i is dated day i % 365),
+and each has a fixed number of lines in the voucher line collections. Queries may filter with
+"$ALTERID > n" and "$Date >= 'd-Mon-yyyy' AND $Date <= 'd-Mon-yyyy'" (ANDed, as odbc_helper sends them).
+"""
+
+import os
+import re
+import time
+import datetime
+import logging
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ROWS = 1000
+DEFAULT_COMPANY = "Fake Company"
+
+# Collections queried by odbc_helper (lower-case)
+_KNOWN_COLLECTIONS = {
+    "ledger", "stockitem", "stockgroup", "unit", "group", "ledgerbillwise", "costcategory",
+    "costcenter", "currency", "vouchertype", "stockgroupgst", "stockcategory", "godown",
+    "stockitemgst", "stockitemmrp", "stockitembom", "stockitemstandardcost",
+    "stockitemstandardprice", "stockitembatchdetails", "voucher",
+}
+
+# Voucher line collections -> lines per voucher; their row count follows the Voucher collection
+_VOUCHER_LINE_COLLECTIONS = {"voucherledgerentries": 2, "voucherinventoryentries": 1, "voucherbillallocations": 1}
+FAKE_BOOKS_FROM = datetime.date(2024, 4, 1)
+_VOUCHER_DAYS = 365
+
+# Single-row collections (company details, license info)
+_SINGLE_ROW_COLLECTIONS = {"hsp_cmpscreenncoll", "hsptallylicensecoll"}
+
+# Child collections whose key columns must point at rows of a parent collection, matching the
+# foreign keys of the tally_* tables: column -> (parent collection, "guid" or "name").
+_STOCK_ITEM_CHILD = {"name": ("StockItem", "guid"), "godownname": ("Godown", "name")}
+_REFERENCES = {
+    "ledgerbillwise": {"ledname": ("Ledger", "guid")},
+    "stockgroupgst": {"name": ("StockGroup", "guid")},
+    "stockitemgst": _STOCK_ITEM_CHILD,
+    "stockitemmrp": _STOCK_ITEM_CHILD,
+    "stockitembom": {**_STOCK_ITEM_CHILD, "stockitemname": ("StockItem", "name")},
+    "stockitemstandardcost": _STOCK_ITEM_CHILD,
+    "stockitemstandardprice": _STOCK_ITEM_CHILD,
+    "stockitembatchdetails": _STOCK_ITEM_CHILD,
+}
+
+_QUERY_RE = re.compile(r"^\s*SELECT\s+(?P<cols>.+?)\s+FROM\s+(?P<coll>\w+)(?:\s+WHERE\s+(?P<where>.+?))?\s*$",
+                       re.IGNORECASE | re.DOTALL)
+_CONDITION_RE = re.compile(r"^\$(?P<field>ALTERID|Date)\s*(?P<op>>=|<=|>)\s*(?P<value>\d+|'[^']*')$", re.IGNORECASE)
+_MONTHS = {m: i + 1 for i, m in enumerate(("jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"))}
+
+class Error(Exception):
+    """pyodbc-style error: args are (sqlstate, message)."""
+
+class FakeConfig:
+    """Row counts and latency of the fake driver."""
+    def __init__(self, rows=DEFAULT_ROWS, row_overrides=None, query_latency=0.0, row_latency=0.0, company=DEFAULT_COMPANY):
+        self.rows = rows
+        self.row_overrides = {k.lower(): v for k, v in (row_overrides or {}).items()}
+        self.query_latency = query_latency
+        self.row_latency = row_latency
+        self.company = company
+
+    @classmethod
+    def from_env(cls):
+        rows, overrides = DEFAULT_ROWS, {}
+        for part in filter(None, (p.strip() for p in os.environ.get("TALLY_FAKE_ROWS", "").split(","))):
+            if "=" in part:
+                name, count = part.split("=", 1)
+                overrides[name.strip()] = int(count)
+            else:
+                rows = int(part)
+        return cls(
+            rows=rows, row_overrides=overrides,
+            query_latency=float(os.environ.get("TALLY_FAKE_QUERY_LATENCY_MS", 0)) / 1000.0,
+            row_latency=float(os.environ.get("TALLY_FAKE_ROW_LATENCY_US", 0)) / 1_000_000.0,
+            company=os.environ.get("TALLY_FAKE_COMPANY", DEFAULT_COMPANY),
+        )
+
+    def row_count(self, collection):
+        collection = collection.lower()
+        if collection in _SINGLE_ROW_COLLECTIONS:
+            return 1
+        if collection in _VOUCHER_LINE_COLLECTIONS:
+            return self.row_count("voucher") * _VOUCHER_LINE_COLLECTIONS[collection]
+        return self.row_overrides.get(collection, self.rows)
+
+def _parse_where(where):
+    """Returns (since AlterID, first day offset, last day offset) from a WHERE clause."""
+    since, first_day, last_day = 0, 0, _VOUCHER_DAYS - 1
+    for condition in filter(None, (c.strip() for c in re.split(r"\s+AND\s+", where or "", flags=re.IGNORECASE))):
+        match = _CONDITION_RE.match(condition)
+        if not match:
+            raise Error("42000", f"[Fake Tally ODBC] Unsupported condition: {condition}")
+        field, op, value = match.group("field").lower(), match.group("op"), match.group("value")
+        if field == "alterid":
+            since = int(value)
+            continue
+        try:
+            day, month, year = value.strip("'").split("-")
+            days = (datetime.date(int(year), _MONTHS[month.lower()], int(day)) - FAKE_BOOKS_FROM).days
+        except (ValueError, KeyError):
+            raise Error("22007", f"[Fake Tally ODBC] Invalid date literal: {value}")
+        if op == ">=":
+            first_day = max(first_day, days)
+        else:
+            last_day = min(last_day, days)
+    return since, first_day, last_day
+
+def _row_indexes(collection, count, since, first_day, last_day):
+    """Indexes of the rows a query returns, in AlterID order within each day."""
+    collection = collection.lower()
+    if collection != "voucher" and collection not in _VOUCHER_LINE_COLLECTIONS:
+        return iter(range(min(since, count), count))  # AlterID of row i is i + 1
+    lines = _VOUCHER_LINE_COLLECTIONS.get(collection, 1)
+    vouchers = count // lines
+
+    def indexes():
+        # Voucher v is dated day v % _VOUCHER_DAYS and has AlterID v + 1; its lines share both
+        for base in range(0, vouchers, _VOUCHER_DAYS):
+            for day in range(first_day, last_day + 1):
+                v = base + day
+                if v >= vouchers:
+                    break
+                if v + 1 > since:
+                    yield from range(v * lines, v * lines + lines)
+    return indexes()
+
+# --- Value generation ---
+def _guid(collection, i):
+    return f"fake-{collection.lower()}-{i:08d}"
+
+def _name(collection, i):
+    return f"{collection} {i}"
+
+def _column_generator(collection, column, position, config):
+    """Returns f(i) producing the value of `column` for row i of `collection`.
+
+    Values are strings like Tally returns; numeric-looking ones convert cleanly to INTEGER, REAL,
+    BOOLEAN and TEXT, and date-like columns use Tally's YYYYMMDD format.
+    """
+    col = column.strip("$").lower()
+    if collection.lower() == "voucher" or collection.lower() in _VOUCHER_LINE_COLLECTIONS:
+        voucher_generator = _voucher_column_generator(collection.lower(), col, position, config)
+        if voucher_generator:
+            return voucher_generator
+    ref = _REFERENCES.get(collection.lower(), {}).get(col)
+    if ref:
+        parent, kind = ref
+        count = max(1, config.row_count(parent))
+        make = _guid if kind == "guid" else _name
+        return lambda i: make(parent, i % count)
+    if col in ("masterid", "alterid"):
+        if collection.lower() == "hsp_cmpscreenncoll":
+            # Tally numbers AlterIDs company-wide, so the company's last AlterID grows with every
+            # object added to any collection (and is at least the highest AlterID of any of them)
+            last_alter_id = sum(config.row_count(c) for c in _KNOWN_COLLECTIONS)
+            return lambda i: last_alter_id
+        return lambda i: i + 1
+    if col == "guid":
+        return lambda i: _guid(collection, i)
+    if col == "name":
+        if collection.lower() == "hsp_cmpscreenncoll":
+            return lambda i: config.company
+        return lambda i: _name(collection, i)
+    if "date" in col or col in ("startingfrom", "booksfrom", "applicablefrom", "mfdon"):
+        return lambda i: "20240401"
+    return lambda i: str((i * 7 + position) % 100)
+
+def _voucher_column_generator(collection, col, position, config):
+    """Generators for the columns voucher collections derive from the voucher (None: use the defaults)."""
+    lines = _VOUCHER_LINE_COLLECTIONS.get(collection, 1)
+    if col == "date":
+        return lambda i: (FAKE_BOOKS_FROM + datetime.timedelta(days=(i // lines) % _VOUCHER_DAYS)).strftime("%Y%m%d")
+    if col in ("alterid", "masterid"):
+        return lambda i: i // lines + 1
+    if col in ("guid", "voucherguid"):
+        return lambda i: _guid("Voucher", i // lines)
+    if col == "lineno":
+        return lambda i: i % lines + 1
+    if col in ("ledgername", "partyledgername"):
+        count = max(1, config.row_count("Ledger"))
+        return lambda i: _name("Ledger", i % count)
+    if col == "stockitemname":
+        count = max(1, config.row_count("StockItem"))
+        return lambda i: _name("StockItem", i % count)
+    if col in ("voucherno", "vouchernumber"):
+        return lambda i: str(i // lines + 1)
+    return None
+
+# --- pyodbc-compatible objects ---
+class Cursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = -1
+        self._rows = iter(())
+
+    def settimeout(self, timeout):
+        pass
+
+    def execute(self, query, params=()):
+        self.connection._check_open()
+        match = _QUERY_RE.match(query)
+        if not match:
+            raise Error("42000", f"[Fake Tally ODBC] Unsupported query: {query[:100]}")
+        collection = match.group("coll")
+        if collection.lower() not in _SINGLE_ROW_COLLECTIONS | _KNOWN_COLLECTIONS | _VOUCHER_LINE_COLLECTIONS.keys():
+            raise Error("42S02", f"[Fake Tally ODBC] Unknown collection: {collection}")
+        config = self.connection.config
+        columns = [c.strip() for c in match.group("cols").split(",")]
+        generators = [_column_generator(collection, c, pos, config) for pos, c in enumerate(columns)]
+        since, first_day, last_day = _parse_where(match.group("where"))
+        count = config.row_count(collection)
+        if config.query_latency:
+            time.sleep(config.query_latency)
+        self.description = [(c, str, None, None, None, None, True) for c in columns]
+        self._rows = (tuple([g(i) for g in generators]) for i in _row_indexes(collection, count, since, first_day, last_day))
+        return self
+
+    def _take(self, n=None):
+        rows = list(self._rows if n is None else islice(self._rows, n))
+        row_latency = self.connection.config.row_latency
+        if row_latency and rows:
+            time.sleep(row_latency * len(rows))
+        return rows
+
+    def fetchone(self):
+        rows = self._take(1)
+        return rows[0] if rows else None
+
+    def fetchmany(self, size=1):
+        return self._take(size)
+
+    def fetchall(self):
+        return self._take()
+
+    def close(self):
+        self._rows = iter(())
+
+class Connection:
+    def __init__(self, config):
+        self.config = config
+        self._open = True
+
+    def _check_open(self):
+        if not self._open:
+            raise Error("08003", "[Fake Tally ODBC] Connection is closed")
+
+    def cursor(self):
+        self._check_open()
+        return Cursor(self)
+
+    def close(self):
+        self._open = False
+
+def connect(connection_string="", autocommit=True, timeout=0, **kwargs):
+    """Opens a fake connection; configuration comes from the TALLY_FAKE_* environment variables."""
+    config = FakeConfig.from_env()
+    logger.debug(f"Fake Tally ODBC connect ({connection_string}): {config.rows} rows/collection, overrides {config.row_overrides}")
+    return Connection(config)
@@ -5,6 +5,7 @@ import requests
 import xml.etree.ElementTree as ET
 import logging
 import datetime
+from utils.retry import HTTP_RETRY, RetryPolicy, CircuitOpenError, get_circuit_breaker
 
 logger = logging.getLogger(__name__)
 
@@ -14,8 +15,9 @@ except NameError: BASE_DIR = os.path.dirname(os.getcwd())
 CONFIG_DIR = os.path.join(BASE_DIR, 'config')
 SETTINGS_FILE_PATH = os.path.join(CONFIG_DIR, 'settings.json')
 
-DEFAULT_SETTINGS = { "tally_host": "localhost", "tally_port": "9000" }
+DEFAULT_SETTINGS = { "tally_host": "localhost", "tally_port": "9000", "db_pragma_profile": "tuned", "incremental_sync": True, "sync_parallelism": 1, "sync_vouchers": True, "sync_change_probe": True, "auto_sync_minutes": 0, "auto_sync_company_minutes": {}, "auto_sync_max_concurrent": 1 }
 TALLY_TIMEOUT_STANDARD = 15.0
+TALLY_CHECK_RETRY = RetryPolicy(max_attempts=2, base_delay=0.5, max_delay=1.0) # The user waits on the check
 
 # --- Settings Management ---
 def load_settings() -> dict:
@@ -45,12 +47,21 @@ def save_settings(settings: dict):
     except Exception as e: logger.exception(f"Error saving settings: {e}"); raise
 
 # --- Tally Interaction (HTTP) ---
+def _http_breaker(url: str):
+    """Circuit breaker shared by HTTP calls to one Tally server (see utils.retry)."""
+    return get_circuit_breaker(f"Tally HTTP ({url})")
+
 def check_tally_connection(host: str = 'localhost', port: str = '9000') -> bool:
-    """Checks Tally connection using a simple HTTP GET request."""
+    """Checks Tally connection using a simple HTTP GET request.
+
+    Transient failures are retried once. The check always reaches Tally, even while the circuit
+    breaker is open, and its result closes or re-opens the circuit.
+    """
     if not host or not port: logger.error("check_connection needs host/port."); return False
     url = f'http://{host}:{port}'; logger.info(f"Checking Tally GET at {url}...")
     try:
-        response = requests.get(url, timeout=TALLY_TIMEOUT_STANDARD / 3) # Quick check
+        response = TALLY_CHECK_RETRY.call(requests.get, url, timeout=TALLY_TIMEOUT_STANDARD / 3, # Quick check
+                                          description=f"Tally check ({url})", breaker=_http_breaker(url), bypass_breaker=True)
         logger.debug(f"Tally GET response status: {response.status_code}"); return response.status_code == 200
     except requests.exceptions.RequestException as e: logger.warning(f"Tally check fail: {e}"); return False
     except Exception as e: logger.exception(f"Unexpected check error: {e}"); return False
@@ -76,8 +87,11 @@ def get_tally_companies(host: str = 'localhost', port: str = '9000') -> list[dic
     if not host or not port: logger.error("get_tally_companies needs host/port."); return None
     url = f'http://{host}:{port}'; xml_req = "<ENVELOPE><HEADER><VERSION>1</VERSION><TALLYREQUEST>EXPORT</TALLYREQUEST><TYPE>COLLECTION</TYPE><ID>ListOfCompanies</ID></HEADER><BODY><DESC><STATICVARIABLES><SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT></STATICVARIABLES><TDL><TDLMESSAGE><COLLECTION Name=\"ListOfCompanies\"><TYPE>Company</TYPE><FETCH>Name,CompanyNumber</FETCH></COLLECTION></TDLMESSAGE></TDL></DESC></BODY></ENVELOPE>"
     headers = {'Content-Type': 'application/xml'}; logger.info(f"Fetching company list from {url}...")
-    try:
+    def post():
         response = requests.post(url, data=xml_req.encode('utf-8'), headers=headers, timeout=TALLY_TIMEOUT_STANDARD); response.raise_for_status()
+        return response
+    try:
+        response = HTTP_RETRY.call(post, description=f"Tally company list ({url})", breaker=_http_breaker(url))
         if response.status_code == 200:
             logger.debug("Received OK for company list.");
             # Debug log raw XML if needed:
@@ -87,6 +101,7 @@ def get_tally_companies(host: str = 'localhost', port: str = '9000') -> list[dic
             if companies is None: logger.error("Failed parse company list XML."); return None # Parsing failed
             logger.info(f"Fetched {len(companies)} companies from Tally list."); return companies
         else: logger.error(f"Tally non-200: {response.status_code}"); return None # HTTP error handled by raise_for_status usually
+    except CircuitOpenError as e: logger.warning(f"Company list not fetched: {e}"); return None
     except requests.exceptions.RequestException as e: logger.exception(f"HTTP error fetching company list: {e}"); return None
     except Exception as e: logger.exception(f"Unexpected error fetching companies: {e}"); return None
 
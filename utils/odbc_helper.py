@@ -1,8 +1,15 @@
-import pyodbc
+import os
+import time
 import logging
 import datetime
+if os.environ.get("TALLY_ODBC_DRIVER", "").lower() == "fake":
+    from utils import fake_tally_odbc as pyodbc  # Offline stand-in for benchmarks/CI; see that module
+else:
+    import pyodbc
 # In odbc_helper.py
 from utils.database.schema import COMPANY_DETAIL_COLUMNS
+from utils.sync_timing import record_stage, timed_stage
+from utils.retry import ODBC_RETRY, RetryPolicy, CircuitOpenError, get_circuit_breaker
 
 # --- Setup Logger ---
 logger = logging.getLogger(__name__)
@@ -19,6 +26,7 @@ except ImportError:
 TALLY_ODBC_DSN = "TallyODBC64_9001"  # Verify this DSN name
 ODBC_CONNECT_TIMEOUT = 15
 ODBC_QUERY_TIMEOUT = 60
+ODBC_FETCH_CHUNK_SIZE = 2000  # Rows per fetchmany() when streaming
 
 # --- Field Mapping (COMPANY DETAILS) ---
 COMPANY_FIELD_MAP = {
@@ -56,13 +64,15 @@ LEDGER_FIELD_MAP = {
     "GUID": "tally_guid", "Name": "tally_name", "PARENT": "parent_name", "ISBILLWISEON": "is_billwise_on",
     "OPENINGBALANCE": "opening_balance", "CLOSINGBALANCE": "closing_balance", "CURRENCYNAME": "currency_name",
     "AFFECTSSTOCK": "affects_stock", "ISCOSTCENTRESON": "is_cost_centres_on",
-    "GSTREGISTRATIONTYPE": "gst_registration_type", "PARTYGSTIN": "party_gstin"
+    "GSTREGISTRATIONTYPE": "gst_registration_type", "PARTYGSTIN": "party_gstin",
+    "MasterID": "master_id", "ALTERID": "alter_id"
 }
 LEDGER_FIELD_TYPES = {
     "tally_guid": "TEXT", "tally_name": "TEXT", "parent_name": "TEXT", "is_billwise_on": "BOOLEAN",
     "opening_balance": "REAL", "closing_balance": "REAL", "currency_name": "TEXT",
     "affects_stock": "BOOLEAN", "is_cost_centres_on": "BOOLEAN",
-    "gst_registration_type": "TEXT", "party_gstin": "TEXT"
+    "gst_registration_type": "TEXT", "party_gstin": "TEXT",
+    "master_id": "INTEGER", "alter_id": "INTEGER"
 }
 LEDGER_FIELD_MAP_LOWER = {k.lower(): v for k, v in LEDGER_FIELD_MAP.items()}
 
@@ -72,13 +82,14 @@ STOCK_ITEM_FIELD_MAP = {
     "BASEUNITS": "base_units", "OPENINGBALANCE": "opening_balance", "OPENINGRATE": "opening_rate",
     "OPENINGVALUE": "opening_value", "CLOSINGBALANCE": "closing_balance", "CLOSINGRATE": "closing_rate",
     "CLOSINGVALUE": "closing_value", "GSTAPPLICABLE": "gst_applicable", "GSTTYPEOFSUPPLY": "gst_type_of_supply",
-    "HSNCODE": "hsn_code"
+    "HSNCODE": "hsn_code", "MasterID": "master_id", "ALTERID": "alter_id"
 }
 STOCK_ITEM_FIELD_TYPES = {
     "tally_guid": "TEXT", "tally_name": "TEXT", "parent_name": "TEXT", "category_name": "TEXT",
     "base_units": "TEXT", "opening_balance": "REAL", "opening_rate": "REAL", "opening_value": "REAL",
     "closing_balance": "REAL", "closing_rate": "REAL", "closing_value": "REAL",
-    "gst_applicable": "TEXT", "gst_type_of_supply": "TEXT", "hsn_code": "TEXT"
+    "gst_applicable": "TEXT", "gst_type_of_supply": "TEXT", "hsn_code": "TEXT",
+    "master_id": "INTEGER", "alter_id": "INTEGER"
 }
 STOCK_ITEM_FIELD_MAP_LOWER = {k.lower(): v for k, v in STOCK_ITEM_FIELD_MAP.items()}
 
@@ -324,156 +335,459 @@ STOCK_ITEM_BATCHDETAILS_FIELD_TYPES = {
 }
 STOCK_ITEM_BATCHDETAILS_FIELD_MAP_LOWER = {k.lower(): v for k, v in STOCK_ITEM_BATCHDETAILS_FIELD_MAP.items()}
 
-# --- Conversion Helper ---
-# --- Conversion Helper ---
+# --- Field Mapping (VOUCHERS) ---
+# Voucher lines come from flat TDL collections (one row per ledger entry / inventory entry / bill
+# allocation, walked from each voucher's AllLedgerEntries/AllInventoryEntries), loaded in Tally
+# like HSp_CMPScreennColl. Each line exposes its voucher's GUID, Date and AlterID so the line
+# collections can be paged and filtered exactly like the Voucher collection.
+VOUCHER_FIELD_MAP = {
+    "GUID": "tally_guid", "Date": "voucher_date", "VoucherTypeName": "voucher_type",
+    "VoucherNumber": "voucher_number", "PartyLedgerName": "party_ledger_name",
+    "Narration": "narration", "Reference": "reference", "Amount": "amount",
+    "IsCancelled": "is_cancelled", "IsOptional": "is_optional", "IsInvoice": "is_invoice",
+    "MasterID": "master_id", "ALTERID": "alter_id"
+}
+VOUCHER_FIELD_TYPES = {
+    "tally_guid": "TEXT", "voucher_date": "DATE", "voucher_type": "TEXT", "voucher_number": "TEXT",
+    "party_ledger_name": "TEXT", "narration": "TEXT", "reference": "TEXT", "amount": "REAL",
+    "is_cancelled": "BOOLEAN", "is_optional": "BOOLEAN", "is_invoice": "BOOLEAN",
+    "master_id": "INTEGER", "alter_id": "INTEGER"
+}
+
+VOUCHER_LEDGER_ENTRY_FIELD_MAP = {
+    "VoucherGUID": "voucher_guid", "LineNo": "line_no", "Date": "voucher_date",
+    "LedgerName": "ledger_name", "Amount": "amount",
+    "IsDeemedPositive": "is_deemed_positive", "IsPartyLedger": "is_party_ledger"
+}
+VOUCHER_LEDGER_ENTRY_FIELD_TYPES = {
+    "voucher_guid": "TEXT", "line_no": "INTEGER", "voucher_date": "DATE", "ledger_name": "TEXT",
+    "amount": "REAL", "is_deemed_positive": "BOOLEAN", "is_party_ledger": "BOOLEAN"
+}
+
+VOUCHER_INVENTORY_ENTRY_FIELD_MAP = {
+    "VoucherGUID": "voucher_guid", "LineNo": "line_no", "Date": "voucher_date",
+    "StockItemName": "stockitem_name", "ActualQty": "actual_qty", "BilledQty": "billed_qty",
+    "Rate": "rate", "Amount": "amount", "IsDeemedPositive": "is_deemed_positive"
+}
+VOUCHER_INVENTORY_ENTRY_FIELD_TYPES = {
+    "voucher_guid": "TEXT", "line_no": "INTEGER", "voucher_date": "DATE", "stockitem_name": "TEXT",
+    "actual_qty": "REAL", "billed_qty": "REAL", "rate": "REAL", "amount": "REAL",
+    "is_deemed_positive": "BOOLEAN"
+}
+
+VOUCHER_BILL_ALLOCATION_FIELD_MAP = {
+    "VoucherGUID": "voucher_guid", "LineNo": "line_no", "Date": "voucher_date",
+    "LedgerName": "ledger_name", "BillName": "bill_name", "BillType": "bill_type",
+    "Amount": "amount", "BillCreditPeriod": "bill_credit_period"
+}
+VOUCHER_BILL_ALLOCATION_FIELD_TYPES = {
+    "voucher_guid": "TEXT", "line_no": "INTEGER", "voucher_date": "DATE", "ledger_name": "TEXT",
+    "bill_name": "TEXT", "bill_type": "TEXT", "amount": "REAL", "bill_credit_period": "TEXT"
+}
+
+# --- Conversion Helpers ---
+_TRUE_STRINGS = frozenset(('yes', 'true', '1'))
+
+def _to_bool(value):
+    return str(value).strip().lower() in _TRUE_STRINGS
+
+def _to_date(value):
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return datetime.datetime.strptime(str(value).strip(), '%Y%m%d').date().isoformat()
+
+def _to_text(value):
+    return str(value).strip()
+
+# Target type -> converter. Unknown types (incl. "TEXT NOT NULL" etc.) convert as TEXT.
+_CONVERTERS = {"BOOLEAN": _to_bool, "INTEGER": int, "REAL": float, "DATE": _to_date, "TEXT": _to_text}
+
 def _convert_odbc_value(value, target_type: str):
     """Helper to convert pyodbc values to Python/SQLite types."""
     if value is None:
         return None
     try:
-        if target_type == "BOOLEAN":
-            return str(value).strip().lower() in ['yes', 'true', '1']
-        elif target_type == "INTEGER":
-            return int(value)
-        elif target_type == "REAL":
-            return float(value)
-        elif target_type == "DATE":
-            if isinstance(value, datetime.date):
-                return value.isoformat()
-            return datetime.datetime.strptime(str(value).strip(), '%Y%m%d').date().isoformat()
-        else:  # Default to TEXT
-            return str(value).strip()
+        return _CONVERTERS.get(target_type, _to_text)(value)
     except (ValueError, TypeError) as e:
         logger.warning(f"Conversion error: '{value}' to {target_type}: {e}")
         return None
 
-# --- Base Fetch Function ---
-def _fetch_odbc_data(query: str, params: tuple, field_map: dict, type_map: dict, description: str) -> list[dict] | None:
-    """Generic helper to fetch data via ODBC, map fields, and convert types."""
-    conn = None
-    results = []
-    logger.info(f"ODBC Connect {description} (DSN: {TALLY_ODBC_DSN})...")
-    try:
-        conn = pyodbc.connect(f'DSN={TALLY_ODBC_DSN}', autocommit=True, timeout=ODBC_CONNECT_TIMEOUT)
+def _compile_row_converter(cursor_description, field_map: dict, type_map: dict) -> tuple:
+    """Builds the per-query conversion plan: a tuple of (column index, target key, converter).
+
+    Column-name normalisation and map/type lookups happen once here instead of once per cell.
+    """
+    map_lower = {k.lower(): v for k, v in field_map.items()}
+    plan = []
+    for i, col in enumerate(cursor_description):
+        field_key = map_lower.get(col[0].strip('$').lower())
+        if field_key:
+            plan.append((i, field_key, _CONVERTERS.get(type_map.get(field_key, "TEXT"), _to_text)))
+    return tuple(plan)
+
+def _convert_row_checked(row, plan: tuple) -> dict:
+    """Slow path for rows with a bad value: converts cell by cell, logging failures as None."""
+    item = {}
+    for i, field_key, convert in plan:
+        value = row[i]
+        if value is None:
+            item[field_key] = None
+            continue
+        try:
+            item[field_key] = convert(value)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Conversion error: '{value}' for {field_key}: {e}")
+            item[field_key] = None
+    return item
+
+def _convert_rows(rows, plan: tuple) -> list[dict]:
+    """Converts raw rows with a compiled plan; a row only falls back to the checked path if a value fails."""
+    items = []
+    append = items.append
+    for row in rows:
+        try:
+            append({field_key: (None if (value := row[i]) is None else convert(value)) for i, field_key, convert in plan})
+        except (ValueError, TypeError):
+            append(_convert_row_checked(row, plan))
+    return items
+
+def _always_none(value):
+    return None
+
+def _compile_tuple_converter(cursor_description, field_map: dict, type_map: dict, columns: tuple) -> tuple:
+    """Like _compile_row_converter, but the plan follows `columns` (a table's column order).
+
+    Columns the query doesn't return read cell 0 and convert it to None, keeping the row loop branch-free.
+    """
+    map_lower = {k.lower(): v for k, v in field_map.items()}
+    index_by_key = {}
+    for i, col in enumerate(cursor_description):
+        field_key = map_lower.get(col[0].strip('$').lower())
+        if field_key:
+            index_by_key.setdefault(field_key, i)
+    if not index_by_key:
+        return ()
+    return tuple(
+        (index_by_key[key], key, _CONVERTERS.get(type_map.get(key, "TEXT"), _to_text)) if key in index_by_key
+        else (0, key, _always_none)
+        for key in columns
+    )
+
+def _convert_row_to_tuple_checked(row, plan: tuple) -> tuple:
+    """Slow path of _convert_rows_to_tuples: converts cell by cell, logging failures as None."""
+    values = []
+    for i, field_key, convert in plan:
+        value = row[i]
+        if value is not None:
+            try:
+                value = convert(value)
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Conversion error: '{value}' for {field_key}: {e}")
+                value = None
+        values.append(value)
+    return tuple(values)
+
+def _convert_rows_to_tuples(rows, plan: tuple) -> list[tuple]:
+    """Converts raw rows into tuples in the plan's column order (no per-row dict)."""
+    items = []
+    append = items.append
+    for row in rows:
+        try:
+            append(tuple([None if (value := row[i]) is None else convert(value) for i, _, convert in plan]))
+        except (ValueError, TypeError):
+            append(_convert_row_to_tuple_checked(row, plan))
+    return items
+
+# --- ODBC Session ---
+def _is_connection_error(error: Exception) -> bool:
+    """True for pyodbc errors that mean the connection itself is unusable (SQLSTATE class 08)."""
+    sqlstate = error.args[0] if getattr(error, 'args', None) else ''
+    return isinstance(sqlstate, str) and sqlstate.startswith('08')
+
+class TallyODBCSession:
+    """A Tally ODBC connection shared by every fetch of one company sync.
+
+    Connects lazily on first use and closes deterministically via close() or `with`. Connecting
+    and executing follow retry_policy: transient failures (connection errors, timeouts) are retried
+    with backoff, reconnecting after a connection error, and while the DSN's circuit breaker is
+    open queries fail fast with CircuitOpenError.
+    """
+    def __init__(self, dsn: str = TALLY_ODBC_DSN, retry_policy: RetryPolicy = ODBC_RETRY):
+        self.dsn = dsn
+        self.retry_policy = retry_policy
+        self.breaker = get_circuit_breaker(f"Tally ODBC ({dsn})")
+        self._conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _connect(self):
+        logger.info(f"ODBC Connect (DSN: {self.dsn})...")
+        with timed_stage("connect"):
+            self._conn = pyodbc.connect(f'DSN={self.dsn}', autocommit=True, timeout=ODBC_CONNECT_TIMEOUT)
+        return self._conn
+
+    def _execute_once(self, query: str, params: tuple):
+        conn = self._conn or self._connect()
         cursor = conn.cursor()
         try:
             cursor.settimeout(ODBC_QUERY_TIMEOUT)
         except AttributeError:
             logger.warning("ODBC driver does not support settimeout().")
+        with timed_stage("execute"):
+            cursor.execute(query, params)
+        return cursor
+
+    def _before_retry(self, error: Exception, attempt: int):
+        if _is_connection_error(error):
+            self.reset() # Reconnect on the next attempt
+
+    def execute(self, query: str, params: tuple = ()):
+        """Executes a query and returns its cursor, retrying transient failures (see retry_policy)."""
+        return self.retry_policy.call(self._execute_once, query, params, description=f"ODBC query ({query[:60]}...)",
+                                      breaker=self.breaker, on_retry=self._before_retry)
+
+    def reset(self):
+        """Drops the current connection; the next execute() reconnects."""
+        conn, self._conn = self._conn, None
+        if conn:
+            try:
+                conn.close()
+            except pyodbc.Error as e:
+                logger.debug(f"Ignoring error closing broken ODBC connection: {e}")
+
+    def close(self):
+        if self._conn:
+            try:
+                self._conn.close()
+                logger.debug(f"ODBC session closed (DSN: {self.dsn}).")
+            except pyodbc.Error as e:
+                logger.error(f"Error closing ODBC connection: {e}")
+            finally:
+                self._conn = None
+
+# --- Base Fetch Functions ---
+def _iter_odbc_data(query: str, params: tuple, field_map: dict, type_map: dict, description: str,
+                    since_alter_id: int | None = None, chunk_size: int = ODBC_FETCH_CHUNK_SIZE,
+                    session: TallyODBCSession | None = None, columns: tuple | None = None):
+    """Streams ODBC results: reads rows with fetchmany(chunk_size) and yields each chunk as a list[dict].
+
+    With columns (a table's column order), chunks are list[tuple] in that order instead, ready for
+    save_masters_bulk. Only one chunk of raw and converted rows is held at a time. Errors are logged
+    and re-raised to the consumer. Without a session, a private connection is opened and closed
+    around the query.
+    """
+    own_session = session is None
+    if own_session:
+        session = TallyODBCSession()
+    cursor = None
+    if since_alter_id is not None:
+        joiner = " AND " if " WHERE " in query.upper() else " WHERE "
+        query = f"{query}{joiner}$ALTERID > {int(since_alter_id)}"
+        description = f"{description} (AlterID > {int(since_alter_id)})"
+    try:
         logger.info(f"Executing ODBC query for {description}...")
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
-        logger.info(f"Fetched {len(rows)} rows for {description}.")
-        if rows:
-            colnames = [col[0] for col in cursor.description]
-            map_lower = {k.lower(): v for k, v in field_map.items()}
-            for row in rows:
-                item = {}
-                for i, col_name in enumerate(colnames):
-                    field_key = map_lower.get(col_name.strip('$').lower())
-                    if field_key:
-                        target_type = type_map.get(field_key, "TEXT")
-                        item[field_key] = _convert_odbc_value(row[i], target_type)
-                if item:
-                    results.append(item)
+        cursor = session.execute(query, params)
+        if columns:
+            plan = _compile_tuple_converter(cursor.description, field_map, type_map, columns)
+            convert_rows = _convert_rows_to_tuples
+        else:
+            plan = _compile_row_converter(cursor.description, field_map, type_map)
+            convert_rows = _convert_rows
+        if not plan:
+            logger.warning(f"No mapped columns in ODBC result for {description}.")
+        total = 0
+        while True:
+            started = time.perf_counter()
+            rows = cursor.fetchmany(chunk_size)
+            fetched_at = time.perf_counter()
+            record_stage("fetch", fetched_at - started, len(rows))
+            if not rows:
+                break
+            total += len(rows)
+            chunk = convert_rows(rows, plan) if plan else []
+            record_stage("convert", time.perf_counter() - fetched_at, len(chunk))
+            del rows
+            if chunk:
+                yield chunk
+        logger.info(f"Fetched {total} rows for {description}.")
     except pyodbc.Error as e:
         logger.error(f"ODBC Error {description}: {e}", exc_info=True)
-        return None
+        if _is_connection_error(e):
+            session.reset()  # Let the next fetch on a shared session reconnect
+        raise
+    except CircuitOpenError as e:
+        logger.warning(f"ODBC fetch {description} skipped: {e}")
+        raise
     except Exception as e:
         logger.exception(f"Unexpected error during ODBC fetch {description}: {e}")
-        return None
+        raise
     finally:
-        if conn:
+        if cursor is not None:
             try:
-                conn.close()
-                logger.debug(f"ODBC connection closed ({description}).")
-            except pyodbc.Error as e:
-                logger.error(f"Error closing ODBC connection: {e}")
+                cursor.close()
+            except pyodbc.Error:
+                pass
+        if own_session:
+            session.close()
+
+def _fetch_odbc_data(query: str, params: tuple, field_map: dict, type_map: dict, description: str,
+                     since_alter_id: int | None = None, chunk_size: int | None = None,
+                     session: TallyODBCSession | None = None, columns: tuple | None = None):
+    """Generic helper to fetch data via ODBC, map fields, and convert types.
+
+    since_alter_id restricts the query to objects altered after that AlterID (incremental sync).
+    With chunk_size, returns the _iter_odbc_data generator of row chunks instead of a full list.
+    session reuses an open TallyODBCSession instead of connecting for this query alone.
+    columns returns rows as tuples in that order (see _iter_odbc_data) instead of dicts.
+    """
+    if chunk_size:
+        return _iter_odbc_data(query, params, field_map, type_map, description, since_alter_id, chunk_size, session, columns)
+    results = []
+    try:
+        for chunk in _iter_odbc_data(query, params, field_map, type_map, description, since_alter_id,
+                                     session=session, columns=columns):
+            results.extend(chunk)
+    except Exception:
+        return None  # Already logged by _iter_odbc_data
     return results
-def fetch_ledgers_odbc() -> list[dict] | None:
+
+def probe_altered_since_odbc(collection: str, since_alter_id: int, session: TallyODBCSession | None = None,
+                             date_range: tuple[datetime.date, datetime.date] | None = None) -> bool:
+    """True if the Tally collection holds any object altered after since_alter_id.
+
+    date_range (from_date, to_date) limits the probe to objects dated in it, for date-paged
+    collections like Voucher. Reads at most one row, so it costs a query round trip rather than
+    a fetch of the collection. Errors are raised to the caller.
+    """
+    own_session = session is None
+    if own_session:
+        session = TallyODBCSession()
+    cursor = None
+    try:
+        where = _date_range_clause(*date_range) + " AND" if date_range else " WHERE"
+        cursor = session.execute(f"SELECT $ALTERID FROM {collection}{where} $ALTERID > {int(since_alter_id)}")
+        return cursor.fetchone() is not None
+    except pyodbc.Error as e:
+        if _is_connection_error(e):
+            session.reset()  # Let the next fetch on a shared session reconnect
+        raise
+    finally:
+        if cursor is not None:
+            try:
+                cursor.close()
+            except pyodbc.Error:
+                pass
+        if own_session:
+            session.close()
+
+def fetch_ledgers_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Ledger master data via Tally ODBC."""
     logger.info("Fetching Ledgers via ODBC...")
     return _fetch_odbc_data(
         "SELECT $Name, $Parent, $IsBillwiseOn, $OpeningBalance, $ClosingBalance, "
         "$CurrencyName, $AffectsStock, $IsCostCentresOn, $GSTRegistrationType, "
-        "$PartyGSTIN, $GUID FROM Ledger",
-        (), LEDGER_FIELD_MAP, LEDGER_FIELD_TYPES, "Ledgers"
+        "$PartyGSTIN, $GUID, $MasterID, $ALTERID FROM Ledger",
+        (), LEDGER_FIELD_MAP, LEDGER_FIELD_TYPES, "Ledgers",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
 
-def fetch_stock_items_odbc() -> list[dict] | None:
+def fetch_stock_items_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Stock Items master data via Tally ODBC."""
     logger.info("Fetching Stock Items via ODBC...")
     return _fetch_odbc_data(
         "SELECT $GUID, $Name, $Parent, $Category, $BaseUnits, $OpeningBalance, "
         "$OpeningRate, $OpeningValue, $ClosingBalance, $ClosingRate, "
-        "$ClosingValue, $GSTApplicable, $GSTTypeOfSupply, $HSNCode FROM StockItem",
-        (), STOCK_ITEM_FIELD_MAP, STOCK_ITEM_FIELD_TYPES, "Stock Items"
+        "$ClosingValue, $GSTApplicable, $GSTTypeOfSupply, $HSNCode, $MasterID, $ALTERID FROM StockItem",
+        (), STOCK_ITEM_FIELD_MAP, STOCK_ITEM_FIELD_TYPES, "Stock Items",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_stock_groups_odbc() -> list[dict] | None:
+def fetch_stock_groups_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Stock Groups master data via Tally ODBC."""
     logger.info("Fetching Stock Groups via ODBC...")
     return _fetch_odbc_data(
         "SELECT $GUID, $Name, $Parent, $IsAddable, $MasterID, $ALTERID FROM StockGroup",
-        (), STOCK_GROUP_FIELD_MAP, STOCK_GROUP_FIELD_TYPES, "Stock Groups"
+        (), STOCK_GROUP_FIELD_MAP, STOCK_GROUP_FIELD_TYPES, "Stock Groups",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_units_odbc() -> list[dict] | None:
+def fetch_units_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Units master data via Tally ODBC."""
     logger.info("Fetching Units via ODBC...")
     return _fetch_odbc_data(
         "SELECT $GUID, $NAME, $ORIGINALNAME, $BASEUNITS, $ADDITIONALUNITS, "
         "$CONVERSION, $DecimalPlaces, $ISSIMPLEUNIT, $MasterID, $ALTERID FROM Unit",
-        (), UNIT_FIELD_MAP, UNIT_FIELD_TYPES, "Units"
+        (), UNIT_FIELD_MAP, UNIT_FIELD_TYPES, "Units",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_accounting_groups_odbc() -> list[dict] | None:
+def fetch_accounting_groups_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Accounting Groups master data via Tally ODBC."""
     logger.info("Fetching Accounting Groups via ODBC...")
     return _fetch_odbc_data(
         "SELECT $Name, $PARENT, $ISSUBLEDGER, $ISADDABLE, $BASICGROUPISCALCULABLE, "
         "$ADDLALLOCTYPE, $MasterID, $ALTERID FROM Group",
-        (), ACCOUNTING_GROUP_FIELD_MAP, ACCOUNTING_GROUP_FIELD_TYPES, "Accounting Groups"
+        (), ACCOUNTING_GROUP_FIELD_MAP, ACCOUNTING_GROUP_FIELD_TYPES, "Accounting Groups",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_ledgerbillwise_odbc() -> list[dict] | None:
+def fetch_ledgerbillwise_odbc(chunk_size: int | None = None, session: TallyODBCSession | None = None,
+        columns: tuple | None = None):
     """Fetches Ledger Billwise details via Tally ODBC."""
     logger.info("Fetching Ledger Billwise details via ODBC...")
     return _fetch_odbc_data(
         "SELECT $LEDName, $NAME, $BILLDATE, $BILLCREDITPERIOD, $ISADVANCE, "
         "$OPENINGBALANCE FROM LedgerBillwise",
-        (), LEDGER_BILLWISE_FIELD_MAP, LEDGER_BILLWISE_FIELD_TYPES, "Ledger Billwise"
+        (), LEDGER_BILLWISE_FIELD_MAP, LEDGER_BILLWISE_FIELD_TYPES, "Ledger Billwise",
+        chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_costcategory_odbc() -> list[dict] | None:
+def fetch_costcategory_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Cost Category master data via Tally ODBC."""
     logger.info("Fetching Cost Categories via ODBC...")
     return _fetch_odbc_data(
         "SELECT $Name, $AllocateRevenue, $AllocateNonRevenue, $MasterID, $ALTERID FROM CostCategory",
-        (), COST_CATEGORY_FIELD_MAP, COST_CATEGORY_FIELD_TYPES, "Cost Categories"
+        (), COST_CATEGORY_FIELD_MAP, COST_CATEGORY_FIELD_TYPES, "Cost Categories",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_costcenter_odbc() -> list[dict] | None:
+def fetch_costcenter_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Cost Center master data via Tally ODBC."""
     logger.info("Fetching Cost Centers via ODBC...")
     return _fetch_odbc_data(
         "SELECT $Name, $CATEGORY, $Parent, $RevenueLedForOpBal, $EMailID, "
         "$MasterID, $ALTERID FROM CostCenter",
-        (), COST_CENTER_FIELD_MAP, COST_CENTER_FIELD_TYPES, "Cost Centers"
+        (), COST_CENTER_FIELD_MAP, COST_CENTER_FIELD_TYPES, "Cost Centers",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_currency_odbc() -> list[dict] | None:
+def fetch_currency_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Currency master data via Tally ODBC."""
     logger.info("Fetching Currencies via ODBC...")
     return _fetch_odbc_data(
         "SELECT $Name, $MAILINGNAME, $ISOCurrencyCode, $DECIMALPLACES, $INMILLIONS, "
         "$ISSUFFIX, $HASSPACE, $DECIMALSYMBOL, $DECIMALPLACESFORPRINTING, "
         "$SORTPOSITION, $MasterID, $ALTERID FROM Currency",
-        (), CURRENCY_FIELD_MAP, CURRENCY_FIELD_TYPES, "Currencies"
+        (), CURRENCY_FIELD_MAP, CURRENCY_FIELD_TYPES, "Currencies",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_vouchertype_odbc() -> list[dict] | None:
+def fetch_vouchertype_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Voucher Type master data via Tally ODBC."""
     logger.info("Fetching Voucher Types via ODBC...")
     return _fetch_odbc_data(
@@ -482,10 +796,12 @@ def fetch_vouchertype_odbc() -> list[dict] | None:
         "$FORMALRECEIPT, $ISOPTIONAL, $ASMFGJRNL, $COMMONNARRATION, $MULTINARRATION, "
         "$USEFORPOSINVOICE, $USEFORJOBWORK, $ISFORJOBWORKIN, $ALLOWCONSUMPTION, "
         "$ISDEFAULTALLOCENABLED, $MasterID, $ALTERID FROM VoucherType",
-        (), VOUCHER_TYPE_FIELD_MAP, VOUCHER_TYPE_FIELD_TYPES, "Voucher Types"
+        (), VOUCHER_TYPE_FIELD_MAP, VOUCHER_TYPE_FIELD_TYPES, "Voucher Types",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_stockgroupwithgst_odbc() -> list[dict] | None:
+def fetch_stockgroupwithgst_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Stock Group with GST details via Tally ODBC."""
     logger.info("Fetching Stock Groups with GST via ODBC...")
     return _fetch_odbc_data(
@@ -493,81 +809,157 @@ def fetch_stockgroupwithgst_odbc() -> list[dict] | None:
         "$GSTRATEVALUATIONTYPE, $GSTRATE, $APPLICABLEFROM, $HSNCODE, $HSN, "
         "$TAXABILITY, $ISREVERSECHARGEAPPLICABLE, $ISNONGSTGOODS, "
         "$GSTINELIGIBLEITC FROM StockGroupGST",
-        (), STOCK_GROUP_GST_FIELD_MAP, STOCK_GROUP_GST_FIELD_TYPES, "Stock Groups GST"
+        (), STOCK_GROUP_GST_FIELD_MAP, STOCK_GROUP_GST_FIELD_TYPES, "Stock Groups GST",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_stockcategory_odbc() -> list[dict] | None:
+def fetch_stockcategory_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Stock Category master data via Tally ODBC."""
     logger.info("Fetching Stock Categories via ODBC...")
     return _fetch_odbc_data(
         "SELECT $Name, $Parent, $MasterID, $ALTERID FROM StockCategory",
-        (), STOCK_CATEGORY_FIELD_MAP, STOCK_CATEGORY_FIELD_TYPES, "Stock Categories"
+        (), STOCK_CATEGORY_FIELD_MAP, STOCK_CATEGORY_FIELD_TYPES, "Stock Categories",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_godown_odbc() -> list[dict] | None:
+def fetch_godown_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Godown master data via Tally ODBC."""
     logger.info("Fetching Godowns via ODBC...")
     return _fetch_odbc_data(
         "SELECT $Name, $Parent, $HasNoSpace, $ISINTERNAL, $ISEXTERNAL, "
         "$GDNaddress, $MasterID, $ALTERID FROM Godown",
-        (), GODOWN_FIELD_MAP, GODOWN_FIELD_TYPES, "Godowns"
+        (), GODOWN_FIELD_MAP, GODOWN_FIELD_TYPES, "Godowns",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_stockitem_gst_odbc() -> list[dict] | None:
+def fetch_stockitem_gst_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Stock Item GST details via Tally ODBC."""
     logger.info("Fetching Stock Item GST details via ODBC...")
     return _fetch_odbc_data(
         "SELECT $Name, $MasterID, $ALTERID, $GSTRATEDUTYHEAD, $GSTRATEVALUATIONTYPE, "
         "$GSTRATE, $APPLICABLEFROM, $HSNCODE, $HSN, $TAXABILITY, "
         "$ISREVERSECHARGEAPPLICABLE, $ISNONGSTGOODS, $GSTINELIGIBLEITC FROM StockItemGST",
-        (), STOCK_ITEM_GST_FIELD_MAP, STOCK_ITEM_GST_FIELD_TYPES, "Stock Item GST"
+        (), STOCK_ITEM_GST_FIELD_MAP, STOCK_ITEM_GST_FIELD_TYPES, "Stock Item GST",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_stockitem_mrp_odbc() -> list[dict] | None:
+def fetch_stockitem_mrp_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Stock Item MRP details via Tally ODBC."""
     logger.info("Fetching Stock Item MRP details via ODBC...")
     return _fetch_odbc_data(
         "SELECT $Name, $MasterID, $ALTERID, $FROMDATE, $STATENAME, $MRPRATE FROM StockItemMRP",
-        (), STOCK_ITEM_MRP_FIELD_MAP, STOCK_ITEM_MRP_FIELD_TYPES, "Stock Item MRP"
+        (), STOCK_ITEM_MRP_FIELD_MAP, STOCK_ITEM_MRP_FIELD_TYPES, "Stock Item MRP",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_stockitem_bom_odbc() -> list[dict] | None:
+def fetch_stockitem_bom_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Stock Item BOM details via Tally ODBC."""
     logger.info("Fetching Stock Item BOM details via ODBC...")
     return _fetch_odbc_data(
         "SELECT $Name, $MasterID, $ALTERID, $NATUREOFITEM, $STOCKITEMNAME, "
         "$GODOWNNAME, $ACTUALQTY, $COMPONENTLISTNAME, $COMPONENTBASICQTY FROM StockItemBOM",
-        (), STOCK_ITEM_BOM_FIELD_MAP, STOCK_ITEM_BOM_FIELD_TYPES, "Stock Item BOM"
+        (), STOCK_ITEM_BOM_FIELD_MAP, STOCK_ITEM_BOM_FIELD_TYPES, "Stock Item BOM",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_stockitem_standardcost_odbc() -> list[dict] | None:
+def fetch_stockitem_standardcost_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Stock Item Standard Cost details via Tally ODBC."""
     logger.info("Fetching Stock Item Standard Cost details via ODBC...")
     return _fetch_odbc_data(
         "SELECT $Name, $MasterID, $ALTERID, $SDDATE, $SDRATE FROM StockItemStandardCost",
-        (), STOCK_ITEM_STANDARDCOST_FIELD_MAP, STOCK_ITEM_STANDARDCOST_FIELD_TYPES, "Stock Item Standard Cost"
+        (), STOCK_ITEM_STANDARDCOST_FIELD_MAP, STOCK_ITEM_STANDARDCOST_FIELD_TYPES, "Stock Item Standard Cost",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_stockitem_standardprice_odbc() -> list[dict] | None:
+def fetch_stockitem_standardprice_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Stock Item Standard Price details via Tally ODBC."""
     logger.info("Fetching Stock Item Standard Price details via ODBC...")
     return _fetch_odbc_data(
         "SELECT $Name, $MasterID, $ALTERID, $SPDATE, $SPRATE FROM StockItemStandardPrice",
-        (), STOCK_ITEM_STANDARDPRICE_FIELD_MAP, STOCK_ITEM_STANDARDPRICE_FIELD_TYPES, "Stock Item Standard Price"
+        (), STOCK_ITEM_STANDARDPRICE_FIELD_MAP, STOCK_ITEM_STANDARDPRICE_FIELD_TYPES, "Stock Item Standard Price",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
-def fetch_stockitem_batchdetails_odbc() -> list[dict] | None:
+def fetch_stockitem_batchdetails_odbc(since_alter_id: int | None = None, chunk_size: int | None = None,
+        session: TallyODBCSession | None = None, columns: tuple | None = None):
     """Fetches Stock Item Batch details via Tally ODBC."""
     logger.info("Fetching Stock Item Batch details via ODBC...")
     return _fetch_odbc_data(
         "SELECT $Name, $MasterID, $ALTERID, $MFDON, $GODOWNNAME, $BATCHNAME, "
         "$BOPENINGBALANCE, $BOPENINGVALUE, $BOPENINGRATE, $EXPIRYPERIOD FROM StockItemBatchDetails",
-        (), STOCK_ITEM_BATCHDETAILS_FIELD_MAP, STOCK_ITEM_BATCHDETAILS_FIELD_TYPES, "Stock Item Batch Details"
+        (), STOCK_ITEM_BATCHDETAILS_FIELD_MAP, STOCK_ITEM_BATCHDETAILS_FIELD_TYPES, "Stock Item Batch Details",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
+    )
+
+# --- Voucher Fetch Functions (paged by date range) ---
+_TALLY_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+def _tally_date(value: datetime.date) -> str:
+    """Date literal in Tally's own format (e.g. '1-Apr-2024'), independent of the OS locale."""
+    return f"'{value.day}-{_TALLY_MONTHS[value.month - 1]}-{value.year}'"
+
+def _date_range_clause(from_date: datetime.date, to_date: datetime.date) -> str:
+    return f" WHERE $Date >= {_tally_date(from_date)} AND $Date <= {_tally_date(to_date)}"
+
+def fetch_vouchers_odbc(from_date: datetime.date, to_date: datetime.date, since_alter_id: int | None = None,
+        chunk_size: int | None = None, session: TallyODBCSession | None = None, columns: tuple | None = None):
+    """Fetches voucher headers dated from_date..to_date (inclusive) via Tally ODBC.
+
+    Callers page a company's books through this a month or so at a time, so no single query
+    runs into ODBC_QUERY_TIMEOUT however large the company is.
+    """
+    logger.info(f"Fetching Vouchers {from_date}..{to_date} via ODBC...")
+    return _fetch_odbc_data(
+        "SELECT $GUID, $Date, $VoucherTypeName, $VoucherNumber, $PartyLedgerName, $Narration, "
+        "$Reference, $Amount, $IsCancelled, $IsOptional, $IsInvoice, $MasterID, $ALTERID FROM Voucher"
+        + _date_range_clause(from_date, to_date),
+        (), VOUCHER_FIELD_MAP, VOUCHER_FIELD_TYPES, f"Vouchers {from_date}..{to_date}",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
+    )
+
+def fetch_voucher_ledger_entries_odbc(from_date: datetime.date, to_date: datetime.date, since_alter_id: int | None = None,
+        chunk_size: int | None = None, session: TallyODBCSession | None = None, columns: tuple | None = None):
+    """Fetches ledger entries of vouchers dated from_date..to_date via Tally ODBC."""
+    logger.info(f"Fetching Voucher Ledger Entries {from_date}..{to_date} via ODBC...")
+    return _fetch_odbc_data(
+        "SELECT $VoucherGUID, $LineNo, $Date, $LedgerName, $Amount, $IsDeemedPositive, $IsPartyLedger "
+        "FROM VoucherLedgerEntries" + _date_range_clause(from_date, to_date),
+        (), VOUCHER_LEDGER_ENTRY_FIELD_MAP, VOUCHER_LEDGER_ENTRY_FIELD_TYPES, f"Voucher Ledger Entries {from_date}..{to_date}",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
+    )
+
+def fetch_voucher_inventory_entries_odbc(from_date: datetime.date, to_date: datetime.date, since_alter_id: int | None = None,
+        chunk_size: int | None = None, session: TallyODBCSession | None = None, columns: tuple | None = None):
+    """Fetches inventory entries of vouchers dated from_date..to_date via Tally ODBC."""
+    logger.info(f"Fetching Voucher Inventory Entries {from_date}..{to_date} via ODBC...")
+    return _fetch_odbc_data(
+        "SELECT $VoucherGUID, $LineNo, $Date, $StockItemName, $ActualQty, $BilledQty, $Rate, $Amount, "
+        "$IsDeemedPositive FROM VoucherInventoryEntries" + _date_range_clause(from_date, to_date),
+        (), VOUCHER_INVENTORY_ENTRY_FIELD_MAP, VOUCHER_INVENTORY_ENTRY_FIELD_TYPES, f"Voucher Inventory Entries {from_date}..{to_date}",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
+    )
+
+def fetch_voucher_bill_allocations_odbc(from_date: datetime.date, to_date: datetime.date, since_alter_id: int | None = None,
+        chunk_size: int | None = None, session: TallyODBCSession | None = None, columns: tuple | None = None):
+    """Fetches bill allocations of vouchers dated from_date..to_date via Tally ODBC."""
+    logger.info(f"Fetching Voucher Bill Allocations {from_date}..{to_date} via ODBC...")
+    return _fetch_odbc_data(
+        "SELECT $VoucherGUID, $LineNo, $Date, $LedgerName, $BillName, $BillType, $Amount, $BillCreditPeriod "
+        "FROM VoucherBillAllocations" + _date_range_clause(from_date, to_date),
+        (), VOUCHER_BILL_ALLOCATION_FIELD_MAP, VOUCHER_BILL_ALLOCATION_FIELD_TYPES, f"Voucher Bill Allocations {from_date}..{to_date}",
+        since_alter_id=since_alter_id, chunk_size=chunk_size, session=session, columns=columns
     )
 
 
 # --- Fetch Company Details ---
-def fetch_company_details_odbc(company_number_context: str) -> dict | None:
+def fetch_company_details_odbc(company_number_context: str, session: TallyODBCSession | None = None) -> dict | None:
     """Fetches detailed metadata via Tally ODBC for the *currently loaded* company."""
     select_fields = ", ".join([f"${key}" for key in COMPANY_FIELD_MAP.keys()])
     query = f"SELECT {select_fields} FROM HSp_CMPScreennColl"
@@ -578,7 +970,8 @@ def fetch_company_details_odbc(company_number_context: str) -> dict | None:
             (),
             COMPANY_FIELD_MAP,
             DB_COMPANY_COLUMNS,
-            f"Company Details ({company_number_context})"
+            f"Company Details ({company_number_context})",
+            session=session
         )
         if results:
             logger.info(f"Fetched company details for {company_number_context}.")
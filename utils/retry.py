@@ -0,0 +1,187 @@
+"""
+Retry policies and circuit breakers for calls to Tally (ODBC and HTTP).
+
+A RetryPolicy retries transient failures (see is_transient_error) a bounded number of times with
+exponential backoff and jitter; anything else - a syntax error, a missing collection - is raised at
+once. A CircuitBreaker per Tally endpoint counts consecutive transient failures: once Tally looks
+unresponsive it opens and calls fail fast with CircuitOpenError instead of piling more requests on,
+until a trial call after reset_timeout succeeds. circuit_breakers() lists them for the status bar.
+"""
+
+import logging
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+_SQLSTATE_RE = re.compile(r"^[0-9A-Z]{5}$")
+
+# SQLSTATEs worth retrying: connection errors (class 08) and timeouts. Everything else (syntax
+# errors 42xxx, data errors 22xxx, Tally's general HY000, ...) fails the same way on every attempt.
+TRANSIENT_SQLSTATE_PREFIXES = ("08", "HYT", "40001")
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Tally while its circuit breaker is open."""
+    def __init__(self, breaker, retry_in: float):
+        super().__init__(f"{breaker.name} is not responding; calls paused for {retry_in:.0f}s")
+        self.breaker = breaker
+        self.retry_in = retry_in
+
+def sqlstate_of(error: Exception) -> str | None:
+    """The SQLSTATE of a pyodbc-style error (args[0]), or None."""
+    args = getattr(error, 'args', None)
+    if args and isinstance(args[0], str) and _SQLSTATE_RE.match(args[0]):
+        return args[0]
+    return None
+
+def is_transient_error(error: Exception) -> bool:
+    """True for failures a retry may cure: ODBC connection errors and timeouts, HTTP connection
+    errors, timeouts and 5xx responses, and dropped sockets."""
+    sqlstate = sqlstate_of(error)
+    if sqlstate is not None:
+        return sqlstate.startswith(TRANSIENT_SQLSTATE_PREFIXES)
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = getattr(error, 'response', None)
+        return response is not None and response.status_code >= 500
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+class CircuitBreaker:
+    """Closed -> open after failure_threshold consecutive transient failures; open -> half-open
+    after reset_timeout seconds, letting one trial call through; its success closes the circuit
+    again, its failure re-opens it. Thread-safe."""
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN # Reported as such once a trial call would be let through
+            return self._state
+
+    def retry_in(self) -> float:
+        """Seconds until an open circuit lets a trial call through (0 when not open)."""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def before_call(self):
+        """Raises CircuitOpenError unless a call may go to Tally now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return
+            waited = time.monotonic() - self._opened_at
+            if self._state == self.OPEN and waited >= self.reset_timeout:
+                self._state = self.HALF_OPEN
+                self._trial_running = False
+            if self._state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                logger.info(f"Circuit '{self.name}' half-open: trying one call.")
+                return
+            retry_in = max(0.0, self.reset_timeout - waited) if self._state == self.OPEN else self.reset_timeout
+        raise CircuitOpenError(self, retry_in)
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info(f"Circuit '{self.name}' closed: Tally is responding again.")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                logger.warning(f"Circuit '{self.name}' open after {self._failures} consecutive failures; "
+                               f"pausing calls for {self.reset_timeout:.0f}s.")
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+def get_circuit_breaker(name: str, **kwargs) -> CircuitBreaker:
+    """The shared breaker of a Tally endpoint (e.g. "Tally ODBC (DSN)"), created on first use."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name, **kwargs)
+        return breaker
+
+def circuit_breakers() -> list[CircuitBreaker]:
+    """Every breaker created so far."""
+    with _breakers_lock:
+        return list(_breakers.values())
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Bounded retries with exponential backoff: attempt n waits base_delay * 2**(n-1) seconds
+    (at most max_delay), reduced by up to `jitter` of itself at random so callers failing together
+    don't retry in lockstep."""
+    max_attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 8.0
+    jitter: float = 0.5
+
+    def delay(self, attempt: int) -> float:
+        """Seconds to wait after failed attempt number `attempt` (1-based)."""
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        return delay * (1 - random.uniform(0, self.jitter))
+
+    def call(self, fn, *args, description: str = "Tally call", breaker: CircuitBreaker | None = None,
+             bypass_breaker: bool = False, on_retry=None, is_retryable=is_transient_error, **kwargs):
+        """Returns fn(*args, **kwargs), retrying transient failures; re-raises the last error.
+
+        With breaker, every attempt is reported to it and none is made while it is open (raises
+        CircuitOpenError) - unless bypass_breaker, for explicit user checks. on_retry(error, attempt)
+        runs before each retry, e.g. to drop a broken connection.
+        """
+        attempt = 0
+        while True:
+            attempt += 1
+            if breaker is not None and not bypass_breaker:
+                breaker.before_call()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                transient = is_retryable(e)
+                if breaker is not None and transient:
+                    breaker.record_failure()
+                elif breaker is not None:
+                    breaker.record_success() # A non-transient error still means Tally answered
+                if not transient or attempt >= self.max_attempts:
+                    raise
+                if breaker is not None and breaker.state == CircuitBreaker.OPEN and not bypass_breaker:
+                    raise
+                delay = self.delay(attempt)
+                logger.warning(f"{description} failed ({e}); retry {attempt}/{self.max_attempts - 1} in {delay:.1f}s.")
+                if on_retry is not None:
+                    on_retry(e, attempt)
+                time.sleep(delay)
+                continue
+            if breaker is not None:
+                breaker.record_success()
+            return result
+
+# Policies for Tally: ODBC queries (a sync can afford to wait) and HTTP requests (the UI waits on them)
+ODBC_RETRY = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=8.0)
+HTTP_RETRY = RetryPolicy(max_attempts=3, base_delay=0.5, max_delay=4.0)
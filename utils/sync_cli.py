@@ -0,0 +1,153 @@
+"""
+Headless sync runner for TallyPrimeConnect (no Tkinter), e.g. for cron on a server.
+
+Usage (from the project root):
+    python -m utils.sync_cli --all                                  # Sync every active company
+    python -m utils.sync_cli --company 10001 --company 10002        # Sync specific companies
+    python -m utils.sync_cli --all --masters "Ledgers,Stock Items"  # Only some masters (names or table names)
+    python -m utils.sync_cli --all --parallelism 4 --full           # Override the settings file
+    python -m utils.sync_cli --all --no-vouchers                    # Masters only
+    python -m utils.sync_cli --all --no-probe                       # Query every master even if nothing changed
+    python -m utils.sync_cli --list-masters
+    python -m utils.sync_cli --all --schedule --interval 30          # Keep syncing until stopped (Ctrl+C)
+
+Prints a JSON summary to stdout; logs go to stderr. Exit status: 0 when every company synced,
+1 when any sync failed, 2 for usage errors (unknown company or master).
+With --schedule, companies are synced by the background scheduler (utils/sync_scheduler.py) on
+their intervals instead, and each finished sync is printed as one JSON line.
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+
+from utils.database import init_db, close_all_db_connections, set_db_pragma_profile, flush_audit_log, get_added_companies
+from utils.helpers import load_settings
+from utils.sync_engine import MASTERS_TO_SYNC, select_masters, load_sync_options, sync_companies
+from utils.sync_scheduler import SyncScheduler, load_schedule_options, SCHEDULER_DEFAULT_INTERVAL_MINUTES
+
+logger = logging.getLogger("utils.sync_cli")
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m utils.sync_cli", description="Sync Tally companies without the UI")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--all", action="store_true", help="sync every active company")
+    target.add_argument("--company", action="append", metavar="NUMBER", help="Tally company number to sync (repeatable)")
+    target.add_argument("--list-masters", action="store_true", help="print the syncable masters and exit")
+    parser.add_argument("--masters", help="comma-separated masters to sync (default: all)")
+    parser.add_argument("--parallelism", type=int, help="master collections fetched at once (default: settings file)")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--full", dest="incremental", action="store_false", default=None, help="fetch every object")
+    mode.add_argument("--incremental", dest="incremental", action="store_true", help="fetch only objects altered since the last sync")
+    vouchers = parser.add_mutually_exclusive_group()
+    vouchers.add_argument("--vouchers", dest="vouchers", action="store_true", default=None, help="also sync vouchers (month by month)")
+    vouchers.add_argument("--no-vouchers", dest="vouchers", action="store_false", help="sync masters only")
+    parser.add_argument("--no-probe", dest="probe", action="store_false", default=None,
+                        help="skip the change probe: query every master even when the company is unchanged")
+    parser.add_argument("--schedule", action="store_true", help="run the sync scheduler until interrupted")
+    parser.add_argument("--interval", type=float, metavar="MINUTES",
+                        help="with --schedule: minutes between syncs of a company (default: auto_sync_minutes, else 60)")
+    parser.add_argument("--max-concurrent", type=int, help="with --schedule: syncs run at once (default: settings file)")
+    parser.add_argument("--log-level", default="WARNING", help="stderr log level (default WARNING)")
+    parser.add_argument("--indent", type=int, default=2, help="JSON indent (0 for one line)")
+    return parser, parser.parse_args(argv)
+
+def _log_event(event):
+    """Sync engine events: errors go to the log (the JSON summary carries them too)."""
+    if event.get("type") == "error":
+        logger.error(event.get("message", "").replace("\n", " "))
+    elif event.get("type") == "progress":
+        logger.info(event.get("message", ""))
+
+def _print_scheduled_sync(event):
+    """Scheduler events: one JSON line per finished sync."""
+    if event.get("type") != "scheduled_sync":
+        return
+    summary = event.get("summary") or {}
+    print(json.dumps({"company_number": event["company_number"], "company_name": event["company_name"],
+                      "status": event["status"], "error": event["error"], "next_in": event["next_in"],
+                      "seconds": summary.get("seconds"), "rows_fetched": summary.get("rows_fetched"),
+                      "run_id": summary.get("run_id")}, default=str), flush=True)
+
+def run_schedule(args, options, masters, settings):
+    """Runs the sync scheduler until interrupted. Returns the exit status."""
+    schedule = load_schedule_options(settings)
+    interval = args.interval or schedule["interval_minutes"] or SCHEDULER_DEFAULT_INTERVAL_MINUTES
+    scheduler = SyncScheduler(interval, schedule["company_minutes"], args.max_concurrent or schedule["max_concurrent"],
+                              sync_options={**options, "masters": masters}, company_numbers=args.company,
+                              on_event=_print_scheduled_sync)
+    scheduler.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        logger.info("Interrupted; stopping the sync scheduler.")
+    finally:
+        if not scheduler.stop():
+            logger.info("Waiting for running syncs to finish...")
+            scheduler.stop(timeout=None)
+    return 0
+
+def main(argv=None):
+    parser, args = _parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.WARNING), stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    indent = args.indent or None
+
+    if args.list_masters:
+        print(json.dumps([{"name": m['name'], "table": m['table'], "incremental": m['incremental']} for m in MASTERS_TO_SYNC], indent=indent))
+        return 0
+    if args.parallelism is not None and args.parallelism < 1:
+        parser.error("--parallelism must be at least 1")
+    if not args.schedule and (args.interval is not None or args.max_concurrent is not None):
+        parser.error("--interval and --max-concurrent need --schedule")
+    if (args.interval is not None and args.interval <= 0) or (args.max_concurrent is not None and args.max_concurrent < 1):
+        parser.error("--interval must be positive and --max-concurrent at least 1")
+    try:
+        masters = select_masters(args.masters.split(",") if args.masters else None)
+    except ValueError as e:
+        parser.error(str(e))
+
+    settings = load_settings()
+    options = load_sync_options(settings)
+    for option in ("incremental", "parallelism", "vouchers", "probe"):
+        if getattr(args, option) is not None:
+            options[option] = getattr(args, option)
+
+    set_db_pragma_profile(settings.get("db_pragma_profile", "tuned"))
+    init_db()
+    try:
+        companies = get_added_companies()
+        if args.company:
+            by_number = {str(c.get('tally_company_number')): c for c in companies}
+            unknown = [num for num in args.company if num not in by_number]
+            if unknown:
+                parser.error(f"Unknown or inactive company number(s): {', '.join(unknown)}")
+            companies = [by_number[num] for num in dict.fromkeys(args.company)]
+        if args.schedule:
+            return run_schedule(args, options, masters, settings)
+
+        started = time.strftime("%Y-%m-%d %H:%M:%S")
+        start_clock = time.perf_counter()
+        results = sync_companies(companies, masters=masters, on_event=_log_event, **options)
+        ok = all(r["status"] == "Synced" for r in results)
+        print(json.dumps({
+            "started": started,
+            "seconds": round(time.perf_counter() - start_clock, 3),
+            "mode": "incremental" if options["incremental"] else "full",
+            "parallelism": options["parallelism"],
+            "masters": [m['name'] for m in masters],
+            "vouchers": options["vouchers"],
+            "change_probe": options["probe"],
+            "ok": ok,
+            "companies": results,
+        }, indent=indent, default=str))
+        return 0 if ok else 1
+    finally:
+        flush_audit_log()
+        close_all_db_connections()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,696 @@
+"""
+Sync engine for TallyPrimeConnect.
+Fetches company details, master data and vouchers from Tally over ODBC and saves them to the
+local database. Used by the My Companies panel and the headless CLI (utils/sync_cli.py), so this
+module must not import tkinter, PIL or the ui package.
+
+Progress and errors are reported through an optional on_event(dict) callback, using the
+message types the UI's sync queue understands:
+    {"type": "progress", "current": i, "total": n, "message": "..."}
+    {"type": "error", "message": "..."}
+"""
+
+import logging
+import queue
+import time
+import datetime
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.database import (
+    update_company_details, update_company_sync_status, log_change, flush_audit_log,
+    submit_write, clean_orphaned_rows, save_sync_run, get_last_alter_id, set_last_alter_id,
+    MASTER_COLUMNS,
+    save_ledgers, save_stock_items, save_stock_groups, save_units,
+    save_accounting_groups, save_ledgerbillwise, save_costcategory,
+    save_costcenter, save_currency, save_vouchertype,
+    save_stockgroupwithgst, save_stockcategory, save_godown,
+    save_stockitem_gst, save_stockitem_mrp, save_stockitem_bom,
+    save_stockitem_standardcost, save_stockitem_standardprice,
+    save_stockitem_batchdetails, VOUCHER_COLUMNS, save_vouchers, save_voucher_ledger_entries,
+    save_voucher_inventory_entries, save_voucher_bill_allocations, prune_voucher_lines,
+    get_sync_checkpoint, begin_sync_checkpoint, mark_master_done, mark_voucher_page_done, clear_sync_checkpoint,
+)
+from utils.odbc_helper import (
+    fetch_company_details_odbc,
+    fetch_ledgers_odbc, fetch_stock_items_odbc, fetch_stock_groups_odbc,
+    fetch_units_odbc, fetch_accounting_groups_odbc, fetch_ledgerbillwise_odbc,
+    fetch_costcategory_odbc, fetch_costcenter_odbc, fetch_currency_odbc,
+    fetch_vouchertype_odbc, fetch_stockgroupwithgst_odbc, fetch_stockcategory_odbc,
+    fetch_godown_odbc, fetch_stockitem_gst_odbc, fetch_stockitem_mrp_odbc,
+    fetch_stockitem_bom_odbc, fetch_stockitem_standardcost_odbc,
+    fetch_stockitem_standardprice_odbc, fetch_stockitem_batchdetails_odbc,
+    fetch_vouchers_odbc, fetch_voucher_ledger_entries_odbc, fetch_voucher_inventory_entries_odbc,
+    fetch_voucher_bill_allocations_odbc, probe_altered_since_odbc, ODBC_FETCH_CHUNK_SIZE, TallyODBCSession
+)
+from utils.helpers import load_settings
+from utils.sync_timing import SyncTimings, STAGES, current_timings, record_stage, timed_master
+
+logger = logging.getLogger(__name__)
+
+# --- Master Data Sync Definitions ---
+# 'incremental' masters expose $ALTERID, so re-syncs only fetch objects altered since the last sync.
+# 'collection' is the Tally collection the fetch queries (used by the change probe).
+MASTERS_TO_SYNC = [
+    {'name': 'Ledgers', 'fetch': fetch_ledgers_odbc, 'save': save_ledgers, 'table': 'tally_ledgers', 'collection': 'Ledger', 'incremental': True},
+    {'name': 'Stock Items', 'fetch': fetch_stock_items_odbc, 'save': save_stock_items, 'table': 'tally_stock_items', 'collection': 'StockItem', 'incremental': True},
+    {'name': 'Stock Groups', 'fetch': fetch_stock_groups_odbc, 'save': save_stock_groups, 'table': 'tally_stock_groups', 'collection': 'StockGroup', 'incremental': True},
+    {'name': 'Units', 'fetch': fetch_units_odbc, 'save': save_units, 'table': 'tally_units', 'collection': 'Unit', 'incremental': True},
+    {'name': 'Accounting Groups', 'fetch': fetch_accounting_groups_odbc, 'save': save_accounting_groups, 'table': 'tally_accounting_groups', 'collection': 'Group', 'incremental': True},
+    {'name': 'Ledger Billwise', 'fetch': fetch_ledgerbillwise_odbc, 'save': save_ledgerbillwise, 'table': 'tally_ledgerbillwise', 'collection': 'LedgerBillwise', 'incremental': False},
+    {'name': 'Cost Categories', 'fetch': fetch_costcategory_odbc, 'save': save_costcategory, 'table': 'tally_costcategory', 'collection': 'CostCategory', 'incremental': True},
+    {'name': 'Cost Centers', 'fetch': fetch_costcenter_odbc, 'save': save_costcenter, 'table': 'tally_costcenter', 'collection': 'CostCenter', 'incremental': True},
+    {'name': 'Currencies', 'fetch': fetch_currency_odbc, 'save': save_currency, 'table': 'tally_currency', 'collection': 'Currency', 'incremental': True},
+    {'name': 'Voucher Types', 'fetch': fetch_vouchertype_odbc, 'save': save_vouchertype, 'table': 'tally_vouchertype', 'collection': 'VoucherType', 'incremental': True},
+    {'name': 'Stock Groups GST', 'fetch': fetch_stockgroupwithgst_odbc, 'save': save_stockgroupwithgst, 'table': 'tally_stockgroupwithgst', 'collection': 'StockGroupGST', 'incremental': True},
+    {'name': 'Stock Categories', 'fetch': fetch_stockcategory_odbc, 'save': save_stockcategory, 'table': 'tally_stockcategory', 'collection': 'StockCategory', 'incremental': True},
+    {'name': 'Godowns', 'fetch': fetch_godown_odbc, 'save': save_godown, 'table': 'tally_godown', 'collection': 'Godown', 'incremental': True},
+    {'name': 'Stock Item GST', 'fetch': fetch_stockitem_gst_odbc, 'save': save_stockitem_gst, 'table': 'tally_stockitem_gst', 'collection': 'StockItemGST', 'incremental': True},
+    {'name': 'Stock Item MRP', 'fetch': fetch_stockitem_mrp_odbc, 'save': save_stockitem_mrp, 'table': 'tally_stockitem_mrp', 'collection': 'StockItemMRP', 'incremental': True},
+    {'name': 'Stock Item BOM', 'fetch': fetch_stockitem_bom_odbc, 'save': save_stockitem_bom, 'table': 'tally_stockitem_bom', 'collection': 'StockItemBOM', 'incremental': True},
+    {'name': 'Stock Item Cost', 'fetch': fetch_stockitem_standardcost_odbc, 'save': save_stockitem_standardcost, 'table': 'tally_stockitem_standardcost', 'collection': 'StockItemStandardCost', 'incremental': True},
+    {'name': 'Stock Item Price', 'fetch': fetch_stockitem_standardprice_odbc, 'save': save_stockitem_standardprice, 'table': 'tally_stockitem_standardprice', 'collection': 'StockItemStandardPrice', 'incremental': True},
+    {'name': 'Stock Item Batch', 'fetch': fetch_stockitem_batchdetails_odbc, 'save': save_stockitem_batchdetails, 'table': 'tally_stockitem_batchdetails', 'collection': 'StockItemBatchDetails', 'incremental': True},
+]
+
+# --- Voucher Sync Definitions ---
+# Headers first (lines reference them), then the line collections. All are fetched a date page
+# at a time and filtered by the voucher's AlterID, tracked under the tally_vouchers watermark.
+VOUCHERS_TO_SYNC = [
+    {'name': 'Vouchers', 'fetch': fetch_vouchers_odbc, 'save': save_vouchers, 'table': 'tally_vouchers'},
+    {'name': 'Voucher Ledger Entries', 'fetch': fetch_voucher_ledger_entries_odbc, 'save': save_voucher_ledger_entries, 'table': 'tally_voucher_ledger_entries'},
+    {'name': 'Voucher Inventory Entries', 'fetch': fetch_voucher_inventory_entries_odbc, 'save': save_voucher_inventory_entries, 'table': 'tally_voucher_inventory_entries'},
+    {'name': 'Voucher Bill Allocations', 'fetch': fetch_voucher_bill_allocations_odbc, 'save': save_voucher_bill_allocations, 'table': 'tally_voucher_bill_allocations'},
+]
+VOUCHER_FALLBACK_MONTHS = 24 # History paged when the company's books start date is unknown
+VOUCHER_PROBE_SPAN_PAGES = 12 # Pages an incremental voucher sync probes at once before probing them one by one
+SYNC_CHECKPOINT_MAX_AGE = datetime.timedelta(hours=24) # Older checkpoints are discarded instead of resumed
+
+# sync_state rows (next to the per-table watermarks) holding the company AlterID at the start of
+# the last complete sync of all masters / of the vouchers, compared by the change probe.
+MASTERS_BASELINE = 'company:masters'
+VOUCHERS_BASELINE = 'company:vouchers'
+
+SYNC_QUEUE_MAX_CHUNKS = 4 # Chunks a parallel fetch may buffer ahead of the writer, per master
+_END_OF_MASTER = object()
+
+def _now():
+    return datetime.datetime.now().isoformat(sep=' ', timespec='seconds')
+
+def _emit(on_event, event_type: str, **fields):
+    if on_event is None:
+        return
+    try:
+        on_event({"type": event_type, **fields})
+    except Exception as e:
+        logger.warning(f"Sync event callback failed: {e}")
+
+# --- Options ---
+def select_masters(names=None) -> list[dict]:
+    """MASTERS_TO_SYNC entries matching `names` (master names or table names, case-insensitive).
+
+    None selects every master. Raises ValueError for names that match no master.
+    """
+    if not names:
+        return list(MASTERS_TO_SYNC)
+    wanted = {name.strip().lower() for name in names if name and name.strip()}
+    selected = [m for m in MASTERS_TO_SYNC
+                if {m['name'].lower(), m['table'], m['table'].removeprefix('tally_')} & wanted]
+    known = {key for m in selected for key in (m['name'].lower(), m['table'], m['table'].removeprefix('tally_'))}
+    unknown = sorted(wanted - known)
+    if unknown:
+        raise ValueError(f"Unknown master(s): {', '.join(unknown)}")
+    return selected
+
+def load_sync_options(settings: dict | None = None) -> dict:
+    """{"incremental", "parallelism", "vouchers", "probe"} from the settings file (or the given settings dict)."""
+    settings = load_settings() if settings is None else settings
+    try:
+        parallelism = max(1, int(settings.get("sync_parallelism", 1)))
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid sync_parallelism setting: {settings.get('sync_parallelism')!r}. Using 1.")
+        parallelism = 1
+    return {"incremental": bool(settings.get("incremental_sync", True)), "parallelism": parallelism,
+            "vouchers": bool(settings.get("sync_vouchers", True)), "probe": bool(settings.get("sync_change_probe", True))}
+
+def _parse_tally_date(value) -> datetime.date | None:
+    """Parses a date as stored from Tally (date, 'YYYY-MM-DD', 'YYYYMMDD' or '1-Apr-2024'); None if it can't."""
+    if isinstance(value, datetime.date):
+        return value
+    for fmt in ("%Y-%m-%d", "%Y%m%d", "%d-%b-%Y", "%d-%b-%y"):
+        try:
+            return datetime.datetime.strptime(str(value).strip()[:10], fmt).date()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def month_pages(start: datetime.date, end: datetime.date) -> list[tuple[datetime.date, datetime.date]]:
+    """Calendar-month (from, to) date ranges covering start..end, both inclusive."""
+    pages = []
+    page_start = start
+    while page_start <= end:
+        next_month = (page_start.replace(day=1) + datetime.timedelta(days=32)).replace(day=1)
+        pages.append((page_start, min(end, next_month - datetime.timedelta(days=1))))
+        page_start = next_month
+    return pages
+
+# --- Master fetch plumbing ---
+def _fetch_master_chunks(master: dict, since_alter_id: int | None, session: TallyODBCSession | None = None):
+    """Starts the streamed ODBC fetch of one master and returns its generator of column-ordered tuple chunks."""
+    columns = MASTER_COLUMNS[master['table']]
+    if master['incremental']:
+        return master['fetch'](since_alter_id=since_alter_id, chunk_size=ODBC_FETCH_CHUNK_SIZE, session=session, columns=columns)
+    return master['fetch'](chunk_size=ODBC_FETCH_CHUNK_SIZE, session=session, columns=columns)
+
+def _fetch_master_to_queue(master: dict, since_alter_id: int | None, chunk_queue: queue.Queue,
+                           timings: SyncTimings | None = None):
+    """Pool task: fetches one master over its own ODBC connection, handing chunks to the writer."""
+    try:
+        with timings.activate(master['name']) if timings else nullcontext(), TallyODBCSession() as session:
+            for chunk in _fetch_master_chunks(master, since_alter_id, session):
+                chunk_queue.put(chunk)
+    except Exception as e:
+        chunk_queue.put(e)
+        return
+    chunk_queue.put(_END_OF_MASTER)
+
+def _iter_queued_chunks(chunk_queue: queue.Queue):
+    """Writer side of _fetch_master_to_queue: yields chunks and re-raises the fetch's error."""
+    finished = False
+    try:
+        while True:
+            item = chunk_queue.get()
+            if item is _END_OF_MASTER:
+                finished = True
+                return
+            if isinstance(item, Exception):
+                finished = True
+                raise item
+            yield item
+    finally:
+        while not finished: # Writer stopped early: drain so the fetch thread isn't left blocked
+            item = chunk_queue.get()
+            finished = item is _END_OF_MASTER or isinstance(item, Exception)
+
+# --- Sync ---
+def _write(master_name: str, fn, *args):
+    """Runs fn(*args) as one job on the DB writer (inline without one) and returns its result.
+
+    Writes never share a unit of work with ODBC I/O, so UI writes queued behind a sync only wait
+    for the chunk being saved, not for Tally. Stages the job records are timed against
+    master_name; the wait for its commit (queue time included) counts as "commit".
+    """
+    timings = current_timings()
+    job_seconds = 0.0
+    def job():
+        nonlocal job_seconds
+        started = time.perf_counter()
+        try:
+            with timings.activate(master_name) if timings else nullcontext():
+                return fn(*args)
+        finally:
+            job_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    try:
+        return submit_write(job).result()
+    finally:
+        with timed_master(master_name):
+            record_stage("commit", max(0.0, time.perf_counter() - started - job_seconds))
+
+def _finish_master(company_number: str, table: str, max_alter_id, checkpoint: bool):
+    """Writer job ending a master: advances its watermark and checkpoints it in one commit."""
+    if max_alter_id is not None:
+        set_last_alter_id(company_number, table, max_alter_id)
+    if checkpoint:
+        mark_master_done(company_number, table)
+
+def save_master_chunks(company_number: str, master: dict, since_alter_id: int | None, open_chunks,
+                       checkpoint: bool = False) -> dict:
+    """Saves one master's chunks (from open_chunks()) and advances its AlterID watermark.
+
+    Each chunk is saved by its own DB writer job as it streams in, so the writer is never held
+    while Tally is being read. The watermark (and, with checkpoint, the master's entry in the
+    company's sync checkpoint) is only written once every chunk has been saved, so an interrupted
+    fetch is fully retried next time; re-saving its chunks is an idempotent upsert.
+    Returns {"fetched", "inserted", "updated", "unchanged", "error"} for the master.
+    """
+    name = master['name']
+    result = {"fetched": 0, "inserted": 0, "updated": 0, "unchanged": 0, "error": None}
+    with timed_master(name): # Stages timed on this thread count against this master
+        chunks = None
+        try:
+            logger.info(f"Fetching {name}{f' (AlterID > {since_alter_id})' if since_alter_id is not None else ''}...")
+            chunks = open_chunks()
+            max_alter_id = None; all_saved = True
+            columns = MASTER_COLUMNS[master['table']]
+            alter_index = columns.index('alter_id') if 'alter_id' in columns else None
+            for chunk in chunks:
+                result["fetched"] += len(chunk)
+                saved = _write(name, master['save'], chunk, company_number)
+                if saved.failed: # Rows skipped for lacking their key don't hold back the watermark
+                    all_saved = False
+                else:
+                    result["inserted"] += saved.inserted; result["updated"] += saved.updated; result["unchanged"] += saved.unchanged
+                if alter_index is None:
+                    continue
+                chunk_max = max((row[alter_index] for row in chunk if row[alter_index] is not None), default=None)
+                if chunk_max is not None and (max_alter_id is None or chunk_max > max_alter_id):
+                    max_alter_id = chunk_max
+            if all_saved and (max_alter_id is not None or checkpoint):
+                _write(name, _finish_master, company_number, master['table'], max_alter_id, checkpoint)
+            if not all_saved:
+                result["error"] = "Some chunks failed to save"
+            if result["fetched"]:
+                logger.info(f"Fetched {result['fetched']} records for {name}: {result['inserted']} inserted, "
+                            f"{result['updated']} updated, {result['unchanged']} unchanged.")
+            else:
+                logger.info(f"No new or changed records for {name}.")
+        except Exception as e:
+            logger.exception(f"Error syncing {name}: {e}")
+            result["error"] = str(e)
+        finally:
+            if chunks is not None:
+                chunks.close() # Stops the fetch early (closes the cursor / unblocks the pool thread)
+    return result
+
+def fetch_and_save_master_data(company_number: str, company_name: str, incremental: bool = True,
+                               session: TallyODBCSession | None = None, parallelism: int = 1,
+                               masters: list[dict] | None = None, checkpoint: bool = False) -> dict:
+    """Fetches and saves master data for the company. Returns {master name: save_master_chunks() result}.
+
+    `masters` defaults to every entry of MASTERS_TO_SYNC. All masters are fetched over `session`
+    when given (one ODBC connection per sync). With parallelism > 1, a pool of that many threads
+    fetches collections concurrently, each over its own ODBC connection, while this thread stays
+    the only writer and saves them in `masters` order.
+
+    In incremental mode, masters that carry AlterIDs only fetch objects altered since the
+    last synced AlterID for this company; the first sync of a master is always full.
+    Incremental syncs don't see masters deleted in Tally - turn it off for a full refresh.
+    With checkpoint, each saved master is recorded in the company's sync checkpoint.
+    """
+    masters = MASTERS_TO_SYNC if masters is None else masters
+    mode = 'incremental' if incremental else 'full'
+    logger.info(f"Fetching additional data for {company_name} ({mode}, parallelism {parallelism})...")
+
+    results = {}
+    plan = []
+    for master in masters:
+        try:
+            since_alter_id = None
+            if incremental and master['incremental']:
+                since_alter_id = get_last_alter_id(company_number, master['table'])
+            plan.append((master, since_alter_id))
+        except Exception as e:
+            logger.exception(f"Error preparing sync of {master['name']}: {e}")
+            results[master['name']] = {"fetched": 0, "inserted": 0, "updated": 0, "unchanged": 0, "error": str(e)}
+
+    if parallelism <= 1:
+        for master, since_alter_id in plan:
+            results[master['name']] = save_master_chunks(company_number, master, since_alter_id,
+                                                         lambda m=master, a=since_alter_id: _fetch_master_chunks(m, a, session),
+                                                         checkpoint=checkpoint)
+        return results
+
+    with ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix="odbc-fetch") as pool:
+        # Submission order == write order, so the master being written has always been started
+        # and a pool thread blocked on a full queue can never starve it.
+        queues = []
+        for master, since_alter_id in plan:
+            chunk_queue = queue.Queue(maxsize=SYNC_QUEUE_MAX_CHUNKS)
+            pool.submit(_fetch_master_to_queue, master, since_alter_id, chunk_queue, current_timings())
+            queues.append(chunk_queue)
+        for (master, since_alter_id), chunk_queue in zip(plan, queues):
+            results[master['name']] = save_master_chunks(company_number, master, since_alter_id,
+                                                         lambda q=chunk_queue: _iter_queued_chunks(q),
+                                                         checkpoint=checkpoint)
+    return results
+
+def _finish_voucher_page(company_number: str, page_from: datetime.date, page_to: datetime.date,
+                         last_lines: dict, max_alter_id, checkpoint: bool):
+    """Writer job ending a voucher page: prunes stale lines and checkpoints the page in one commit."""
+    for entry in VOUCHERS_TO_SYNC:
+        if entry['table'] in last_lines and prune_voucher_lines(entry['table'], company_number, last_lines[entry['table']]) is None:
+            raise RuntimeError(f"Pruning {entry['name']} {page_from}..{page_to} failed")
+    if checkpoint and mark_voucher_page_done(company_number, page_from, max_alter_id) is None:
+        raise RuntimeError(f"Recording voucher page {page_from}..{page_to} in the sync checkpoint failed")
+
+def _save_voucher_page(company_number: str, page_from: datetime.date, page_to: datetime.date,
+                       since_alter_id: int | None, session: TallyODBCSession | None, totals: dict,
+                       checkpoint: bool = False) -> int | None:
+    """Fetches and saves one date page of vouchers and their lines.
+
+    Each collection streams chunk by chunk into SQLite, one DB writer job per chunk. Once every
+    collection has been saved, one last job prunes lines of the page's vouchers beyond the last
+    line fetched (so lines deleted from an altered voucher don't linger) and, with checkpoint,
+    records the page as done. Returns the page's highest voucher AlterID. Raises on fetch or save
+    errors; the page is then neither pruned nor checkpointed, so the next sync fetches it again.
+    """
+    max_alter_id = None
+    page_vouchers = {} # GUIDs of the page's vouchers
+    last_lines = {} # Line table -> {voucher GUID: last line number}
+    for entry in VOUCHERS_TO_SYNC:
+        table = entry['table']
+        columns = VOUCHER_COLUMNS[table]
+        is_header = table == 'tally_vouchers'
+        if not is_header:
+            last_lines[table] = {guid: 0 for guid in page_vouchers}
+        counts = totals.setdefault(entry['name'], {"fetched": 0, "inserted": 0, "updated": 0, "unchanged": 0, "error": None})
+        with timed_master(entry['name']):
+            chunks = entry['fetch'](page_from, page_to, since_alter_id=since_alter_id, chunk_size=ODBC_FETCH_CHUNK_SIZE,
+                                    session=session, columns=columns)
+            try:
+                for chunk in chunks:
+                    counts["fetched"] += len(chunk)
+                    saved = _write(entry['name'], entry['save'], chunk, company_number)
+                    if saved.failed:
+                        raise RuntimeError(f"Saving {entry['name']} {page_from}..{page_to} failed")
+                    counts["inserted"] += saved.inserted; counts["updated"] += saved.updated; counts["unchanged"] += saved.unchanged
+                    if is_header:
+                        alter_index = columns.index('alter_id')
+                        for row in chunk:
+                            page_vouchers[row[0]] = 0
+                            if row[alter_index] is not None and (max_alter_id is None or row[alter_index] > max_alter_id):
+                                max_alter_id = row[alter_index]
+                    else:
+                        line_index = columns.index('line_no')
+                        table_lines = last_lines[table]
+                        for row in chunk:
+                            if row[0] in table_lines and (row[line_index] or 0) > table_lines[row[0]]:
+                                table_lines[row[0]] = row[line_index]
+            finally:
+                chunks.close()
+    _write('Vouchers', _finish_voucher_page, company_number, page_from, page_to, last_lines, max_alter_id, checkpoint)
+    return max_alter_id
+
+def _altered_voucher_pages(pages: list, since_alter_id: int, session: TallyODBCSession | None = None) -> list[bool]:
+    """Whether each date page may hold vouchers altered after since_alter_id (incremental sync).
+
+    Pages are probed VOUCHER_PROBE_SPAN_PAGES at a time, one single-row query per span; only a
+    span with altered vouchers is probed page by page. Pages whose probe fails count as altered.
+    """
+    def probe(first, last):
+        try:
+            with timed_master('Vouchers'):
+                return probe_altered_since_odbc('Voucher', since_alter_id, session=session,
+                                                date_range=(pages[first][0], pages[last][1]))
+        except Exception as e:
+            logger.warning(f"Voucher change probe of {pages[first][0]}..{pages[last][1]} failed ({e}); fetching those pages.")
+            return None
+
+    altered = [False] * len(pages)
+    for start in range(0, len(pages), VOUCHER_PROBE_SPAN_PAGES):
+        end = min(start + VOUCHER_PROBE_SPAN_PAGES, len(pages)) - 1
+        span_altered = probe(start, end)
+        if span_altered is False:
+            continue
+        for i in range(start, end + 1):
+            # A failed span probe likely means Tally is unreachable; don't probe its pages one by one
+            altered[i] = True if span_altered is None or start == end else probe(i, i) is not False
+    return altered
+
+def sync_vouchers(company_number: str, books_from=None, incremental: bool = True,
+                  session: TallyODBCSession | None = None, today: datetime.date | None = None,
+                  checkpoint: dict | None = None, alter_id_cap: int | None = None) -> dict:
+    """Syncs vouchers and their lines for the company, month by month from books_from to today.
+
+    Each month is its own query per collection (so none runs into the ODBC query timeout),
+    streamed into SQLite as it arrives. In incremental mode only vouchers with
+    an AlterID above the tally_vouchers watermark are fetched, and only from pages the change probe
+    (_altered_voucher_pages) finds altered vouchers in; the watermark only moves once every
+    page has been saved, and never past alter_id_cap (the company AlterID when the sync started),
+    so vouchers altered while pages were being fetched are picked up by the next sync.
+    With a checkpoint (see get_sync_checkpoint), pages it lists as done are skipped and each
+    saved page is added to it. Stops at the first failing page.
+    Returns {"pages", "pages_done", "pages_skipped", "pages_unchanged", "error", "collections": {name: counts}}.
+    """
+    today = today or datetime.date.today()
+    start = _parse_tally_date(books_from)
+    if start is None or start > today:
+        fallback = (today.replace(day=1) - datetime.timedelta(days=31 * (VOUCHER_FALLBACK_MONTHS - 1))).replace(day=1)
+        logger.warning(f"Books start date {books_from!r} of {company_number} unusable; syncing vouchers from {fallback}.")
+        start = fallback
+    pages = month_pages(start, today)
+    since_alter_id = get_last_alter_id(company_number, 'tally_vouchers') if incremental else None
+    pages_done = checkpoint["voucher_pages_done"] if checkpoint else set()
+    summary = {"pages": len(pages), "pages_done": 0, "pages_skipped": 0, "pages_unchanged": 0, "error": None, "collections": {}}
+    logger.info(f"Syncing vouchers of {company_number}: {len(pages)} monthly pages from {start}"
+                f"{f' (AlterID > {since_alter_id})' if since_alter_id is not None else ''}...")
+
+    altered = _altered_voucher_pages(pages, since_alter_id, session) if since_alter_id is not None else None
+    max_alter_id = checkpoint.get("voucher_max_alter_id") if checkpoint else None
+    for i, (page_from, page_to) in enumerate(pages):
+        # The current month is never skipped: it may have grown since the checkpointed run
+        if page_from.isoformat() in pages_done and i < len(pages) - 1:
+            summary["pages_skipped"] += 1
+            continue
+        if altered is not None and not altered[i]:
+            summary["pages_unchanged"] += 1
+            continue
+        try:
+            page_max = _save_voucher_page(company_number, page_from, page_to, since_alter_id, session,
+                                          summary["collections"], checkpoint=checkpoint is not None)
+        except Exception as e:
+            logger.exception(f"Voucher sync of {company_number} failed at {page_from}..{page_to}: {e}")
+            summary["error"] = f"{page_from}..{page_to}: {e}"
+            return summary
+        summary["pages_done"] += 1
+        if page_max is not None and (max_alter_id is None or page_max > max_alter_id):
+            max_alter_id = page_max
+    if max_alter_id is not None and alter_id_cap:
+        max_alter_id = min(max_alter_id, int(alter_id_cap))
+    if max_alter_id is not None:
+        set_last_alter_id(company_number, 'tally_vouchers', max_alter_id)
+    fetched = summary["collections"].get('Vouchers', {}).get("fetched", 0)
+    logger.info(f"Voucher sync of {company_number} done: {fetched} vouchers in {len(pages)} pages "
+                f"({summary['pages_skipped']} already saved by an interrupted sync, {summary['pages_unchanged']} unchanged).")
+    return summary
+
+def record_sync_run(company_number: str, started: str, total_seconds: float, success: bool,
+                    timings: SyncTimings, incremental: bool, parallelism: int):
+    """Persists one company sync to sync_runs/sync_stage_timings and logs where the time went. Returns the run id or None."""
+    rows_fetched = timings.total("fetch")[1]
+    stage_summary = ", ".join(f"{stage} {timings.total(stage)[0]:.2f}s" for stage in STAGES)
+    logger.info(f"Sync of {company_number} took {total_seconds:.2f}s ({rows_fetched} rows): {stage_summary}")
+    try:
+        return save_sync_run(company_number, started, _now(), 'Synced' if success else 'Sync Failed',
+                             total_seconds, timings.rows(), mode='incremental' if incremental else 'full',
+                             parallelism=parallelism, rows_fetched=rows_fetched)
+    except Exception as e:
+        logger.exception(f"Failed to record sync run for {company_number}: {e}")
+        return None
+
+def _open_checkpoint(company_number: str, mode: str, company_alter_id) -> tuple[dict, bool]:
+    """Returns (checkpoint, resumed): the company's checkpoint to resume, or a fresh one.
+
+    A checkpoint is only resumed by a sync in the same mode, and only while it is recent
+    (SYNC_CHECKPOINT_MAX_AGE); otherwise the sync starts over.
+    """
+    checkpoint = get_sync_checkpoint(company_number)
+    if checkpoint:
+        started = datetime.datetime.fromisoformat(checkpoint['started_timestamp'])
+        if checkpoint['mode'] == mode and datetime.datetime.now() - started <= SYNC_CHECKPOINT_MAX_AGE:
+            return checkpoint, True
+        logger.info(f"Discarding sync checkpoint of {company_number} from {checkpoint['started_timestamp']} "
+                    f"({checkpoint['mode']}); starting over.")
+    checkpoint = begin_sync_checkpoint(company_number, mode, company_alter_id)
+    if checkpoint is None:
+        raise RuntimeError(f"Opening the sync checkpoint of {company_number} failed")
+    return checkpoint, False
+
+def probe_company_changes(company_number: str, company_alter_id, masters: list[dict] | None = None,
+                          vouchers: bool = False, session: TallyODBCSession | None = None) -> dict:
+    """Cheap "has anything changed?" check before pulling a company's collections.
+
+    Tally numbers AlterIDs company-wide, so while the company's last AlterID (from its details)
+    equals the one recorded at the start of the last complete sync, nothing has been added or
+    altered since and nothing needs fetching. Otherwise each incremental master with a watermark
+    is asked for one object altered past it; masters without AlterIDs or a watermark, and any
+    whose probe fails, are refreshed. Vouchers are refreshed whenever the company AlterID moved.
+    Returns {"changed", "reason", "masters" (names to refresh), "unchanged" (names), "vouchers"}.
+    """
+    masters = MASTERS_TO_SYNC if masters is None else masters
+    alter_id = int(company_alter_id) if company_alter_id is not None else None
+    masters_baseline = get_last_alter_id(company_number, MASTERS_BASELINE)
+    result = {"changed": True, "reason": None, "masters": [], "unchanged": [],
+              "vouchers": bool(vouchers) and (alter_id is None or get_last_alter_id(company_number, VOUCHERS_BASELINE) != alter_id)}
+
+    if alter_id is None:
+        result["reason"] = "company AlterID unknown"
+        result["masters"] = [m['name'] for m in masters]
+    elif masters_baseline == alter_id:
+        result["reason"] = f"masters unchanged since last sync (AlterID {alter_id})"
+        result["unchanged"] = [m['name'] for m in masters]
+    else:
+        result["reason"] = f"AlterID {masters_baseline if masters_baseline is not None else 'never synced'} -> {alter_id}"
+        for master in masters:
+            watermark = get_last_alter_id(company_number, master['table']) if master['incremental'] else None
+            altered = True
+            if watermark is not None:
+                try:
+                    with timed_master(master['name']):
+                        altered = probe_altered_since_odbc(master['collection'], watermark, session=session)
+                except Exception as e:
+                    logger.warning(f"Change probe of {master['name']} failed ({e}); refreshing it.")
+            result["masters" if altered else "unchanged"].append(master['name'])
+    result["changed"] = bool(result["masters"]) or result["vouchers"]
+    logger.info(f"Change probe of {company_number}: {result['reason']}; "
+                f"{len(result['masters'])} masters to refresh{', vouchers' if result['vouchers'] else ''}.")
+    return result
+
+def sync_company(company_number: str, company_name: str, incremental: bool = True, parallelism: int = 1,
+                 masters: list[dict] | None = None, vouchers: bool = False, probe: bool = False,
+                 on_event=None) -> dict:
+    """Syncs one company: details, then master data, then (with vouchers) its vouchers page by
+    page (see sync_vouchers).
+
+    With probe, an incremental sync first checks what changed since the last complete sync (see
+    probe_company_changes) and only fetches those masters, skipping idle companies altogether.
+
+    A company sync is not one atomic unit of work: each master and voucher page is saved chunk by
+    chunk as it streams in (see save_master_chunks), and a master or page that fails halfway keeps
+    the chunks already saved. Its watermark doesn't move and it isn't checkpointed, so the next
+    sync fetches it again in full. Finished masters and pages are recorded in the company's sync
+    checkpoint, so a sync interrupted by a crash or a dropped connection resumes from there; a
+    sync that finishes cleanly discards the checkpoint. The company is only marked 'Synced' (and
+    the run recorded as such) once every master and voucher page has been saved.
+
+    Returns a summary dict: company_number, company_name, status ('Synced'/'Sync Failed'),
+    error, started, seconds, rows_fetched, run_id, per-master results under "masters", masters
+    skipped as already saved under "masters_skipped", "resumed_from" (the resumed checkpoint's
+    start time or None), the sync_vouchers() result under "vouchers" (None when not synced) and
+    the probe_company_changes() result under "probe" (None when not probed).
+    """
+    num, name = company_number, company_name
+    summary = {"company_number": num, "company_name": name, "status": "Sync Failed", "error": None,
+               "started": _now(), "seconds": 0.0, "rows_fetched": 0, "run_id": None, "masters": {},
+               "masters_skipped": [], "resumed_from": None, "vouchers": None, "probe": None}
+    mode = 'incremental' if incremental else 'full'
+
+    # One ODBC connection per company, shared by the details fetch and every master fetch
+    session = TallyODBCSession()
+    timings = SyncTimings()
+    start_clock = time.perf_counter()
+    success = False
+    with timings.activate():
+        try:
+            logger.debug(f"Calling ODBC fetch for company details. Ensure '{name}' is loaded.")
+            details = fetch_company_details_odbc(num, session=session)
+
+            if details:
+                fetched_name = details.get('tally_company_name')
+                if fetched_name and fetched_name.lower() != name.lower():
+                    logger.error(f"ODBC Mismatch! Expected '{name}', got '{fetched_name}'.")
+                    update_company_sync_status(num, 'Sync Failed')
+                    log_change(num, "SYNC_FAIL", f"Mismatch: Got '{fetched_name}'")
+                    summary["error"] = f"Wrong company ('{fetched_name}') active in Tally."
+                    _emit(on_event, "error", message=f"Sync Failed: Wrong company ('{fetched_name}') active in Tally.")
+                else:
+                    success = update_company_details(num, details)
+                    if not success:
+                        log_change(num, "SYNC_FAIL", "DB update failed after ODBC fetch")
+                        summary["error"] = "Database update of company details failed."
+
+            if success:
+                checkpoint, resumed = _open_checkpoint(num, mode, details.get('alter_id'))
+                pending = MASTERS_TO_SYNC if masters is None else masters
+                if resumed:
+                    summary["resumed_from"] = checkpoint['started_timestamp']
+                    summary["masters_skipped"] = [m['name'] for m in pending if m['table'] in checkpoint['masters_done']]
+                    pending = [m for m in pending if m['table'] not in checkpoint['masters_done']]
+                    logger.info(f"Resuming sync of {num} from checkpoint {checkpoint['started_timestamp']}: "
+                                f"{len(summary['masters_skipped'])} masters and "
+                                f"{len(checkpoint['voucher_pages_done'])} voucher pages already saved.")
+                elif probe and incremental:
+                    summary["probe"] = probe_company_changes(num, checkpoint.get('company_alter_id'), pending,
+                                                             vouchers=vouchers, session=session)
+                    pending = [m for m in pending if m['name'] in summary["probe"]["masters"]]
+                summary["masters"] = fetch_and_save_master_data(num, name, incremental=incremental, session=session,
+                                                                parallelism=parallelism, masters=pending, checkpoint=True)
+
+                # Vouchers come after the masters they reference. A failing master or page doesn't stop
+                # the others, but leaves the company 'Sync Failed' until a sync completes.
+                if vouchers and (summary["probe"] is None or summary["probe"]["vouchers"]):
+                    summary["vouchers"] = sync_vouchers(num, details.get('books_date') or details.get('start_date'),
+                                                        incremental=incremental, session=session, checkpoint=checkpoint,
+                                                        alter_id_cap=checkpoint.get('company_alter_id'))
+                complete = (not any(r["error"] for r in summary["masters"].values())
+                            and not (summary["vouchers"] and summary["vouchers"]["error"]))
+                if complete:
+                    clear_sync_checkpoint(num)
+                    # Everything up to the AlterID at the (first) start of this sync is now saved
+                    baseline = checkpoint.get('company_alter_id')
+                    if baseline is not None:
+                        # Only a sync of every master (whether passed as None or listed) vouches for all of them
+                        if {m['table'] for m in MASTERS_TO_SYNC} <= {m['table'] for m in (MASTERS_TO_SYNC if masters is None else masters)}:
+                            set_last_alter_id(num, MASTERS_BASELINE, baseline)
+                        if summary["vouchers"] is not None:
+                            set_last_alter_id(num, VOUCHERS_BASELINE, baseline)
+                else:
+                    logger.warning(f"Sync of {num} incomplete; the next sync resumes from its checkpoint.")
+                    log_change(num, "SYNC_FAIL", "Some masters or voucher pages failed")
+                    summary["error"] = "Some masters or voucher pages failed to sync; the next sync resumes from there."
+                success = complete
+                update_company_sync_status(num, 'Synced' if complete else 'Sync Failed')
+            else:
+                logger.warning(f"ODBC fetch failed/no data for {num}.")
+                update_company_sync_status(num, 'Sync Failed')
+                summary["error"] = summary["error"] or "Could not fetch ODBC details (Tally running? Company open?)"
+                _emit(on_event, "error", message="Sync Failed: Could not fetch ODBC details.\n(Tally running? Company open?)")
+
+            logger.info(f"Sync result {num} (ODBC): {'Success' if success else 'Failed'}")
+
+        except Exception as e:
+            success = False
+            logger.exception(f"Error syncing {name} via ODBC: {e}")
+            try:
+                update_company_sync_status(num, 'Sync Failed')
+                log_change(num, "SYNC_FAIL", f"Error: {e}")
+            except Exception as ie:
+                logger.error(f"Failed to mark {num} as failed: {ie}")
+            summary["error"] = str(e)
+            _emit(on_event, "error", message=f"Error syncing {name}:\n{e}")
+        finally:
+            session.close()
+            flush_audit_log() # This company's audit rows, written once its sync has ended
+
+    total_seconds = time.perf_counter() - start_clock
+    summary.update(status='Synced' if success else 'Sync Failed', seconds=round(total_seconds, 3),
+                   rows_fetched=timings.total("fetch")[1])
+    summary["run_id"] = record_sync_run(num, summary["started"], total_seconds, success, timings, incremental, parallelism)
+    return summary
+
+def sync_companies(companies: list[dict], incremental: bool | None = None, parallelism: int | None = None,
+                   masters: list[dict] | None = None, vouchers: bool | None = None, probe: bool | None = None,
+                   on_event=None) -> list[dict]:
+    """Syncs each company dict (tally_company_number, tally_company_name) in turn; returns their summaries.
+
+    incremental/parallelism/vouchers/probe default to the settings file. Runs the deferred orphan
+    cleanup once at the end.
+    """
+    if None in (incremental, parallelism, vouchers, probe):
+        defaults = load_sync_options()
+        incremental = defaults["incremental"] if incremental is None else incremental
+        parallelism = defaults["parallelism"] if parallelism is None else max(1, int(parallelism))
+        vouchers = defaults["vouchers"] if vouchers is None else vouchers
+        probe = defaults["probe"] if probe is None else probe
+
+    total_companies = len(companies)
+    logger.info(f"ODBC Sync started for {total_companies} companies.")
+    summaries = []
+    for i, company in enumerate(companies):
+        num = company.get('tally_company_number')
+        name = company.get('tally_company_name')
+        if not num or not name:
+            logger.warning(f"Skipping in ODBC sync: {company}")
+            continue
+        logger.info(f"Processing {i+1}/{total_companies}: {name} ({num})")
+        _emit(on_event, "progress", current=i + 1, total=total_companies, message=f"Syncing: {name}...")
+        summaries.append(sync_company(num, name, incremental=incremental, parallelism=parallelism,
+                                      masters=masters, vouchers=vouchers, probe=probe, on_event=on_event))
+
+    try:
+        clean_orphaned_rows() # Deferred maintenance: only rows touched since the last cleanup
+    except Exception as e:
+        logger.exception(f"Orphan cleanup after sync failed: {e}")
+    logger.info("ODBC Sync finished.")
+    return summaries
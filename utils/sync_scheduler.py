@@ -0,0 +1,330 @@
+"""
+Background sync scheduler for TallyPrimeConnect.
+Keeps active companies fresh by syncing each one on its own interval, inside the Tk app (app.py)
+or headless (python -m utils.sync_cli --all --schedule). Like the sync engine, this module must not
+import tkinter, PIL or the ui package.
+
+Companies wait in a priority queue keyed by their next due time. Each delay gets a little jitter so
+companies due together drift apart, a failed sync is retried with exponential backoff, and no more
+than max_concurrent syncs (one company each) run at once. The schedule starts from the companies'
+sync_status/last_sync_timestamp columns, which every sync keeps up to date.
+
+Results are reported through an optional on_event(dict) callback (called on worker threads):
+    {"type": "scheduled_sync_started", "company_number": ..., "company_name": ...}
+    {"type": "scheduled_sync", "company_number": ..., "company_name": ..., "status": ..., "error": ...,
+     "next_in": seconds, "summary": sync_company() summary}
+"""
+
+import heapq
+import logging
+import random
+import threading
+import time
+import datetime
+from dataclasses import dataclass
+
+from utils.database import get_added_companies, clean_orphaned_rows, close_db_connection
+from utils.helpers import load_settings
+from utils.sync_engine import sync_company, load_sync_options
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_DEFAULT_INTERVAL_MINUTES = 60 # Used when auto_sync_minutes is set but unusable
+SCHEDULER_JITTER = 0.1 # Delays vary by up to +/- this fraction
+SCHEDULER_RETRY_SECONDS = 300 # First retry after a failed sync; doubles per further failure
+SCHEDULER_MAX_BACKOFF_SECONDS = 6 * 3600
+SCHEDULER_BLOCKED_RECHECK_SECONDS = 30 # Delay of a due sync while is_blocked() (e.g. a manual sync) holds it back
+SCHEDULER_RELOAD_SECONDS = 300 # Companies added, deleted or edited since are picked up this often
+
+def _minutes(value, setting):
+    try:
+        minutes = float(value)
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid {setting} setting: {value!r}. Using {SCHEDULER_DEFAULT_INTERVAL_MINUTES}.")
+        return SCHEDULER_DEFAULT_INTERVAL_MINUTES
+    return max(0.0, minutes)
+
+def load_schedule_options(settings: dict | None = None) -> dict:
+    """{"interval_minutes", "company_minutes", "max_concurrent"} from the settings file (or the given dict).
+
+    interval_minutes 0 turns the scheduler off. company_minutes maps a company number to its own
+    interval (0 leaves that company out of the schedule).
+    """
+    settings = load_settings() if settings is None else settings
+    company_minutes = settings.get("auto_sync_company_minutes") or {}
+    if not isinstance(company_minutes, dict):
+        logger.warning(f"Invalid auto_sync_company_minutes setting: {company_minutes!r}. Ignoring it.")
+        company_minutes = {}
+    try:
+        max_concurrent = max(1, int(settings.get("auto_sync_max_concurrent", 1)))
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid auto_sync_max_concurrent setting: {settings.get('auto_sync_max_concurrent')!r}. Using 1.")
+        max_concurrent = 1
+    return {"interval_minutes": _minutes(settings.get("auto_sync_minutes", 0), "auto_sync_minutes"),
+            "company_minutes": {str(num): _minutes(minutes, f"auto_sync_company_minutes[{num}]")
+                                for num, minutes in company_minutes.items()},
+            "max_concurrent": max_concurrent}
+
+def _parse_db_timestamp(value) -> datetime.datetime | None:
+    """A SQLite CURRENT_TIMESTAMP value (UTC) as an aware datetime; None if missing or unparseable."""
+    if not value:
+        return None
+    try:
+        return datetime.datetime.fromisoformat(str(value)).replace(tzinfo=datetime.timezone.utc)
+    except ValueError:
+        logger.debug(f"Unparseable last_sync_timestamp: {value!r}")
+        return None
+
+def backoff_seconds(failures: int, interval: float) -> float:
+    """Delay before the next sync of a company after `failures` failed syncs in a row (0: its interval)."""
+    if failures <= 0:
+        return interval
+    return min(SCHEDULER_RETRY_SECONDS * 2 ** (failures - 1), SCHEDULER_MAX_BACKOFF_SECONDS)
+
+def _jittered(seconds: float) -> float:
+    return max(0.0, seconds * (1 + random.uniform(-SCHEDULER_JITTER, SCHEDULER_JITTER)))
+
+@dataclass
+class ScheduledCompany:
+    """Schedule state of one company. due is on the time.monotonic() clock."""
+    number: str
+    name: str
+    interval: float # Seconds
+    due: float
+    failures: int = 0
+    running: bool = False
+
+class SyncScheduler:
+    """Runs company syncs in the background as they fall due. Thread-safe; start() / stop().
+
+    sync_options are keyword arguments for sync_company() (incremental, parallelism, masters,
+    vouchers, probe); options left out are read from the settings file before each sync.
+    company_numbers limits the schedule to those companies. While is_blocked() returns True (e.g. a
+    manual sync is running), due syncs wait.
+    """
+    def __init__(self, interval_minutes: float = SCHEDULER_DEFAULT_INTERVAL_MINUTES, company_minutes: dict | None = None,
+                 max_concurrent: int = 1, sync_options: dict | None = None, company_numbers=None,
+                 on_event=None, is_blocked=None):
+        self.interval = float(interval_minutes) * 60
+        self.company_minutes = {str(num): float(minutes) for num, minutes in (company_minutes or {}).items()}
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.sync_options = dict(sync_options or {})
+        self.company_numbers = {str(num) for num in company_numbers} if company_numbers else None
+        self.on_event = on_event
+        self.is_blocked = is_blocked
+        self._cond = threading.Condition()
+        self._companies = {} # Company number -> ScheduledCompany
+        self._heap = [] # (due, seq, number); stale entries (due no longer matching) are skipped
+        self._seq = 0
+        self._stopping = False
+        self._thread = None
+        self._workers = set()
+        self._next_reload = 0.0
+
+    @classmethod
+    def from_settings(cls, settings: dict | None = None, **kwargs):
+        """A scheduler configured by load_schedule_options(); None when auto sync is turned off."""
+        options = load_schedule_options(settings)
+        if not options["interval_minutes"]:
+            return None
+        return cls(options["interval_minutes"], options["company_minutes"], options["max_concurrent"], **kwargs)
+
+    # --- Queue ---
+    def _push(self, company: ScheduledCompany):
+        self._seq += 1
+        heapq.heappush(self._heap, (company.due, self._seq, company.number))
+
+    def _interval_of(self, number: str) -> float:
+        minutes = self.company_minutes.get(number)
+        return self.interval if minutes is None else minutes * 60
+
+    def _first_due(self, row: dict, interval: float, now: float) -> tuple[float, int]:
+        """(due, failures) of a newly scheduled company, from its last sync in the companies table."""
+        last_sync = _parse_db_timestamp(row.get('last_sync_timestamp'))
+        if last_sync is None:
+            return now, 0
+        failures = 1 if row.get('sync_status') == 'Sync Failed' else 0
+        elapsed = (datetime.datetime.now(datetime.timezone.utc) - last_sync).total_seconds()
+        return now + max(0.0, _jittered(backoff_seconds(failures, interval)) - elapsed), failures
+
+    def reload_companies(self):
+        """Brings the schedule in line with the active companies (new ones are added, deleted ones dropped)."""
+        try:
+            rows = get_added_companies()
+        except Exception as e:
+            logger.exception(f"Sync scheduler could not load companies: {e}")
+            return
+        now = time.monotonic()
+        with self._cond:
+            active = set()
+            for row in rows:
+                number, name = str(row.get('tally_company_number') or ''), row.get('tally_company_name')
+                if not number or not name or (self.company_numbers and number not in self.company_numbers):
+                    continue
+                interval = self._interval_of(number)
+                if interval <= 0:
+                    continue
+                active.add(number)
+                company = self._companies.get(number)
+                if company:
+                    company.name = name
+                    if company.interval != interval and not company.running and not company.failures:
+                        company.due = min(company.due, now + _jittered(interval))
+                        self._push(company)
+                    company.interval = interval
+                    continue
+                due, failures = self._first_due(row, interval, now)
+                company = ScheduledCompany(number, name, interval, due, failures)
+                self._companies[number] = company
+                self._push(company)
+                logger.info(f"Scheduled auto sync of {name} ({number}) every {interval / 60:g} min, "
+                            f"next in {max(0.0, due - now):.0f}s.")
+            for number in set(self._companies) - active:
+                logger.info(f"Removed {number} from the sync schedule.")
+                del self._companies[number] # A running sync finishes; it is not rescheduled
+            self._next_reload = now + SCHEDULER_RELOAD_SECONDS
+            self._cond.notify_all()
+
+    def run_now(self, company_number: str) -> bool:
+        """Makes a scheduled company due immediately. Returns False if unknown or already syncing."""
+        with self._cond:
+            company = self._companies.get(str(company_number))
+            if not company or company.running:
+                return False
+            company.due = time.monotonic()
+            self._push(company)
+            self._cond.notify_all()
+            return True
+
+    def status(self) -> list[dict]:
+        """The schedule ordered by next due time: number, name, interval/due-in seconds, failures, running."""
+        now = time.monotonic()
+        with self._cond:
+            companies = sorted(self._companies.values(), key=lambda c: (not c.running, c.due))
+            return [{"company_number": c.number, "company_name": c.name, "interval": c.interval,
+                     "due_in": 0.0 if c.running else round(max(0.0, c.due - now), 1),
+                     "failures": c.failures, "running": c.running} for c in companies]
+
+    def active_syncs(self) -> int:
+        """Number of scheduled syncs running right now."""
+        with self._cond:
+            return len(self._workers)
+
+    # --- Running ---
+    def start(self):
+        """Starts the scheduler thread (a daemon). Does nothing if it is already running."""
+        with self._cond:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="sync-scheduler", daemon=True)
+            self._thread.start()
+        logger.info(f"Sync scheduler started (every {self.interval / 60:g} min, at most {self.max_concurrent} at once).")
+
+    def stop(self, timeout: float | None = 30.0):
+        """Stops scheduling and waits up to timeout seconds for running syncs to finish.
+        Returns True once none are running; call again to keep waiting."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread, workers = self._thread, list(self._workers)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for t in [thread, *workers]:
+            if t is not None:
+                t.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        still_running = [w.name for w in workers if w.is_alive()]
+        if still_running:
+            logger.warning(f"Sync scheduler stopped with syncs still running: {', '.join(still_running)}")
+        else:
+            logger.info("Sync scheduler stopped.")
+        return not still_running
+
+    def _run(self):
+        try:
+            while True:
+                with self._cond:
+                    if self._stopping:
+                        return
+                    reload_due = time.monotonic() >= self._next_reload
+                if reload_due:
+                    self.reload_companies()
+                with self._cond:
+                    if self._stopping:
+                        return
+                    self._start_due_syncs()
+                    self._cond.wait(self._seconds_to_next_event())
+        finally:
+            close_db_connection() # Release this thread's persistent DB connection
+
+    def _seconds_to_next_event(self) -> float:
+        wait = self._next_reload - time.monotonic()
+        if self._heap and len(self._workers) < self.max_concurrent:
+            wait = min(wait, self._heap[0][0] - time.monotonic())
+        return max(0.05, wait)
+
+    def _start_due_syncs(self):
+        """Pops due companies and starts their syncs while under the concurrency cap. Holds _cond."""
+        now = time.monotonic()
+        while self._heap and self._heap[0][0] <= now and len(self._workers) < self.max_concurrent:
+            due, _, number = heapq.heappop(self._heap)
+            company = self._companies.get(number)
+            if not company or company.running or company.due != due:
+                continue # Removed, already syncing, or rescheduled since this entry was pushed
+            if self.is_blocked and self._blocked():
+                company.due = now + SCHEDULER_BLOCKED_RECHECK_SECONDS
+                self._push(company)
+                logger.debug(f"Auto sync of {number} deferred: another sync is running.")
+                return
+            company.running = True
+            worker = threading.Thread(target=self._sync_worker, args=(company,), name=f"scheduled-sync:{number}", daemon=True)
+            self._workers.add(worker)
+            worker.start()
+
+    def _blocked(self) -> bool:
+        try:
+            return bool(self.is_blocked())
+        except Exception as e:
+            logger.warning(f"Sync scheduler is_blocked() failed: {e}")
+            return False
+
+    def _emit(self, event_type: str, **fields):
+        if self.on_event is None:
+            return
+        try:
+            self.on_event({"type": event_type, **fields})
+        except Exception as e:
+            logger.warning(f"Sync scheduler event callback failed: {e}")
+
+    def _sync_worker(self, company: ScheduledCompany):
+        """Worker thread: syncs one company, then puts it back in the queue."""
+        number, name = company.number, company.name
+        logger.info(f"Auto sync of {name} ({number}) started.")
+        self._emit("scheduled_sync_started", company_number=number, company_name=name)
+        summary = {"status": "Sync Failed", "error": None}
+        try:
+            options = load_sync_options()
+            options.update(self.sync_options)
+            summary = sync_company(number, name, **options)
+            if summary["status"] == 'Synced':
+                clean_orphaned_rows() # Deferred maintenance: only rows touched since the last cleanup
+        except Exception as e:
+            logger.exception(f"Auto sync of {name} ({number}) failed: {e}")
+            summary["error"] = str(e)
+        finally:
+            close_db_connection() # Release this worker thread's persistent DB connection
+
+        success = summary["status"] == 'Synced'
+        with self._cond:
+            self._workers.discard(threading.current_thread())
+            company.running = False
+            company.failures = 0 if success else company.failures + 1
+            delay = _jittered(backoff_seconds(company.failures, company.interval))
+            company.due = time.monotonic() + delay
+            if self._companies.get(number) is company:
+                self._push(company)
+            self._cond.notify_all()
+        error = f" ({summary['error']})" if summary.get("error") else ""
+        (logger.info if success else logger.warning)(
+            f"Auto sync of {name} ({number}): {summary['status']}{error}; next in {delay / 60:.1f} min.")
+        self._emit("scheduled_sync", company_number=number, company_name=name, status=summary["status"],
+                   error=summary.get("error"), next_in=round(delay, 1), summary=summary)
@@ -0,0 +1,84 @@
+"""
+Per-stage sync timing for TallyPrimeConnect.
+A SyncTimings collector is activated on the syncing thread(s); the ODBC helper, bulk save and sync
+worker report connect/execute/fetch/convert/write/commit time into it via record_stage().
+Without an active collector, record_stage() is a single thread-local lookup.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+STAGES = ("connect", "execute", "fetch", "convert", "write", "commit")
+
+_local = threading.local()
+
+class SyncTimings:
+    """Seconds, calls and rows per (master, stage) for one company sync. Thread-safe."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}  # (master, stage) -> [seconds, calls, rows]
+
+    def add(self, master, stage, seconds, rows=0):
+        with self._lock:
+            entry = self._totals.setdefault((master or "", stage), [0.0, 0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+            entry[2] += rows
+
+    @contextmanager
+    def activate(self, master=None):
+        """Makes this the calling thread's collector; stages are attributed to `master` ("" = company level)."""
+        previous = getattr(_local, 'active', None)
+        _local.active = (self, master)
+        try:
+            yield self
+        finally:
+            _local.active = previous
+
+    def rows(self):
+        """[(master, stage, seconds, calls, rows)] sorted by master and pipeline stage order."""
+        with self._lock:
+            items = list(self._totals.items())
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        items.sort(key=lambda item: (item[0][0], order.get(item[0][1], len(order)), item[0][1]))
+        return [(master, stage, seconds, calls, rows) for (master, stage), (seconds, calls, rows) in items]
+
+    def total(self, stage):
+        """(seconds, rows) of one stage summed over all masters."""
+        with self._lock:
+            values = [v for (_, s), v in self._totals.items() if s == stage]
+        return sum(v[0] for v in values), sum(v[2] for v in values)
+
+def current_timings():
+    """The calling thread's active SyncTimings, or None."""
+    active = getattr(_local, 'active', None)
+    return active[0] if active else None
+
+@contextmanager
+def timed_master(master):
+    """Attributes stages recorded on this thread to `master` while the block runs (no-op when not timing)."""
+    timings = current_timings()
+    if timings is None:
+        yield
+        return
+    with timings.activate(master):
+        yield
+
+def record_stage(stage, seconds, rows=0):
+    """Adds time spent in a stage to the calling thread's active collector, if any."""
+    active = getattr(_local, 'active', None)
+    if active is not None:
+        active[0].add(active[1], stage, seconds, rows)
+
+@contextmanager
+def timed_stage(stage):
+    """Times the block as `stage` (no-op when not timing)."""
+    if getattr(_local, 'active', None) is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)